@@ -0,0 +1,159 @@
+"""Apply many use/restock operations with a constant number of round-trips.
+
+A batch costs one ``find`` to resolve every referenced item, one
+``bulk_write`` with one conditional ``$inc`` per item, and one
+``insert_many`` for the usage logs, however many operations it holds.
+
+Operations are validated in order against the stock read by the ``find``.
+Each item's update is guarded on exactly that starting stock, so the
+reported levels, the dashboard counter deltas and the pushed stock events
+are all computed from the value the ``$inc`` actually applied to. Any
+concurrent write to the item in between makes the guard fail and turns
+that item's operations into ``conflict`` results.
+"""
+
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import dashboard_stats
+
+OK = "ok"
+NOT_FOUND = "not_found"
+INSUFFICIENT_STOCK = "insufficient_stock"
+CONFLICT = "conflict"
+
+
+async def _resolve_items(db, operations: List[dict]) -> Dict[str, dict]:
+    ids = sorted({op["item_id"] for op in operations if op.get("item_id")})
+    barcodes = sorted({op["barcode"] for op in operations if op.get("barcode") and not op.get("item_id")})
+    clauses = []
+    if ids:
+        clauses.append({"id": {"$in": ids}})
+    if barcodes:
+        clauses.append({"barcode": {"$in": barcodes}})
+    if not clauses:
+        return {}
+    items = {}
+    async for item in db.inventory.find({"$or": clauses}, {"_id": 0}):
+        items["id:" + item["id"]] = item
+        items["barcode:" + item["barcode"]] = item
+    return items
+
+
+def _start(items: Dict[str, dict], item_id: str) -> int:
+    return items["id:" + item_id].get("current_stock", 0)
+
+
+async def apply_operations(db, operations: List[dict], prepare: Callable[[dict], dict],
+                           now: Optional[datetime] = None) -> dict:
+    """Apply ``operations`` in order and report a result for each one
+
+    Every operation is a dict with ``op`` ("use" or "restock"), ``qty``,
+    and either ``item_id`` or ``barcode``. It may also carry ``notes`` and a
+    ``timestamp`` for the usage log. ``prepare`` converts documents to their
+    storage form (``prepare_for_mongo``).
+    """
+    now = now or datetime.now(timezone.utc)
+    batch_id = str(uuid.uuid4())
+    items = await _resolve_items(db, operations)
+
+    results = []
+    levels: Dict[str, int] = {}       # item id -> simulated stock level
+    used: Dict[str, int] = {}         # item id -> total units used (0 for restock only)
+    pending_logs: Dict[str, list] = {}
+
+    for index, op in enumerate(operations):
+        key = f"id:{op['item_id']}" if op.get("item_id") else f"barcode:{op.get('barcode')}"
+        item = items.get(key)
+        result = {"index": index, "op": op["op"], "qty": op["qty"],
+                  "item_id": op.get("item_id"), "barcode": op.get("barcode")}
+        results.append(result)
+        if item is None:
+            result.update(status=NOT_FOUND, error="Item not found")
+            continue
+
+        item_id = item["id"]
+        result.update(item_id=item_id, barcode=item["barcode"])
+        start = item.get("current_stock", 0)
+        level = levels.get(item_id, start)
+        if op["op"] == "use":
+            if level < op["qty"]:
+                result.update(status=INSUFFICIENT_STOCK, error="Insufficient stock", current_stock=level)
+                continue
+            level -= op["qty"]
+            used[item_id] = used.get(item_id, 0) + op["qty"]
+            pending_logs.setdefault(item_id, []).append((result, {
+                "id": str(uuid.uuid4()),
+                "item_id": item_id,
+                "barcode": item["barcode"],
+                "quantity_used": op["qty"],
+                "timestamp": op.get("timestamp") or now,
+                "notes": op.get("notes"),
+            }))
+        else:
+            level += op["qty"]
+            used.setdefault(item_id, 0)
+        levels[item_id] = level
+        result.update(status=OK, current_stock=level)
+
+    updates = []
+    for item_id, level in levels.items():
+        start = _start(items, item_id)
+        fields = {"updated_at": now, "last_batch_id": batch_id}
+        if used[item_id]:
+            fields["last_used"] = now
+        updates.append(db.inventory.update_op(
+            {"id": item_id, "current_stock": start},
+            {"$inc": {"current_stock": level - start}, "$set": prepare(fields)}
+        ))
+
+    applied = set(levels)
+    if updates:
+        outcome = await db.inventory.bulk_write(updates, ordered=False)
+        if outcome.matched_count < len(updates):
+            # Some guards failed; the batch marker tells us which updates landed
+            landed = db.inventory.find({"id": {"$in": list(levels)}, "last_batch_id": batch_id}, {"id": 1})
+            applied = {doc["id"] async for doc in landed}
+            for result in results:
+                if result["status"] == OK and result["item_id"] not in applied:
+                    result.update(status=CONFLICT, error="Stock changed concurrently, retry")
+                    result.pop("current_stock", None)
+
+    logs = [log for item_id in applied for _, log in pending_logs.get(item_id, [])]
+    if logs:
+        try:
+            await db.usage_logs.insert_many([prepare(dict(log)) for log in logs])
+        except Exception:
+            # Undo the whole batch so the stock changes and the logs stay together
+            reverts = [
+                db.inventory.update_op({"id": item_id}, {"$inc": {"current_stock": _start(items, item_id) - levels[item_id]}})
+                for item_id in applied if levels[item_id] != _start(items, item_id)
+            ]
+            if reverts:
+                await db.inventory.bulk_write(reverts, ordered=False)
+            raise
+    for item_id in applied:
+        for result, log in pending_logs.get(item_id, []):
+            result["usage_log_id"] = log["id"]
+
+    delta = dashboard_stats.merge_deltas(*(
+        dashboard_stats.stats_delta(
+            items["id:" + item_id],
+            {**items["id:" + item_id], "current_stock": levels[item_id]}
+        )
+        for item_id in applied
+    ))
+    await dashboard_stats.record_delta(db, delta)
+
+    return {
+        "batch_id": batch_id,
+        "results": results,
+        "stock_levels": {item_id: levels[item_id] for item_id in applied},
+        "usage_logs": logs,
+        "categories": {item_id: items["id:" + item_id].get("category") for item_id in applied},
+        "items": {
+            item_id: {**items["id:" + item_id], "current_stock": levels[item_id], "updated_at": now}
+            for item_id in applied
+        },
+    }
@@ -0,0 +1,277 @@
+"""Load test of the hot API paths, with the app running in-process.
+
+Requests go through ``httpx.ASGITransport`` straight into the FastAPI app,
+so the numbers cover routing, validation, our code, serialization and the
+database, but no network or server process. The database is a local
+``mongod`` (``MONGO_URL``, database ``--db``, which is dropped and
+re-seeded) or, with ``--mongomock``, an in-memory stand-in
+(``mongomock-motor``). The in-memory option is handy for smoke runs, but
+its timings say nothing about Mongo itself.
+
+Every scenario runs ``--requests`` requests from ``--concurrency``
+concurrent workers after a short warm-up and reports p50/p90/p99/max
+latency and throughput. Results are written as JSON, and ``--compare``
+prints the change against an earlier results file::
+
+    python bench/load.py --items 100000 --logs 1000000 --output results.json
+    python bench/load.py --items 100000 --logs 1000000 --compare results.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+SCENARIOS = ("scan", "product_lookup", "use", "add_stock", "inventory", "low_stock", "dashboard_stats")
+CATEGORIES = ("Diapers", "Wet Wipes", "Food & Formula", "Bath & Care", "Medicine & Health", "Other")
+SEED_BATCH = 10000
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def barcode_for(i: int) -> str:
+    return f"{2000000000000 + i}"
+
+
+async def seed(db, server, items: int, logs: int, rng: random.Random):
+    """Drop and fill the default household's inventory and usage logs, then build what the app expects to exist"""
+    for name in await db.list_collection_names():
+        await db[name].drop()
+    # Requests carry no X-Household-ID header, so they all go to the default household
+    household_id = server.DEFAULT_HOUSEHOLD_ID
+    now = datetime.now(timezone.utc)
+    for offset in range(0, items, SEED_BATCH):
+        await db.inventory.insert_many([
+            server.prepare_for_mongo(server.InventoryItem(
+                id=f"item-{i:08d}",
+                barcode=barcode_for(i),
+                name=f"Bench item {i}",
+                category=CATEGORIES[i % len(CATEGORIES)],
+                # A few low-stock items, and the rest deep enough for every "use" request
+                current_stock=rng.randint(0, 4) if i % 50 == 0 else 1_000_000_000,
+                updated_at=now - timedelta(seconds=i),
+                household_id=household_id,
+            ).model_dump())
+            for i in range(offset, min(offset + SEED_BATCH, items))
+        ])
+    for offset in range(0, logs, SEED_BATCH):
+        batch = []
+        for _ in range(min(SEED_BATCH, logs - offset)):
+            i = rng.randrange(items)
+            batch.append({
+                "id": str(uuid.uuid4()),
+                "item_id": f"item-{i:08d}",
+                "barcode": barcode_for(i),
+                "quantity_used": rng.randint(1, 3),
+                "timestamp": now - timedelta(seconds=rng.randrange(90 * 24 * 3600)),
+                "notes": None,
+                "household_id": household_id,
+            })
+        await db.usage_logs.insert_many(batch)
+    from indexes import ensure_indexes
+    try:
+        await ensure_indexes(db)
+    except Exception as e:
+        # The in-memory stand-in doesn't support every index option
+        print(f"Index bootstrap incomplete: {e}")
+    import dashboard_stats
+    import tenancy
+    await dashboard_stats.reconcile(tenancy.scoped(db, household_id))
+
+
+async def prime_lookup_cache(server, count: int):
+    """Cache product lookups so the lookup scenario never calls Open Food Facts"""
+    for i in range(count):
+        await server.product_cache.set(barcode_for(i), server.ProductLookupResponse(
+            found=True, product_name=f"Bench item {i}", brand="Bench", category="Diapers", size="1"
+        ))
+
+
+def scenarios(items: int, page_size: int, rng: random.Random, cached: int) -> Dict[str, Callable]:
+    def item() -> int:
+        return rng.randrange(items)
+
+    def stocked_item() -> int:
+        # Every 50th item is seeded nearly empty for the low-stock query
+        i = rng.randrange(items)
+        return i + 1 if i % 50 == 0 and i + 1 < items else i
+
+    return {
+        "scan": lambda c: c.get(f"/api/inventory/barcode/{barcode_for(item())}"),
+        "product_lookup": lambda c: c.post(f"/api/products/lookup/{barcode_for(rng.randrange(cached))}"),
+        "use": lambda c: _use(c, stocked_item()),
+        "add_stock": lambda c: c.post(f"/api/inventory/item-{item():08d}/add-stock", params={"quantity": 1}),
+        "inventory": lambda c: c.get("/api/inventory", params={"limit": page_size}),
+        "low_stock": lambda c: c.get("/api/inventory/low-stock"),
+        "dashboard_stats": lambda c: c.get("/api/dashboard/stats"),
+    }
+
+
+def _use(client, i: int) -> Awaitable:
+    return client.post(f"/api/inventory/item-{i:08d}/use", json={
+        "item_id": f"item-{i:08d}", "barcode": barcode_for(i), "quantity_used": 1
+    })
+
+
+async def run_scenario(client, make_request: Callable, requests: int, concurrency: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        await make_request(client)
+
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            response = await make_request(client)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, previous: dict):
+    print(f"\nChange against {previous.get('commit', '?')} ({previous.get('started_at', '?')}):")
+    for name, result in current["results"].items():
+        before = previous.get("results", {}).get(name)
+        if not before:
+            continue
+        deltas = []
+        for key in ("p50_ms", "p99_ms", "throughput_rps"):
+            if before.get(key):
+                deltas.append(f"{key} {(result[key] - before[key]) / before[key] * 100:+.1f}%")
+        print(f"  {name:16} " + "  ".join(deltas))
+
+
+async def main_async(args) -> dict:
+    try:
+        import httpx
+    except ImportError:
+        sys.exit("httpx is required: pip install httpx")
+
+    os.environ["DB_NAME"] = args.db
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    # The slow-request log would drown the report; the histograms still record everything
+    os.environ.setdefault("SLOW_REQUEST_THRESHOLD_MS", "60000")
+    import server
+
+    if args.mongomock:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("--mongomock needs mongomock-motor: pip install mongomock-motor")
+        server.db = AsyncMongoMockClient(tz_aware=True)[args.db]
+        server.product_cache.collection = server.db.product_cache
+        if server.usage_log_buffer is not None:
+            server.usage_log_buffer.collection = server.db.usage_logs
+
+    rng = random.Random(args.seed)
+    started_at = datetime.now(timezone.utc)
+    seed_started = time.perf_counter()
+    await seed(server.db, server, args.items, args.logs, rng)
+    cached = min(args.items, 10000)
+    await prime_lookup_cache(server, cached)
+    seed_seconds = time.perf_counter() - seed_started
+    print(f"Seeded {args.items} items and {args.logs} usage logs in {seed_seconds:.1f}s")
+
+    selected = args.scenario or list(SCENARIOS)
+    requests = scenarios(args.items, args.page_size, rng, cached)
+    results = {}
+    transport = httpx.ASGITransport(app=server.app)
+    # ASGITransport doesn't run the startup hooks; the usage-log buffer is the one the "use" scenario needs
+    if server.usage_log_buffer is not None:
+        server.usage_log_buffer.start()
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name in selected:
+            results[name] = await run_scenario(client, requests[name], args.requests, args.concurrency, args.warmup)
+            r = results[name]
+            print(f"{name:16} p50 {r['p50_ms']:8.2f} ms  p99 {r['p99_ms']:8.2f} ms  "
+                  f"{r['throughput_rps']:8.1f} req/s  errors {r['errors']}")
+    if server.usage_log_buffer is not None:
+        await server.usage_log_buffer.close()
+
+    return {
+        "commit": _git_commit(),
+        "started_at": started_at.isoformat(),
+        "python": platform.python_version(),
+        "database": "mongomock" if args.mongomock else "mongod",
+        "config": {
+            "items": args.items, "logs": args.logs, "requests": args.requests, "concurrency": args.concurrency,
+            "warmup": args.warmup, "page_size": args.page_size, "seed": args.seed,
+            "usage_log_durability": server.USAGE_LOG_DURABILITY,
+        },
+        "seed_seconds": round(seed_seconds, 1),
+        "results": results,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--logs", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=100, help="limit for the /inventory scenario")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="run only these (repeatable)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default="baby_erp_bench", help="database to drop and seed")
+    parser.add_argument("--mongomock", action="store_true", help="use an in-memory stand-in instead of mongod")
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    parser.add_argument("--compare", type=Path, help="earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(main_async(args))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Results written to {args.output}")
+    if args.compare:
+        compare(report, json.loads(args.compare.read_text()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""Per-item cost of turning inventory documents into a list response.
+
+Compares the old path with the fast path, with no database involved, on
+documents shaped like the ones Motor returns:
+
+* ``pydantic``: ``InventoryItem(**parse_from_mongo(doc))`` for every
+  document, then FastAPI's ``response_model`` validation/serialization and
+  ``json.dumps`` rendering.
+* ``orjson``: ``serialization.documents`` (defaults only), then
+  ``orjson.dumps``.
+
+Usage::
+
+    python bench/serialization.py [--items 1000] [--repeat 50]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+
+import orjson  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+import serialization  # noqa: E402
+from server import InventoryItem, parse_from_mongo  # noqa: E402
+
+
+def iso_dates(doc: dict) -> dict:
+    """Documents as stored before the native-date migration (see migrate_datetimes)"""
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in doc.items()}
+
+
+def make_documents(count: int, native_dates: bool) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    docs = []
+    for i in range(count):
+        doc = InventoryItem(
+            id=str(uuid.uuid4()),
+            barcode=f"{4000000000000 + i}",
+            name=f"Item {i}",
+            category=("Diapers", "Wet Wipes", "Food & Formula", "Bath & Care")[i % 4],
+            current_stock=i % 40,
+            brand="Brand",
+            size="M",
+            updated_at=now - timedelta(minutes=i),
+            last_used=now - timedelta(hours=i),
+        ).model_dump()
+        docs.append(doc if native_dates else iso_dates(doc))
+    return docs
+
+
+def pydantic_path(docs: List[dict], adapter: TypeAdapter) -> bytes:
+    items = [InventoryItem(**parse_from_mongo(dict(doc))) for doc in docs]
+    # What FastAPI does with response_model=List[InventoryItem], then JSONResponse.render
+    validated = adapter.validate_python(items, from_attributes=True)
+    content = adapter.dump_python(validated, mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def orjson_path(docs: List[dict], adapter: TypeAdapter) -> bytes:
+    return orjson.dumps(serialization.documents(InventoryItem, docs))
+
+
+def measure(fn, docs, adapter, repeat: int) -> dict:
+    fn(docs, adapter)  # warm up
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(docs, adapter)
+        timings.append(time.perf_counter() - started)
+    median = statistics.median(timings)
+    return {
+        "median_ms": round(median * 1000, 3),
+        "per_item_us": round(median / len(docs) * 1e6, 3),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    adapter = TypeAdapter(List[InventoryItem])
+    for label, native in (("ISO string dates", False), ("native BSON dates", True)):
+        docs = make_documents(args.items, native)
+        before = measure(pydantic_path, docs, adapter, args.repeat)
+        after = measure(orjson_path, docs, adapter, args.repeat)
+        speedup = before["median_ms"] / after["median_ms"] if after["median_ms"] else float("inf")
+        print(f"{args.items} items, {label}:")
+        print(f"  pydantic + response_model: {before['median_ms']:8.3f} ms  ({before['per_item_us']:.3f} us/item)")
+        print(f"  orjson fast path:          {after['median_ms']:8.3f} ms  ({after['per_item_us']:.3f} us/item)")
+        print(f"  speedup: {speedup:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
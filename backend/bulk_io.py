@@ -0,0 +1,235 @@
+"""Streaming CSV / NDJSON import and export of inventory items.
+
+Import reads the request body chunk by chunk and parses records as soon as
+they are complete, so the whole file is never held in memory. Valid rows
+become barcode-keyed upserts and are sent in ``bulk_write`` chunks. An
+existing item only gets the columns the row actually has. A new item is
+created with the model defaults for the rest. Rows that fail validation,
+or whose write fails, are reported by row number and do not stop the
+import.
+
+Export streams straight from a Motor cursor, one encoded line per
+document.
+"""
+
+import codecs
+import csv
+import io
+import json
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+import orjson
+from pydantic import BaseModel, ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson")
+MEDIA_TYPES: Dict[str, str] = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportFormatError(ValueError):
+    """The body can't be read as the requested format at all"""
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream and yield it line by line, keeping line endings"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    try:
+        async for chunk in chunks:
+            pending += decoder.decode(chunk)
+            lines = pending.split("\n")
+            # The last piece is a line still being received (or "")
+            pending = lines.pop()
+            for line in lines:
+                yield line + "\n"
+        pending += decoder.decode(b"", final=True)
+    except UnicodeDecodeError as e:
+        raise ImportFormatError(f"Body is not valid UTF-8: {e}") from e
+    if pending:
+        yield pending
+
+
+async def _csv_records(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, object]]:
+    """Yield ``(row_number, dict)`` per CSV record; quoted fields may span lines"""
+    header: Optional[List[str]] = None
+    record, row = "", 1
+    async for line in lines:
+        record += line
+        # An odd number of quotes means a quoted field continues on the next line
+        if record.count('"') % 2:
+            continue
+        text, record = record, ""
+        if not text.strip():
+            row += 1
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+        else:
+            yield row, dict(zip(header, values))
+        row += 1
+    if record.strip():
+        yield row, ImportFormatError("Unterminated quoted field")
+    if header is None:
+        raise ImportFormatError("CSV body has no header row")
+
+
+async def _ndjson_records(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, object]]:
+    row = 0
+    async for line in lines:
+        row += 1
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield row, ImportFormatError(f"Invalid JSON: {e}")
+            continue
+        yield row, record if isinstance(record, dict) else ImportFormatError("Expected a JSON object")
+
+
+def records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, object]]:
+    """Parse ``(row_number, record)`` pairs; a record is an exception for unreadable rows"""
+    if fmt not in FORMATS:
+        raise ImportFormatError(f"Unsupported format: {fmt}")
+    lines = _lines(chunks)
+    return _csv_records(lines) if fmt == "csv" else _ndjson_records(lines)
+
+
+def _clean(record: dict, fields: Iterable[str]) -> dict:
+    """Keep the model's columns; an empty CSV cell means "not given" """
+    return {
+        key: value for key, value in record.items()
+        if key in fields and value is not None and value != ""
+    }
+
+
+def _upsert(db, row: dict, defaults: dict, prepare: Callable[[dict], dict], now: datetime) -> UpdateOne:
+    changes = prepare({**row, "updated_at": now})
+    on_insert = {key: value for key, value in defaults.items() if key not in changes}
+    on_insert.update(id=str(uuid.uuid4()), created_at=now)
+    return db.inventory.update_op({"barcode": row["barcode"]}, {"$set": changes, "$setOnInsert": prepare(on_insert)}, upsert=True)
+
+
+def _error(report: dict, row: int, message: str, barcode: Optional[str] = None):
+    report["error_count"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append({"row": row, "barcode": barcode, "error": message})
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc']) or 'row'}: {detail['msg']}"
+        for detail in error.errors()
+    )
+
+
+async def _flush(db, pending: List[Tuple[int, str, UpdateOne]], report: dict):
+    if not pending:
+        return
+    try:
+        result = await db.inventory.bulk_write([op for _, _, op in pending], ordered=False)
+        details = result.bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        for failure in details.get("writeErrors", []):
+            row, barcode, _ = pending[failure["index"]]
+            _error(report, row, failure.get("errmsg", "Write failed"), barcode)
+    report["inserted"] += details.get("nUpserted", 0)
+    report["updated"] += details.get("nModified", 0)
+    report["unchanged"] += details.get("nMatched", 0) - details.get("nModified", 0)
+    pending.clear()
+
+
+async def import_items(db, rows: AsyncIterator[Tuple[int, object]], model: Type[BaseModel],
+                       prepare: Callable[[dict], dict], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                       dry_run: bool = False, classify: Optional[Callable[[str], Optional[str]]] = None) -> dict:
+    """Validate ``rows`` against ``model`` and upsert them by barcode
+
+    Columns that aren't fields of ``model`` are ignored (so an export, which
+    also has ``id`` and the timestamps, can be imported again). For new items
+    without a ``category`` column, ``classify`` is asked for one from the
+    name and brand; ``None`` keeps the model default.
+    """
+    fields = model.model_fields
+    defaults = {name: field.get_default(call_default_factory=True)
+                for name, field in fields.items() if not field.is_required()}
+    now = datetime.now(timezone.utc)
+    report = {"rows": 0, "inserted": 0, "updated": 0, "unchanged": 0, "error_count": 0, "errors": [],
+              "aborted": None, "dry_run": dry_run}
+    pending: List[Tuple[int, str, UpdateOne]] = []
+    try:
+        async for row, record in rows:
+            report["rows"] += 1
+            if isinstance(record, Exception):
+                _error(report, row, str(record))
+                continue
+            given = _clean(record, fields)
+            try:
+                item = model(**given)
+            except ValidationError as e:
+                _error(report, row, _validation_message(e), given.get("barcode"))
+                continue
+            if dry_run:
+                continue
+            insert_defaults = defaults
+            if classify is not None and "category" not in given:
+                category = classify(" ".join(filter(None, (item.name, getattr(item, "brand", None)))))
+                if category is not None:
+                    insert_defaults = {**defaults, "category": category}
+            pending.append((row, item.barcode, _upsert(db, item.dict(include=set(given)), insert_defaults, prepare, now)))
+            if len(pending) >= chunk_size:
+                await _flush(db, pending, report)
+    except ImportFormatError as e:
+        # The rows before the unreadable part are still written
+        report["aborted"] = str(e)
+    if not dry_run:
+        await _flush(db, pending, report)
+    logger.info(
+        f"Inventory import: {report['rows']} rows, {report['inserted']} inserted, "
+        f"{report['updated']} updated, {report['error_count']} errors"
+    )
+    return report
+
+
+def _csv_line(values: list) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerow(values)
+    return buffer.getvalue()
+
+
+def _cell(value) -> object:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+async def csv_lines(cursor, columns: List[str]) -> AsyncIterator[str]:
+    """Header plus one CSV line per document, straight from a Motor cursor"""
+    yield _csv_line(columns)
+    async for doc in cursor:
+        yield _csv_line([_cell(doc.get(column)) for column in columns])
+
+
+def export_filename(fmt: str, now: Optional[datetime] = None) -> str:
+    now = now or datetime.now(timezone.utc)
+    return f"inventory-{now.strftime('%Y%m%dT%H%M%SZ')}.{fmt}"
+
+
+def format_for(content_type: Optional[str]) -> str:
+    """Guess the import format from a Content-Type header, defaulting to CSV"""
+    if content_type and "json" in content_type:
+        return "ndjson"
+    return "csv"
@@ -0,0 +1,254 @@
+"""Local product catalog mirror for offline barcode lookups.
+
+An Open Food Facts data dump (the ``.jsonl`` product dump or the
+tab-separated CSV export, optionally gzipped), or any local CSV/JSONL
+catalog with the same column names, is filtered to baby categories and
+written to a SQLite file keyed on barcode. Lookups are then a primary-key
+read from a memory-mapped, read-only file: no network, and well under a
+millisecond, so the mirror is consulted before the lookup cache and the
+upstream APIs.
+
+The raw category string is stored, not the classified category, so rule
+changes apply to mirrored products without a re-import. An import builds
+a new file next to the old one and renames it into place. Running
+workers notice the new file (by mtime) and reopen it. Build a mirror
+with::
+
+    python catalog_mirror.py import openfoodfacts-products.jsonl.gz [--output PATH] [--all]
+"""
+
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = Path(__file__).parent / "catalog" / "products.sqlite"
+MMAP_SIZE = 256 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE products (
+    barcode TEXT PRIMARY KEY,
+    product_name TEXT,
+    brand TEXT,
+    categories TEXT,
+    size TEXT
+) WITHOUT ROWID;
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;
+"""
+
+
+def _open_text(path: Path) -> io.TextIOBase:
+    if path.suffix == ".gz":
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8", errors="replace", newline="")
+    return open(path, encoding="utf-8", errors="replace", newline="")
+
+
+def _categories(record: dict) -> str:
+    """Category text of a dump record; the tags (``en:baby-wipes``) are used if the free text is empty"""
+    categories = record.get("categories") or ""
+    tags = record.get("categories_tags")
+    if not categories and tags:
+        categories = ",".join(tags) if isinstance(tags, list) else str(tags)
+    return categories
+
+
+def read_dump(path: Path) -> Iterator[dict]:
+    """Yield ``{barcode, product_name, brand, categories, size}`` per product in a dump file"""
+    name = path.name.lower().removesuffix(".gz")
+    with _open_text(path) as handle:
+        if name.endswith((".jsonl", ".ndjson", ".json")):
+            records = (json.loads(line) for line in handle if line.strip())
+        else:
+            # The Open Food Facts CSV export is tab-separated despite its name
+            csv.field_size_limit(sys.maxsize)
+            sample = handle.readline()
+            delimiter = "\t" if "\t" in sample else ","
+            records = csv.DictReader(_prepend(sample, handle), delimiter=delimiter)
+        for record in records:
+            barcode = str(record.get("code") or record.get("barcode") or "").strip()
+            if not barcode:
+                continue
+            yield {
+                "barcode": barcode,
+                "product_name": record.get("product_name") or "",
+                "brand": record.get("brands") or record.get("brand") or "",
+                "categories": _categories(record),
+                "size": record.get("quantity") or record.get("size") or "",
+            }
+
+
+def _prepend(first: str, rest: Iterator[str]) -> Iterator[str]:
+    yield first
+    yield from rest
+
+
+def import_dump(source: Path, output: Path = DEFAULT_PATH, keep: Optional[Callable[[str], bool]] = None,
+                batch_size: int = 10000) -> dict:
+    """Build a mirror file from ``source``; ``keep(categories)`` filters products"""
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    building = output.with_name(output.name + ".building")
+    if building.exists():
+        building.unlink()
+    report = {"source": str(source), "output": str(output), "read": 0, "kept": 0}
+    started = time.monotonic()
+    conn = sqlite3.connect(building)
+    try:
+        conn.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;" + SCHEMA)
+        batch = []
+        for product in read_dump(Path(source)):
+            report["read"] += 1
+            if keep is not None and not keep(product["categories"]):
+                continue
+            batch.append(product)
+            if len(batch) >= batch_size:
+                report["kept"] += _insert(conn, batch)
+        report["kept"] += _insert(conn, batch)
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("source", str(source)),
+            ("imported_at", datetime.now(timezone.utc).isoformat()),
+            ("products", str(report["kept"])),
+        ])
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(building, output)
+    report["seconds"] = round(time.monotonic() - started, 1)
+    logger.info(f"Catalog mirror built: {report['kept']} of {report['read']} products in {output}")
+    return report
+
+
+def mirror_filter(classifier) -> Callable[[str], bool]:
+    """``keep`` for :func:`import_dump` following each rule's ``mirror`` setting
+
+    Generic keywords ("milk", "cream", "soap") would otherwise pull whole
+    grocery and cosmetics aisles into the mirror, so rules set to ``baby``
+    (the default) only keep products whose categories name a baby marker.
+    """
+    modes = {rule["category"]: rule.get("mirror", "baby") for rule in classifier.rules}
+    markers = classifier.baby_markers
+
+    def keep(categories: str) -> bool:
+        mode = modes.get(classifier.classify(categories), "never")
+        if mode == "baby":
+            text = categories.casefold()
+            return any(marker in text for marker in markers)
+        return mode == "always"
+
+    return keep
+
+
+def _insert(conn: sqlite3.Connection, batch: list) -> int:
+    # Later rows for the same barcode replace earlier ones
+    conn.executemany(
+        "INSERT OR REPLACE INTO products VALUES (:barcode, :product_name, :brand, :categories, :size)", batch
+    )
+    count = len(batch)
+    batch.clear()
+    return count
+
+
+class CatalogMirror:
+    """Read-only barcode lookups against a mirror file, reopened when it is replaced"""
+
+    def __init__(self, path: Path = DEFAULT_PATH, check_interval: float = 30.0):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        self._mtime: Optional[float] = None
+        self._checked_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self.close()
+        self._mtime = mtime
+        if mtime is None:
+            return
+        try:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            conn.row_factory = sqlite3.Row
+            self._conn = conn
+            logger.info(f"Catalog mirror opened: {self.path}")
+        except sqlite3.Error as e:
+            logger.error(f"Could not open catalog mirror {self.path}: {e}")
+
+    def get(self, barcode: str) -> Optional[Dict[str, str]]:
+        """The mirrored product for ``barcode``, or None (also when there is no mirror)"""
+        self._refresh()
+        if self._conn is None:
+            return None
+        try:
+            row = self._conn.execute("SELECT * FROM products WHERE barcode = ?", (barcode,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Catalog mirror lookup failed: {e}")
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(row)
+
+    def stats(self) -> dict:
+        self._refresh()
+        stats = {"path": str(self.path), "available": self._conn is not None, "hits": self.hits, "misses": self.misses}
+        if self._conn is not None:
+            stats.update(dict(self._conn.execute("SELECT key, value FROM meta").fetchall()))
+        return stats
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._mtime = None
+
+
+def _main(argv) -> int:
+    import argparse
+    from dotenv import load_dotenv
+    from classifier import CategoryClassifier, DEFAULT_RULES_FILE
+
+    load_dotenv(Path(__file__).parent / '.env')
+    parser = argparse.ArgumentParser(description="Build the local product catalog mirror")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("import", help="import an Open Food Facts dump or a CSV/JSONL catalog")
+    build.add_argument("source", type=Path)
+    build.add_argument("--output", type=Path, default=Path(os.environ.get('CATALOG_MIRROR_PATH', DEFAULT_PATH)))
+    build.add_argument("--all", action="store_true", help="keep every product, not only baby categories")
+    commands.add_parser("stats")
+    args = parser.parse_args(argv)
+
+    if args.command == "stats":
+        print(CatalogMirror(Path(os.environ.get('CATALOG_MIRROR_PATH', DEFAULT_PATH))).stats())
+        return 0
+    classifier = CategoryClassifier(Path(os.environ.get('CATEGORY_RULES_FILE', DEFAULT_RULES_FILE)))
+    keep = None if args.all else mirror_filter(classifier)
+    print(import_dump(args.source, args.output, keep))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(_main(sys.argv[1:]))
@@ -0,0 +1,231 @@
+"""Keyword classifier mapping product category strings to baby categories.
+
+The rules (category, priority, keywords per language) live in
+``category_rules.json``. Rules in the ``category_rules`` Mongo collection
+override the file per category, or add new categories, so the table can be
+changed without a deploy. All keywords are compiled into one regex
+shaped like a trie (``wipe(?:s)?``, shared prefixes factored out). One scan
+of the input tries every keyword at every position, at a cost per
+position that depends on the keyword lengths but not on their number.
+
+Matching is by substring, like the original hard-coded checks ("wipe" also
+matches "wipes"). When several categories match, the lowest ``priority``
+number wins.
+
+The table reloads itself when the file's mtime changes or the
+``category_rules`` collection version is bumped, checked at most every
+``check_interval`` seconds, so every worker picks up edits.
+
+A rule's ``mirror`` setting tells the catalog mirror import which products
+to keep: ``always`` for any match, ``baby`` only when the category text also
+contains one of the file's ``baby_markers`` (so "milk" keeps infant milk but
+not dairy), ``never`` for none.
+"""
+
+import json
+import logging
+import re
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+import versions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_FILE = Path(__file__).parent / "category_rules.json"
+DEFAULT_CATEGORY = "Other"
+
+
+def _keywords(rule: dict) -> List[str]:
+    """Keywords of a rule, given either as a list or as ``{language: [...]}``"""
+    keywords = rule.get("keywords") or []
+    if isinstance(keywords, dict):
+        keywords = [word for words in keywords.values() for word in words]
+    return [word.casefold() for word in keywords if word and word.strip()]
+
+
+def merge_rules(base: List[dict], overrides: Iterable[dict]) -> List[dict]:
+    """Replace rules of ``base`` by category with ``overrides``; disabled overrides remove a rule"""
+    merged = {rule["category"]: rule for rule in base}
+    for rule in overrides:
+        if rule.get("enabled", True):
+            merged[rule["category"]] = rule
+        else:
+            merged.pop(rule["category"], None)
+    return sorted(merged.values(), key=lambda rule: (rule.get("priority", 100), rule["category"]))
+
+
+def _trie_regex(words: Iterable[str]) -> str:
+    """Regex matching any of ``words``, longest first, with common prefixes shared"""
+    root: dict = {}
+    for word in words:
+        node = root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def emit(node: dict) -> str:
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Greedy optional: a longer keyword is tried before the one ending here
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(root)
+
+
+def _shadowed(word: str, categories: Dict[str, Tuple[int, str]]) -> bool:
+    """True if a prefix of ``word`` is a keyword of the same or better priority
+
+    Wherever ``word`` matches, that prefix matches at the same position and
+    wins anyway, so ``word`` can be left out of the pattern. Without such
+    keywords, the longest keyword at a position is also the best one there.
+    """
+    priority = categories[word][0]
+    return any(
+        word[:end] in categories and categories[word[:end]][0] <= priority
+        for end in range(1, len(word))
+    )
+
+
+class CategoryClassifier:
+    """Compiled keyword rules with hot reload from a file and a Mongo collection"""
+
+    def __init__(self, rules_file: Path = DEFAULT_RULES_FILE, check_interval: float = 10.0):
+        self.rules_file = Path(rules_file)
+        self.check_interval = check_interval
+        self.default_category = DEFAULT_CATEGORY
+        self.baby_markers: List[str] = []
+        self.rules: List[dict] = []
+        self._pattern: Optional[re.Pattern] = None
+        self._categories: Dict[str, Tuple[int, str]] = {}   # keyword -> (priority, category)
+        self._best_priority: Optional[int] = None
+        self._file_mtime: Optional[float] = None
+        self._file_rules: List[dict] = []
+        self._version: Optional[int] = None
+        self._overrides: List[dict] = []
+        self._checked_at = 0.0
+        self.reloads = 0
+        self._load_file()
+        self._compile()
+
+    def _load_file(self):
+        try:
+            mtime = self.rules_file.stat().st_mtime
+            config = json.loads(self.rules_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            # Keep the last good table rather than classifying everything as Other
+            logger.error(f"Could not load category rules from {self.rules_file}: {e}")
+            return
+        self._file_mtime = mtime
+        self._file_rules = config.get("rules", [])
+        self.default_category = config.get("default_category", DEFAULT_CATEGORY)
+        self.baby_markers = _keywords({"keywords": config.get("baby_markers")})
+
+    def _compile(self):
+        rules = merge_rules(self._file_rules, self._overrides)
+        categories: Dict[str, Tuple[int, str]] = {}
+        for rule in rules:
+            for word in _keywords(rule):
+                # The same keyword in two rules belongs to the higher-priority one
+                categories.setdefault(word, (rule.get("priority", 100), rule["category"]))
+        words = [word for word in categories if not _shadowed(word, categories)]
+        # Lookahead, so keywords overlapping an earlier match are still seen
+        self._pattern = re.compile("(?=(" + _trie_regex(words) + "))") if words else None
+        self._best_priority = min((priority for priority, _ in categories.values()), default=None)
+        self._categories = categories
+        self.rules = rules
+        self.reloads += 1
+
+    def classify(self, text: Optional[str]) -> str:
+        if not text or self._pattern is None:
+            return self.default_category
+        best: Optional[Tuple[int, str]] = None
+        for match in self._pattern.finditer(text.casefold()):
+            found = self._categories[match.group(1)]
+            if best is None or found < best:
+                best = found
+                if found[0] == self._best_priority:
+                    break
+        return best[1] if best else self.default_category
+
+    async def refresh(self, db, force: bool = False) -> bool:
+        """Reload the table if the file or the Mongo overrides changed; returns True on reload"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        changed = False
+        try:
+            mtime = self.rules_file.stat().st_mtime
+        except OSError:
+            mtime = self._file_mtime
+        if force or mtime != self._file_mtime:
+            self._load_file()
+            changed = True
+        version = await versions.current(db, "category_rules")
+        if force or version != self._version:
+            self._overrides = await db.category_rules.find({}, {"_id": 0}).to_list(None)
+            self._version = version
+            changed = True
+        if changed:
+            self._compile()
+            logger.info(f"Category rules loaded: {len(self.rules)} categories, {len(self._categories)} keywords")
+        return changed
+
+    def stats(self) -> dict:
+        return {
+            "rules_file": str(self.rules_file),
+            "version": self._version,
+            "overrides": len(self._overrides),
+            "keywords": len(self._categories),
+            "reloads": self.reloads,
+        }
+
+
+async def save_override(db, rule: dict):
+    await db.category_rules.replace_one({"category": rule["category"]}, rule, upsert=True)
+    await versions.bump(db, "category_rules")
+
+
+async def delete_override(db, category: str) -> bool:
+    result = await db.category_rules.delete_one({"category": category})
+    await versions.bump(db, "category_rules")
+    return result.deleted_count > 0
+
+
+async def reclassify_inventory(db, classifier: CategoryClassifier, overwrite: bool = False,
+                               dry_run: bool = False, chunk_size: int = 1000) -> dict:
+    """Classify every inventory item from its name and brand in one pass
+
+    Only items in the default category are moved unless ``overwrite`` is set,
+    so categories chosen by hand are kept. An item whose text matches no rule
+    is never moved to the default category.
+    """
+    report = {"scanned": 0, "changed": 0, "moves": {}, "dry_run": dry_run}
+    query = {} if overwrite else {"category": {"$in": [classifier.default_category, None]}}
+    pending: List[UpdateOne] = []
+    async for item in db.inventory.find(query, {"_id": 0, "id": 1, "name": 1, "brand": 1, "category": 1}):
+        report["scanned"] += 1
+        category = classifier.classify(" ".join(filter(None, (item.get("name"), item.get("brand")))))
+        if category == classifier.default_category or category == item.get("category"):
+            continue
+        move = f"{item.get('category')} -> {category}"
+        report["moves"][move] = report["moves"].get(move, 0) + 1
+        report["changed"] += 1
+        if not dry_run:
+            pending.append(db.inventory.update_op(
+                {"id": item["id"]},
+                {"$set": {"category": category, "updated_at": datetime.now(timezone.utc)}}
+            ))
+        if len(pending) >= chunk_size:
+            await db.inventory.bulk_write(pending, ordered=False)
+            pending = []
+    if pending:
+        await db.inventory.bulk_write(pending, ordered=False)
+    return report
@@ -0,0 +1,206 @@
+"""Materialized dashboard counters.
+
+The dashboard reads a single document from the ``dashboard_stats``
+collection instead of scanning the inventory. Every inventory write path
+passes the item's state before and after the write to ``record_change``,
+which turns it into one ``$inc`` on that document. ``reconcile`` rebuilds
+the counters from scratch in case they ever drift (e.g. after a crash
+between an inventory write and its counter update, or a manual edit in the
+database). There is one counters document per household.
+
+Every ``$inc`` also bumps the document's ``writes`` counter. ``reconcile``
+reads it before aggregating and only stores its result if no increment
+landed in the meantime, retrying otherwise, so it never drops a
+concurrent ``$inc``. An inventory write whose counter update is still in
+flight while the aggregation runs is counted twice. The next reconcile
+repairs that::
+
+    python dashboard_stats.py reconcile [HOUSEHOLD]
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+import tenancy
+
+logger = logging.getLogger(__name__)
+
+STATS_ID = "inventory"
+RECONCILE_ATTEMPTS = 3
+
+# Server-side low stock condition, with the same defaults as the models
+LOW_STOCK_EXPR = {
+    "$lte": [
+        {"$ifNull": ["$current_stock", 0]},
+        {"$ifNull": ["$min_stock_alert", 5]}
+    ]
+}
+
+
+def _encode_category(name: str) -> str:
+    # Category names become field names, which can't contain '.' or start with '$'
+    name = name.replace(".", "．")
+    return "＄" + name[1:] if name.startswith("$") else name
+
+
+def _decode_category(key: str) -> str:
+    key = key.replace("．", ".")
+    return "$" + key[1:] if key.startswith("＄") else key
+
+
+def _counters(doc: Optional[dict]) -> dict:
+    """Counter contributions of a single inventory document"""
+    if doc is None:
+        return {}
+    # Missing or null values count as the defaults, as in LOW_STOCK_EXPR and reconcile
+    stock = doc.get("current_stock") or 0
+    min_stock_alert = doc.get("min_stock_alert")
+    category = _encode_category(doc.get("category") or "Other")
+    return {
+        "total_items": 1,
+        "low_stock_items": int(stock <= (5 if min_stock_alert is None else min_stock_alert)),
+        "out_of_stock_items": int(stock == 0),
+        f"categories.{category}.items": 1,
+        f"categories.{category}.stock": stock,
+    }
+
+
+def stats_delta(before: Optional[dict], after: Optional[dict]) -> dict:
+    """``$inc`` document moving the counters from ``before`` to ``after``"""
+    delta = dict(_counters(after))
+    for key, value in _counters(before).items():
+        delta[key] = delta.get(key, 0) - value
+    return {key: value for key, value in delta.items() if value}
+
+
+def merge_deltas(*deltas: dict) -> dict:
+    merged: dict = {}
+    for delta in deltas:
+        for key, value in delta.items():
+            merged[key] = merged.get(key, 0) + value
+    return {key: value for key, value in merged.items() if value}
+
+
+async def apply_delta(db, delta: dict):
+    if not delta:
+        return
+    await db.dashboard_stats.update_one(
+        {"_id": STATS_ID},
+        {"$inc": {**delta, "writes": 1}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+
+async def record_change(db, before: Optional[dict], after: Optional[dict]):
+    """Update the counters for one inventory write"""
+    await record_delta(db, stats_delta(before, after))
+
+
+async def record_delta(db, delta: dict):
+    """Apply an already merged counter delta, e.g. for a batch of writes"""
+    try:
+        await apply_delta(db, delta)
+    except Exception as e:
+        # The inventory write already happened; reconcile will repair the counters
+        logger.error(f"Dashboard stats update failed: {e}")
+
+
+async def _aggregate(db) -> dict:
+    pipeline = [
+        {"$group": {
+            "_id": {"$ifNull": ["$category", "Other"]},
+            "items": {"$sum": 1},
+            "stock": {"$sum": {"$ifNull": ["$current_stock", 0]}},
+            "low_stock_items": {"$sum": {"$cond": [LOW_STOCK_EXPR, 1, 0]}},
+            "out_of_stock_items": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$current_stock", 0]}, 0]}, 1, 0]}}
+        }}
+    ]
+    doc = {
+        "total_items": 0,
+        "low_stock_items": 0,
+        "out_of_stock_items": 0,
+        "categories": {},
+        "updated_at": datetime.now(timezone.utc),
+        "reconciled_at": datetime.now(timezone.utc),
+    }
+    async for group in db.inventory.aggregate(pipeline):
+        doc["total_items"] += group["items"]
+        doc["low_stock_items"] += group["low_stock_items"]
+        doc["out_of_stock_items"] += group["out_of_stock_items"]
+        doc["categories"][_encode_category(group["_id"])] = {"items": group["items"], "stock": group["stock"]}
+    return doc
+
+
+async def reconcile(db) -> dict:
+    """Recompute every counter from the inventory collection"""
+    for _ in range(RECONCILE_ATTEMPTS):
+        current = await db.dashboard_stats.find_one({"_id": STATS_ID}, {"writes": 1})
+        writes = current.get("writes") if current else None
+        doc = await _aggregate(db)
+        try:
+            # Matches only if no $inc landed since the read; otherwise the upsert collides with the _id
+            await db.dashboard_stats.update_one(
+                {"_id": STATS_ID, "writes": writes},
+                {"$set": {**doc, "writes": writes or 0}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            continue
+        logger.info(f"Dashboard stats reconciled: {doc['total_items']} items")
+        return doc
+    # Under constant writes the incremental counters are left as they are
+    logger.warning(f"Dashboard stats reconcile gave up after {RECONCILE_ATTEMPTS} concurrent updates")
+    return doc
+
+
+def _present(doc: dict) -> dict:
+    categories = {
+        _decode_category(key): value
+        for key, value in (doc.get("categories") or {}).items()
+        if value.get("items")
+    }
+    return {
+        "total_items": doc.get("total_items", 0),
+        "low_stock_items": doc.get("low_stock_items", 0),
+        "out_of_stock_items": doc.get("out_of_stock_items", 0),
+        "categories": categories,
+    }
+
+
+async def get_stats(db) -> dict:
+    """Read the materialized counters, building them on first use"""
+    doc = await db.dashboard_stats.find_one({"_id": STATS_ID})
+    if doc is None or "reconciled_at" not in doc:
+        doc = await reconcile(db)
+    return _present(doc)
+
+
+async def _main(argv) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    if argv[:1] != ["reconcile"]:
+        print("usage: python dashboard_stats.py reconcile [HOUSEHOLD]")
+        return 2
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        for household in argv[1:2] or await tenancy.households(db):
+            doc = await reconcile(tenancy.scoped(db, household))
+            print(household, _present(doc))
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
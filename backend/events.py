@@ -0,0 +1,134 @@
+"""In-process pub/sub for inventory change events, served as Server-Sent Events.
+
+Write paths publish compact deltas (the new stock level of an item, or the
+full item on create/update) to an ``EventBroker``. Every connected SSE
+client has its own bounded queue. A client that falls too far behind gets
+its queue replaced by a single ``resync`` event, telling it to refetch
+instead of applying diffs. Clients subscribe for one household and only
+get that household's events; an event without a household (``resync``
+after a change stream failure) goes to everybody.
+
+With several backend workers, in-process publishing only reaches clients
+of the same worker. In that case set ``EVENTS_SOURCE=change_stream`` (which
+needs a replica set). Each worker then follows the inventory change stream
+and publishes what it sees, and local publishing is switched off so
+nothing is delivered twice.
+"""
+
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+STOCK_FIELDS = ("id", "barcode", "current_stock", "min_stock_alert", "updated_at", "last_used")
+
+
+def json_default(value):
+    """``json.dumps`` fallback for the datetimes (and ids) in stored documents"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def stock_delta(item: dict) -> dict:
+    """Compact delta for a stock change"""
+    delta = {key: item.get(key) for key in STOCK_FIELDS if key in item}
+    delta["low_stock"] = item.get("current_stock", 0) <= item.get("min_stock_alert", 5)
+    return delta
+
+
+def item_payload(item: dict) -> dict:
+    return {key: value for key, value in item.items() if key != "_id"}
+
+
+class EventBroker:
+    """Fan-out of events to per-subscriber bounded queues"""
+
+    def __init__(self, queue_size: int = 256):
+        self.queue_size = queue_size
+        self.local_publish = True
+        # queue -> household it listens to
+        self._subscribers: dict = {}
+        self._sequence = 0
+        self.dropped = 0
+
+    def publish(self, event_type: str, data: dict, local: bool = True, household_id: Optional[str] = None):
+        """Queue an event for the household's subscribers; never blocks the publisher"""
+        if local and not self.local_publish:
+            return
+        self._sequence += 1
+        event = (self._sequence, event_type, data)
+        for queue, subscribed in list(self._subscribers.items()):
+            if household_id is not None and subscribed != household_id:
+                continue
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too far behind to catch up with diffs; tell the client to refetch
+                self.dropped += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait((self._sequence, "resync", {}))
+
+    def subscribe(self, household_id: Optional[str] = None) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[queue] = household_id
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.pop(queue, None)
+
+    def stats(self) -> dict:
+        return {"subscribers": len(self._subscribers), "published": self._sequence, "dropped": self.dropped}
+
+    async def sse(self, request, household_id: Optional[str] = None, heartbeat: float = 15.0) -> AsyncIterator[str]:
+        """Server-Sent Events stream for one client"""
+        queue = self.subscribe(household_id)
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    sequence, event_type, data = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                payload = json.dumps(data, default=json_default, separators=(",", ":"))
+                yield f"id: {sequence}\nevent: {event_type}\ndata: {payload}\n\n"
+        finally:
+            self.unsubscribe(queue)
+
+
+async def follow_change_stream(db, broker: EventBroker, on_change: Optional[Callable[[dict], None]] = None):
+    """Publish inventory changes from a Mongo change stream (replica sets only)
+
+    ``on_change`` sees every raw change event first (the item cache uses it).
+    """
+    broker.local_publish = False
+    resume_token: Optional[dict] = None
+    while True:
+        try:
+            async with db.inventory.watch(full_document="updateLookup", resume_after=resume_token) as stream:
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    if on_change is not None:
+                        on_change(change)
+                    item = change.get("fullDocument")
+                    if item is None:
+                        continue
+                    household_id = item.get("household_id")
+                    if change["operationType"] == "insert":
+                        broker.publish("item_created", item_payload(item), local=False, household_id=household_id)
+                    elif set(change.get("updateDescription", {}).get("updatedFields", {})) <= set(STOCK_FIELDS) | {"last_batch_id"}:
+                        broker.publish("stock", stock_delta(item), local=False, household_id=household_id)
+                    else:
+                        broker.publish("item_updated", item_payload(item), local=False, household_id=household_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Inventory change stream failed, retrying: {e}")
+            broker.publish("resync", {}, local=False)
+            await asyncio.sleep(5)
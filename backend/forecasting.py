@@ -0,0 +1,146 @@
+"""Consumption-rate forecasting over ``usage_logs``.
+
+Usage for every item is loaded with one query and turned into an
+items x days matrix, so rolling burn rates for the whole inventory come out
+of a single vectorized pass. Burn rates are cached per household and item
+and only recomputed for items that got new usage since the last run (or
+for the whole household once its day rolls over). Days-until-empty is always computed
+from the current stock, so restocks show up immediately.
+
+``invalidate`` only reaches the process that recorded the usage. Usage
+recorded by other workers shows up once the household's rates are older
+than ``ttl_seconds``, when they are all recomputed. At most
+``max_households`` households are cached, least recently used first out.
+"""
+
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import tenancy
+
+
+class _HouseholdRates:
+    """Cached burn rates of one household, valid for one day or until they expire"""
+
+    def __init__(self, day: pd.Timestamp, expires: float):
+        self.day = day
+        self.expires = expires
+        # window_days -> {item_id: (burn_rate, previous_burn_rate)}
+        self.rates: Dict[int, Dict[str, tuple]] = {}
+        self.dirty: Dict[int, set] = {}
+
+
+class ForecastEngine:
+    """Cached per-item burn rates with incremental invalidation"""
+
+    def __init__(self, max_window_days: int = 90, ttl_seconds: float = 60.0, max_households: int = 1000):
+        self.max_window_days = max_window_days
+        self.ttl_seconds = ttl_seconds
+        self.max_households = max_households
+        # household id (None for an unscoped database) -> its cached rates, least recently used first
+        self._households: "OrderedDict[Optional[str], _HouseholdRates]" = OrderedDict()
+
+    def invalidate(self, household_id: Optional[str], item_ids: Iterable[str]):
+        """Mark a household's items whose usage changed so their rates are recomputed"""
+        cached = self._households.get(household_id)
+        if cached is None:
+            return
+        item_ids = set(item_ids)
+        for dirty in cached.dirty.values():
+            dirty |= item_ids
+
+    def clear(self):
+        self._households.clear()
+
+    async def _load_usage(self, db, item_ids: Optional[List[str]], since: datetime) -> pd.DataFrame:
+        query = {"timestamp": {"$gte": since}}
+        if item_ids is not None:
+            query["item_id"] = {"$in": item_ids}
+        projection = {"_id": 0, "item_id": 1, "quantity_used": 1, "timestamp": 1}
+        rows = await db.usage_logs.find(query, projection).to_list(None)
+        return pd.DataFrame(rows, columns=["item_id", "quantity_used", "timestamp"])
+
+    def _burn_rates(self, usage: pd.DataFrame, window_days: int, today: pd.Timestamp) -> Dict[str, tuple]:
+        """Mean daily usage over the last window and the window before it, for every item"""
+        if usage.empty:
+            return {}
+        days = pd.to_datetime(usage["timestamp"], utc=True, format="ISO8601").dt.floor("D")
+        daily = (
+            usage.assign(day=days)
+            .groupby(["item_id", "day"])["quantity_used"].sum()
+            .unstack(fill_value=0)
+        )
+        # Days without any usage count as zero, not as missing
+        calendar = pd.date_range(end=today, periods=2 * window_days, freq="D", tz="UTC")
+        matrix = daily.reindex(columns=calendar, fill_value=0).to_numpy(dtype=float)
+        rolling = pd.DataFrame(matrix.T).rolling(window_days, min_periods=1).mean().to_numpy().T
+        current = rolling[:, -1]
+        previous = rolling[:, window_days - 1]
+        return {item_id: (current[i], previous[i]) for i, item_id in enumerate(daily.index)}
+
+    async def forecast(self, db, window_days: int = 14, item_ids: Optional[List[str]] = None) -> List[dict]:
+        window_days = max(1, min(window_days, self.max_window_days))
+        now = datetime.now(timezone.utc)
+        today = pd.Timestamp(now).floor("D")
+        household_id = tenancy.household_of(db)
+        cached = self._households.get(household_id)
+        if cached is None or cached.day != today or cached.expires <= time.monotonic():
+            # Windows slide every day, so yesterday's rates are all stale
+            cached = self._households[household_id] = _HouseholdRates(today, time.monotonic() + self.ttl_seconds)
+        self._households.move_to_end(household_id)
+        while len(self._households) > self.max_households:
+            self._households.popitem(last=False)
+
+        item_filter = {"id": {"$in": item_ids}} if item_ids is not None else {}
+        projection = {"_id": 0, "id": 1, "name": 1, "category": 1, "current_stock": 1, "unit_type": 1}
+        items = await db.inventory.find(item_filter, projection).to_list(None)
+
+        rates = cached.rates.get(window_days)
+        if rates is None:
+            stale = None  # everything
+            rates = {}
+        else:
+            dirty = cached.dirty.get(window_days, set())
+            stale = sorted({item["id"] for item in items if item["id"] not in rates} | dirty)
+
+        if stale is None or stale:
+            # Every dirty id is recomputed below; usage recorded while it loads marks them again
+            cached.dirty[window_days] = set()
+            since = (today - pd.Timedelta(days=2 * window_days - 1)).to_pydatetime()
+            usage = await self._load_usage(db, stale, since)
+            fresh = self._burn_rates(usage, window_days, today)
+            recomputed = stale if stale is not None else [item["id"] for item in items]
+            for item_id in recomputed:
+                rates[item_id] = fresh.get(item_id, (0.0, 0.0))
+            cached.rates[window_days] = rates
+
+        if not items:
+            return []
+
+        stock = np.array([item.get("current_stock", 0) or 0 for item in items], dtype=float)
+        burn = np.array([rates.get(item["id"], (0.0, 0.0))[0] for item in items])
+        previous = np.array([rates.get(item["id"], (0.0, 0.0))[1] for item in items])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            days_left = np.where(burn > 0, stock / burn, np.inf)
+
+        forecasts = []
+        for i, item in enumerate(items):
+            finite = np.isfinite(days_left[i])
+            forecasts.append({
+                "item_id": item["id"],
+                "name": item.get("name"),
+                "category": item.get("category"),
+                "unit_type": item.get("unit_type"),
+                "current_stock": int(stock[i]),
+                "daily_burn_rate": round(float(burn[i]), 3),
+                "previous_daily_burn_rate": round(float(previous[i]), 3),
+                "days_until_empty": round(float(days_left[i]), 1) if finite else None,
+                "projected_empty_date": (now + timedelta(days=float(days_left[i]))).date().isoformat() if finite else None,
+            })
+        forecasts.sort(key=lambda f: (f["days_until_empty"] is None, f["days_until_empty"] or 0))
+        return forecasts
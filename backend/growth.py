@@ -0,0 +1,254 @@
+"""Child growth z-scores and percentiles against the WHO growth standards.
+
+The WHO publishes its standards as LMS tables: for every age (in days for
+0-5 years, in months for the 5-19 year reference) a Box-Cox power ``L``,
+a median ``M`` and a coefficient of variation ``S``. A measurement ``x``
+then has the z-score::
+
+    z = ((x / M) ** L - 1) / (L * S)        (ln(x / M) / S when L == 0)
+
+Weight-based indicators beyond +/-3 SD use the WHO's restricted
+adjustment, because their tails are not normal. The percentile is the
+normal CDF of ``z``.
+
+The tables are read once into NumPy arrays, per indicator and sex.
+``assess`` takes any number of measurements (one child's history, or the
+latest measurement of every child in a daycare). It interpolates L, M and
+S at every age and computes every z-score and percentile in one vectorized
+pass per indicator.
+
+The tables are not shipped. Download the WHO "expanded tables" (z-scores,
+by day) and, for older children, the 2007 reference tables (by month), as
+tab- or comma-separated text. Put them in ``GROWTH_TABLES_DIR`` (default
+``backend/who_growth``). A file is recognised by its name: indicator
+(``wfa``, ``lhfa``/``hfa``, ``bfa``/``bmi``) and sex (``boys``/``girls``),
+e.g. ``wfa_boys_z_exp.txt``. Its header must name the age column (``Day``
+or ``Month``) and ``L``, ``M`` and ``S``. Check what was loaded with::
+
+    python growth.py tables
+"""
+
+import csv
+import logging
+import math
+import os
+import re
+import sys
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIR = Path(__file__).parent / "who_growth"
+
+WEIGHT_FOR_AGE = "weight_for_age"
+LENGTH_FOR_AGE = "length_for_age"
+BMI_FOR_AGE = "bmi_for_age"
+INDICATORS = (WEIGHT_FOR_AGE, LENGTH_FOR_AGE, BMI_FOR_AGE)
+# Skewed indicators get the WHO adjustment beyond +/-3 SD
+_RESTRICTED = (WEIGHT_FOR_AGE, BMI_FOR_AGE)
+
+_FILE_INDICATORS = {"wfa": WEIGHT_FOR_AGE, "lhfa": LENGTH_FOR_AGE, "hfa": LENGTH_FOR_AGE,
+                    "bfa": BMI_FOR_AGE, "bmi": BMI_FOR_AGE}
+_FILE_PATTERN = re.compile(r"^(wfa|lhfa|hfa|bfa|bmi)[_-].*?(boys|girls)", re.IGNORECASE)
+_DAYS_PER_MONTH = 365.25 / 12
+
+BOYS = 0
+GIRLS = 1
+SEXES = {BOYS: "boys", GIRLS: "girls"}
+_SEX_NAMES = {"boy": BOYS, "boys": BOYS, "male": BOYS, "m": BOYS,
+              "girl": GIRLS, "girls": GIRLS, "female": GIRLS, "f": GIRLS}
+
+
+def sex_code(gender: Optional[str]) -> int:
+    """BOYS, GIRLS, or -1 when ``Child.gender`` doesn't say"""
+    return _SEX_NAMES.get((gender or "").strip().lower(), -1)
+
+
+def age_in_days(date_of_birth: Optional[str], measured_at) -> Optional[int]:
+    """Age at a measurement; None if the date of birth can't be read"""
+    try:
+        born = date.fromisoformat((date_of_birth or "")[:10])
+    except ValueError:
+        return None
+    day = measured_at.date() if isinstance(measured_at, datetime) else measured_at
+    return (day - born).days
+
+
+def _read_table(path: Path) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Ages in days and L, M, S columns of one WHO table file"""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        header = f.readline()
+        delimiter = "\t" if "\t" in header else ","
+        columns = {name.strip().lower(): i for i, name in enumerate(next(csv.reader([header], delimiter=delimiter)))}
+        if "day" in columns:
+            age, scale = columns["day"], 1.0
+        elif "month" in columns:
+            age, scale = columns["month"], _DAYS_PER_MONTH
+        else:
+            raise ValueError(f"{path.name}: no Day or Month column")
+        if not {"l", "m", "s"} <= columns.keys():
+            raise ValueError(f"{path.name}: needs L, M and S columns")
+        wanted = [age, columns["l"], columns["m"], columns["s"]]
+        rows = [[float(row[i]) for i in wanted] for row in csv.reader(f, delimiter=delimiter) if row and row[0].strip()]
+    table = np.array(rows, dtype=float).reshape(-1, 4)
+    return table[:, 0] * scale, table[:, 1], table[:, 2], table[:, 3]
+
+
+class GrowthStandards:
+    """WHO LMS tables as arrays, by indicator and sex"""
+
+    def __init__(self, tables: Optional[Dict[Tuple[str, int], Tuple[np.ndarray, ...]]] = None):
+        # (indicator, sex) -> (ages in days ascending, L, M, S)
+        self.tables = tables or {}
+
+    @classmethod
+    def load(cls, directory: Path) -> "GrowthStandards":
+        found: Dict[Tuple[str, int], List[tuple]] = {}
+        files = sorted(p for p in directory.glob("*") if p.suffix.lower() in (".txt", ".csv", ".tsv")) \
+            if directory.is_dir() else []
+        for path in files:
+            match = _FILE_PATTERN.match(path.name)
+            if not match:
+                continue
+            key = (_FILE_INDICATORS[match.group(1).lower()], _SEX_NAMES[match.group(2).lower()])
+            try:
+                found.setdefault(key, []).append(_read_table(path))
+            except (OSError, ValueError, IndexError) as e:
+                logger.error(f"Skipping growth table {path.name}: {e}")
+
+        tables = {}
+        for key, parts in found.items():
+            # The 0-5 year standard and the 5-19 year reference join into one age axis
+            ages, l, m, s = (np.concatenate(column) for column in zip(*parts))
+            order = np.argsort(ages, kind="stable")
+            ages, keep = np.unique(ages[order], return_index=True)
+            tables[key] = (ages, l[order][keep], m[order][keep], s[order][keep])
+        if tables:
+            logger.info(f"Loaded {len(tables)} WHO growth tables from {directory}")
+        else:
+            logger.warning(f"No WHO growth tables in {directory}; growth endpoints are unavailable")
+        return cls(tables)
+
+    @property
+    def available(self) -> bool:
+        return bool(self.tables)
+
+    def lms(self, indicator: str, sexes: np.ndarray, ages: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """L, M, S interpolated at every (sex, age); NaN where no table covers it"""
+        l, m, s = (np.full(ages.shape, np.nan) for _ in range(3))
+        for sex in SEXES:
+            table = self.tables.get((indicator, sex))
+            if table is None:
+                continue
+            table_ages = table[0]
+            rows = (sexes == sex) & (ages >= table_ages[0]) & (ages <= table_ages[-1])
+            for out, column in zip((l, m, s), table[1:]):
+                out[rows] = np.interp(ages[rows], table_ages, column)
+        return l, m, s
+
+    def z_scores(self, indicator: str, sexes: np.ndarray, ages: np.ndarray, values: np.ndarray) -> np.ndarray:
+        l, m, s = self.lms(indicator, sexes, ages)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            box_cox = np.where(l != 0, ((values / m) ** l - 1) / (l * s), np.log(values / m) / s)
+            z = np.where(values > 0, box_cox, np.nan)
+            if indicator in _RESTRICTED:
+                # Beyond +/-3 SD, distance is measured in units of the 2-3 SD gap on that side
+                def sd(k):
+                    return np.where(l != 0, m * (1 + l * s * k) ** (1 / l), m * np.exp(s * k))
+                upper, lower = sd(3), sd(-3)
+                z = np.where(z > 3, 3 + (values - upper) / (upper - sd(2)), z)
+                z = np.where(z < -3, -3 + (values - lower) / (sd(-2) - lower), z)
+        return z
+
+
+def percentiles(z: np.ndarray) -> np.ndarray:
+    """Normal CDF of ``z`` as a percentile (0-100)"""
+    # Abramowitz & Stegun 7.1.26 (|error| < 1.5e-7); NumPy has no erf
+    x = np.abs(z) / np.sqrt(2)
+    t = 1 / (1 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1 - poly * np.exp(-x * x)
+    return 50 * (1 + np.sign(z) * erf)
+
+
+def _value(measurement: dict, key: str) -> float:
+    value = measurement.get(key)
+    return float(value) if value is not None else np.nan
+
+
+def _column(values: np.ndarray, decimals: int) -> List[Optional[float]]:
+    return [value if math.isfinite(value) else None for value in np.round(values, decimals).tolist()]
+
+
+def assess(standards: GrowthStandards, measurements: List[dict]) -> List[dict]:
+    """Z-scores and percentiles for measurements with ``gender``, ``age_days``, ``height`` (cm) and ``weight`` (kg)"""
+    if not measurements:
+        return []
+    sexes = np.array([sex_code(m.get("gender")) for m in measurements])
+    ages = np.array([_value(m, "age_days") for m in measurements])
+    height = np.array([_value(m, "height") for m in measurements])
+    weight = np.array([_value(m, "weight") for m in measurements])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bmi = weight / (height / 100) ** 2
+
+    # Rounded and converted to Python floats in bulk; only the dicts are built per row
+    columns = {"bmi": _column(bmi, 1)}
+    for indicator, values in ((WEIGHT_FOR_AGE, weight), (LENGTH_FOR_AGE, height), (BMI_FOR_AGE, bmi)):
+        z = standards.z_scores(indicator, sexes, ages, values)
+        columns[indicator] = list(zip(_column(z, 2), _column(percentiles(z), 1)))
+
+    results = []
+    for i in range(len(measurements)):
+        result = {"bmi": columns["bmi"][i]}
+        for indicator in INDICATORS:
+            z, pct = columns[indicator][i]
+            result[indicator] = {"z_score": z, "percentile": pct}
+        results.append(result)
+    return results
+
+
+def measurement_changed(child: dict, changes: dict) -> bool:
+    """Whether an update gives ``child`` a new height or weight, rather than sending the current ones again"""
+    return any(key in changes and changes[key] != child.get(key) for key in ("height", "weight"))
+
+
+def measurement_rows(child: dict, measurements: List[dict]) -> List[dict]:
+    """Input rows for ``assess``; a child without recorded measurements is assessed on its own height and weight"""
+    if not measurements and (child.get("height") is not None or child.get("weight") is not None):
+        measurements = [{"measured_at": child.get("updated_at") or child.get("created_at"),
+                         "height": child.get("height"), "weight": child.get("weight")}]
+    return [{
+        "id": m.get("id"),
+        "child_id": child["id"],
+        "measured_at": m["measured_at"],
+        "age_days": age_in_days(child.get("date_of_birth"), m["measured_at"]),
+        "gender": child.get("gender"),
+        "height": m.get("height"),
+        "weight": m.get("weight"),
+    } for m in measurements]
+
+
+def _main(argv) -> int:
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / '.env')
+    parser = argparse.ArgumentParser(description="WHO growth reference tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("tables", help="list the tables found and the ages they cover")
+    parser.parse_args(argv)
+
+    directory = Path(os.environ.get('GROWTH_TABLES_DIR', DEFAULT_DIR))
+    standards = GrowthStandards.load(directory)
+    for (indicator, sex), (ages, *_) in sorted(standards.tables.items()):
+        print(f"{indicator:16} {SEXES[sex]:6} {len(ages):6} rows  days {ages[0]:.0f}-{ages[-1]:.0f}")
+    return 0 if standards.available else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(_main(sys.argv[1:]))
@@ -0,0 +1,184 @@
+"""Index bootstrap for the Baby ERP collections.
+
+``ensure_indexes`` runs on startup and is safe to run any number of times:
+indexes that already exist with the same keys are left alone, and indexes
+listed in ``RETIRED_INDEXES`` are dropped once their replacements exist. It
+can also be run by hand::
+
+    python indexes.py            # create anything missing
+    python indexes.py --check    # only report, exit 1 if something is missing
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import List, NamedTuple
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSpec(NamedTuple):
+    collection: str
+    keys: list
+    name: str
+    options: dict = {}
+
+
+# Per-household indexes lead with household_id: a household's queries only read
+# its own range, uniqueness holds per household, and household_id can be the shard key
+INDEXES: List[IndexSpec] = [
+    IndexSpec("inventory", [("household_id", ASCENDING), ("id", ASCENDING)], "inventory_household_id_unique", {"unique": True}),
+    IndexSpec("inventory", [("household_id", ASCENDING), ("barcode", ASCENDING)], "inventory_household_barcode_unique",
+              {"unique": True}),
+    IndexSpec("inventory", [("household_id", ASCENDING), ("updated_at", DESCENDING), ("id", DESCENDING)],
+              "inventory_household_updated_at_id"),
+    IndexSpec("usage_logs", [("household_id", ASCENDING), ("timestamp", DESCENDING)], "usage_logs_household_timestamp_desc"),
+    # Keyset pagination order for GET /usage-logs
+    IndexSpec("usage_logs", [("household_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+              "usage_logs_household_timestamp_id"),
+    IndexSpec("usage_logs", [("household_id", ASCENDING), ("item_id", ASCENDING), ("timestamp", DESCENDING)],
+              "usage_logs_household_item_timestamp"),
+    # Offline scan uploads are deduplicated on this key; claims expire after 30 days
+    IndexSpec("scan_events", [("household_id", ASCENDING), ("idempotency_key", ASCENDING)],
+              "scan_events_household_idempotency_key_unique", {"unique": True}),
+    IndexSpec("scan_events", [("received_at", ASCENDING)], "scan_events_received_ttl", {"expireAfterSeconds": 30 * 24 * 3600}),
+    IndexSpec("usage_rollups", [("household_id", ASCENDING), ("granularity", ASCENDING), ("scope", ASCENDING),
+                                ("key", ASCENDING), ("bucket", ASCENDING)],
+              "usage_rollups_household_bucket_unique", {"unique": True}),
+    IndexSpec("usage_rollups", [("household_id", ASCENDING), ("granularity", ASCENDING), ("scope", ASCENDING),
+                                ("bucket", ASCENDING)], "usage_rollups_household_range"),
+    IndexSpec("children", [("household_id", ASCENDING), ("id", ASCENDING)], "children_household_id_unique", {"unique": True}),
+    # A child's growth history in order, and the latest measurement of every child
+    IndexSpec("growth_measurements", [("household_id", ASCENDING), ("child_id", ASCENDING), ("measured_at", DESCENDING)],
+              "growth_measurements_household_child_measured"),
+    IndexSpec("product_cache", [("barcode", ASCENDING)], "product_cache_barcode_unique", {"unique": True}),
+    # Let Mongo drop expired lookup cache entries by itself
+    IndexSpec("product_cache", [("expires_at", ASCENDING)], "product_cache_expires_ttl", {"expireAfterSeconds": 0}),
+    IndexSpec("category_rules", [("category", ASCENDING)], "category_rules_category_unique", {"unique": True}),
+]
+
+# Single-household indexes replaced by the ones above. The unique ones would stop
+# a second household from using the same barcode, so ensure_indexes drops them.
+RETIRED_INDEXES: List[tuple] = [
+    ("inventory", "inventory_id_unique"),
+    ("inventory", "inventory_barcode_unique"),
+    ("inventory", "inventory_updated_at_id"),
+    ("usage_logs", "usage_logs_timestamp_desc"),
+    ("usage_logs", "usage_logs_timestamp_id"),
+    ("usage_logs", "usage_logs_item_timestamp"),
+    ("scan_events", "scan_events_idempotency_key_unique"),
+    ("usage_rollups", "usage_rollups_bucket_unique"),
+    ("usage_rollups", "usage_rollups_range"),
+    ("children", "children_id_unique"),
+]
+
+
+def _same_index(existing: dict, spec: IndexSpec) -> bool:
+    return list(existing["key"].items()) == [(k, d) for k, d in spec.keys]
+
+
+async def _existing_indexes(db, collection: str) -> list:
+    try:
+        return [index async for index in db[collection].list_indexes()]
+    except OperationFailure:
+        # Collection doesn't exist yet
+        return []
+
+
+async def _report_duplicates(db, spec: IndexSpec):
+    """Log the values that block a unique index from being built"""
+    fields = [field for field, _ in spec.keys]
+    pipeline = [
+        {"$group": {"_id": {field: f"${field}" for field in fields}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": 20},
+    ]
+    async for dup in db[spec.collection].aggregate(pipeline):
+        logger.error(f"  duplicate {spec.collection} {dup['_id']!r} ({dup['count']} documents)")
+
+
+async def ensure_indexes(db, specs: List[IndexSpec] = INDEXES) -> dict:
+    """Create any missing indexes and return a summary of what happened"""
+    report = {"created": [], "existing": [], "failed": []}
+    total = len(specs)
+    for position, spec in enumerate(specs, start=1):
+        label = f"{spec.collection}.{spec.name}"
+        existing = await _existing_indexes(db, spec.collection)
+        if any(_same_index(index, spec) for index in existing):
+            logger.info(f"[{position}/{total}] index {label} already present")
+            report["existing"].append(label)
+            continue
+
+        logger.info(f"[{position}/{total}] building index {label}")
+        try:
+            await db[spec.collection].create_index(spec.keys, name=spec.name, **spec.options)
+        except (DuplicateKeyError, OperationFailure) as e:
+            logger.error(f"[{position}/{total}] could not build index {label}: {e}")
+            if spec.options.get("unique"):
+                await _report_duplicates(db, spec)
+            report["failed"].append(label)
+            continue
+        report["created"].append(label)
+
+    # Keep the old indexes until every replacement is in place
+    report["dropped"] = await drop_retired_indexes(db) if not report["failed"] else []
+    logger.info(
+        f"Index bootstrap done: {len(report['created'])} created, "
+        f"{len(report['existing'])} existing, {len(report['failed'])} failed, {len(report['dropped'])} retired"
+    )
+    return report
+
+
+async def drop_retired_indexes(db, retired: List[tuple] = RETIRED_INDEXES) -> List[str]:
+    dropped = []
+    for collection, name in retired:
+        if not any(index["name"] == name for index in await _existing_indexes(db, collection)):
+            continue
+        try:
+            await db[collection].drop_index(name)
+        except OperationFailure as e:
+            logger.error(f"could not drop retired index {collection}.{name}: {e}")
+            continue
+        logger.info(f"dropped retired index {collection}.{name}")
+        dropped.append(f"{collection}.{name}")
+    return dropped
+
+
+async def missing_indexes(db, specs: List[IndexSpec] = INDEXES) -> List[str]:
+    """Return the indexes from ``specs`` that don't exist in the database"""
+    missing = []
+    for spec in specs:
+        existing = await _existing_indexes(db, spec.collection)
+        if not any(_same_index(index, spec) for index in existing):
+            missing.append(f"{spec.collection}.{spec.name}")
+    return missing
+
+
+async def _main(argv) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        if "--check" in argv:
+            missing = await missing_indexes(db)
+            for label in missing:
+                print(f"missing: {label}")
+            print("all indexes present" if not missing else f"{len(missing)} index(es) missing")
+            return 1 if missing else 0
+        report = await ensure_indexes(db)
+        return 1 if report["failed"] else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -0,0 +1,134 @@
+"""Read-through in-process cache of inventory items, by id and by barcode.
+
+Entries are keyed per household (``household_id`` of the document), so one
+household can never be served another's item, even for the same barcode.
+
+Item reads (``GET /inventory/{id}``, ``GET /inventory/barcode/{barcode}``)
+are served from a bounded LRU. On a miss they fall back to Mongo and fill
+it. Write paths that get the new document back from Mongo
+(``find_one_and_update``) put it in place. Paths that change many items at
+once drop the affected entries, or everything.
+
+Two guards keep a slow reader from putting an old document back over a
+newer one:
+
+* an entry is only replaced by a document with the same or a later
+  ``updated_at`` (every write path sets it);
+* a fill started before an ``invalidate()`` or ``clear()`` is ignored,
+  because the read carries the cache generation from when it started.
+
+Other workers' writes are not seen here; entries expire after
+``ttl_seconds``. With ``EVENTS_SOURCE=change_stream``, every worker
+applies the documents from the inventory change stream
+(``apply_change``), so the caches follow each other. Without it, a
+cached item could show stock up to ``ttl_seconds`` old after another
+worker's ``/use``, so the server only turns the cache on by default
+together with the change stream.
+"""
+
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def _version(doc: dict) -> datetime:
+    value = doc.get("updated_at")
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return _EPOCH
+
+
+class ItemCache:
+    """Bounded LRU of inventory documents with TTL, indexed by id and barcode"""
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 60.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # (household, id) -> (monotonic expiry, document)
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._by_barcode: dict = {}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _drop(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            barcode = (key[0], entry[1].get("barcode"))
+            if self._by_barcode.get(barcode) == key:
+                del self._by_barcode[barcode]
+
+    def _lookup(self, key: Optional[tuple]) -> Optional[dict]:
+        entry = self._entries.get(key) if key is not None else None
+        if entry is not None:
+            expires, doc = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                # Callers parse and mutate what they get; the cached copy stays as stored
+                return dict(doc)
+            self._drop(key)
+        self.misses += 1
+        return None
+
+    def get_by_id(self, household_id: str, item_id: str) -> Optional[dict]:
+        return self._lookup((household_id, item_id))
+
+    def get_by_barcode(self, household_id: str, barcode: str) -> Optional[dict]:
+        return self._lookup(self._by_barcode.get((household_id, barcode)))
+
+    def put(self, doc: dict, generation: Optional[int] = None):
+        """Store an item document; ignored if it is older than the cached one or predates an invalidation"""
+        if not self.enabled or (generation is not None and generation != self.generation):
+            return
+        if doc.get("id") is None:
+            return
+        key = (doc.get("household_id"), doc["id"])
+        current = self._entries.get(key)
+        if current is not None and _version(current[1]) > _version(doc):
+            return
+        self._drop(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, {k: v for k, v in doc.items() if k != "_id"})
+        self._by_barcode[(key[0], doc.get("barcode"))] = key
+        while len(self._entries) > self.max_size:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, household_id: str, item_ids: Iterable[str]):
+        for item_id in item_ids:
+            self._drop((household_id, item_id))
+        self.generation += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._by_barcode.clear()
+        self.generation += 1
+
+    def apply_change(self, change: dict):
+        """Follow an inventory change-stream event"""
+        item = change.get("fullDocument")
+        if item is not None:
+            self.put(item)
+        else:
+            # Deletes carry only the _id; not worth an index, they don't happen in normal use
+            self.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,195 @@
+"""Request, MongoDB and upstream timing, exposed in Prometheus text format.
+
+``MetricsMiddleware`` times every request into a histogram labelled with
+the route template (``/api/inventory/{item_id}``, not the raw path, to
+keep the label set bounded). ``MongoCommandListener`` is a pymongo command
+listener that times every command per collection and command name.
+``UpstreamClient`` reports its calls through ``observe_upstream``.
+
+Each request also gets a breakdown (Mongo time per ``collection.command``,
+upstream time) collected through a context variable. Motor runs pymongo
+calls in executor threads with a copy of the caller's context, so
+commands are attributed to the request that issued them. Requests slower
+than the threshold are logged with that breakdown. Whatever is left over
+is time spent in our own code (validation, serialization, ...).
+"""
+
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Iterable, Optional, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_breakdown: ContextVar[Optional[dict]] = ContextVar("metrics_breakdown", default=None)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a fixed label set; safe to observe from any thread"""
+
+    def __init__(self, name: str, help_text: str, label_names: Iterable[str], buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # label values -> [bucket counts..., sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = _format_labels(self.label_names, labels, f'le="{_format_number(bound)}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            inf = _format_labels(self.label_names, labels, 'le="+Inf"')
+            yield f"{self.name}_bucket{inf} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, labels)} {series[-2]}"
+            yield f"{self.name}_count{_format_labels(self.label_names, labels)} {series[-1]}"
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+mongodb_command_duration = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency by collection and command", ("collection", "command"))
+upstream_request_duration = Histogram(
+    "upstream_request_duration_seconds", "Upstream lookup latency by service and outcome", ("upstream", "outcome"))
+
+HISTOGRAMS = (http_request_duration, mongodb_command_duration, upstream_request_duration)
+
+
+def render() -> str:
+    return "\n".join(line for histogram in HISTOGRAMS for line in histogram.render()) + "\n"
+
+
+def _add(breakdown: Optional[dict], key: str, seconds: float):
+    if breakdown is not None:
+        entry = breakdown.setdefault(key, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+def observe_upstream(name: str, outcome: str, seconds: float):
+    upstream_request_duration.observe(seconds, name, outcome)
+    _add(_breakdown.get(), f"upstream:{name}", seconds)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times every MongoDB command and charges it to the current request"""
+
+    def __init__(self):
+        # (connection, request id) -> (collection, request breakdown)
+        self._pending: Dict[tuple, tuple] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        self._pending[(event.connection_id, event.request_id)] = (collection, _breakdown.get())
+
+    def _finished(self, event):
+        collection, breakdown = self._pending.pop((event.connection_id, event.request_id), ("", None))
+        seconds = event.duration_micros / 1e6
+        mongodb_command_duration.observe(seconds, collection, event.command_name)
+        _add(breakdown, f"mongo:{collection}.{event.command_name}" if collection else f"mongo:{event.command_name}", seconds)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def format_breakdown(breakdown: dict, total: float) -> str:
+    parts = []
+    accounted = 0.0
+    for key, (seconds, count) in sorted(breakdown.items(), key=lambda item: -item[1][0]):
+        accounted += seconds
+        parts.append(f"{key} {seconds * 1000:.1f}ms/{count}")
+    parts.append(f"app {max(total - accounted, 0.0) * 1000:.1f}ms")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency and logging slow requests"""
+
+    def __init__(self, app, slow_request_seconds: float = 1.0, exclude_paths: Iterable[str] = ("/metrics",)):
+        self.app = app
+        self.slow_request_seconds = slow_request_seconds
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        breakdown: dict = {}
+        token = _breakdown.set(breakdown)
+        status = [500]
+        streaming = [False]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                # Event streams stay open by design; their duration isn't latency
+                streaming[0] = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", [])
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _breakdown.reset(token)
+            elapsed = time.perf_counter() - started
+            route = _route_template(scope)
+            http_request_duration.observe(elapsed, scope["method"], route, str(status[0]))
+            if elapsed >= self.slow_request_seconds and not streaming[0]:
+                logger.warning(
+                    f"Slow request {scope['method']} {scope['path']} -> {status[0]} in {elapsed * 1000:.0f}ms "
+                    f"({format_breakdown(breakdown, elapsed)})"
+                )
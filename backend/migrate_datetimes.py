@@ -0,0 +1,143 @@
+"""One-time migration of ISO-string dates to native BSON dates.
+
+Older versions stored ``created_at``, ``updated_at``, ``last_used`` and
+``timestamp`` as ISO strings. Strings sort and range-query differently from
+BSON dates (Mongo orders every string before every date), so a time range
+on ``usage_logs`` only uses the ``timestamp`` index once every log has been
+converted.
+
+Each collection is walked in ``_id`` order, one batch at a time. Every
+batch is written with a single unordered ``bulk_write``, and the last
+``_id`` is checkpointed in the ``migrations`` collection. An interrupted
+run picks up after the last checkpoint. Each update is guarded on the old
+string value, so a document the running app rewrote in the meantime is
+left alone (it already holds a native date). Run it with::
+
+    python migrate_datetimes.py [--batch-size N] [--restart]
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+DATETIME_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "inventory": ("created_at", "updated_at", "last_used"),
+    "usage_logs": ("timestamp",),
+    "children": ("created_at", "updated_at"),
+}
+DEFAULT_BATCH_SIZE = 1000
+MIGRATION = "datetimes"
+
+
+def parse_datetime(value: str) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _updates(doc: dict, fields: Tuple[str, ...]) -> Tuple[Optional[UpdateOne], int]:
+    """Guarded update converting the string fields of ``doc``, and the number of unparseable values"""
+    guard, changes, invalid = {"_id": doc["_id"]}, {}, 0
+    for field in fields:
+        value = doc.get(field)
+        if not isinstance(value, str):
+            continue
+        parsed = parse_datetime(value)
+        if parsed is None:
+            invalid += 1
+            continue
+        guard[field] = value
+        changes[field] = parsed
+    if not changes:
+        return None, invalid
+    return UpdateOne(guard, {"$set": changes}), invalid
+
+
+async def migrate_collection(db, name: str, fields: Tuple[str, ...], batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
+    checkpoint_id = f"{MIGRATION}:{name}"
+    checkpoint = await db.migrations.find_one({"_id": checkpoint_id}) or {}
+    report = {"collection": name, "scanned": 0, "converted": 0, "invalid": 0, "resumed": "last_id" in checkpoint}
+    if checkpoint.get("done"):
+        report["done"] = True
+        return report
+
+    has_strings = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    projection = {field: 1 for field in fields}
+    last_id = checkpoint.get("last_id")
+    previously_converted = checkpoint.get("converted", 0)
+    while True:
+        query = dict(has_strings)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await db[name].find(query, projection).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        requests = []
+        for doc in batch:
+            update, invalid = _updates(doc, fields)
+            report["invalid"] += invalid
+            if update is not None:
+                requests.append(update)
+        if requests:
+            result = await db[name].bulk_write(requests, ordered=False)
+            report["converted"] += result.modified_count
+        report["scanned"] += len(batch)
+        last_id = batch[-1]["_id"]
+        await db.migrations.update_one(
+            {"_id": checkpoint_id},
+            {"$set": {"last_id": last_id, "converted": previously_converted + report["converted"],
+                      "updated_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        logger.info(f"{name}: {report['scanned']} scanned, {report['converted']} converted")
+
+    await db.migrations.update_one(
+        {"_id": checkpoint_id},
+        {"$set": {"done": True, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+    report["done"] = True
+    if report["invalid"]:
+        logger.warning(f"{name}: {report['invalid']} values could not be parsed and were left as strings")
+    return report
+
+
+async def migrate(db, batch_size: int = DEFAULT_BATCH_SIZE, restart: bool = False) -> list:
+    if restart:
+        await db.migrations.delete_many({"_id": {"$regex": f"^{MIGRATION}:"}})
+    return [await migrate_collection(db, name, fields, batch_size) for name, fields in DATETIME_FIELDS.items()]
+
+
+async def _main(argv) -> int:
+    import argparse
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    parser = argparse.ArgumentParser(description="Convert ISO-string dates to native BSON dates")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="ignore checkpoints and scan everything again")
+    args = parser.parse_args(argv)
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    try:
+        for report in await migrate(client[os.environ['DB_NAME']], args.batch_size, args.restart):
+            print(report)
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
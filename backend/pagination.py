@@ -0,0 +1,77 @@
+"""Keyset pagination, field projection and NDJSON streaming for list endpoints.
+
+Pages are ordered by ``(sort_field, id)`` descending and the cursor is the
+pair of values of the last document on the previous page, so fetching page
+N costs the same as fetching page 1 (no ``skip``).
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Optional, Tuple
+
+import orjson
+
+
+def encode_cursor(sort_value, item_id: str) -> str:
+    if isinstance(sort_value, datetime):
+        sort_value = {"$date": sort_value.isoformat()}
+    raw = json.dumps([sort_value, item_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[object, str]:
+    """Inverse of ``encode_cursor``; raises ValueError on a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, item_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if isinstance(sort_value, dict) and "$date" in sort_value:
+        sort_value = datetime.fromisoformat(sort_value["$date"])
+    return sort_value, item_id
+
+
+def keyset_filter(sort_field: str, cursor: Optional[str]) -> dict:
+    """Filter selecting the documents after ``cursor`` in descending order"""
+    if not cursor:
+        return {}
+    sort_value, item_id = decode_cursor(cursor)
+    return {"$or": [
+        {sort_field: {"$lt": sort_value}},
+        {sort_field: sort_value, "id": {"$lt": item_id}},
+    ]}
+
+
+def sort_spec(sort_field: str) -> list:
+    return [(sort_field, -1), ("id", -1)]
+
+
+def projection(fields: Optional[str], allowed: Iterable[str], sort_field: str):
+    """Return ``(mongo_projection, requested_fields)`` for a ``fields=`` parameter
+
+    ``id`` and the sort field are always fetched because the next cursor is
+    built from them; they are dropped from the output again if they weren't
+    asked for. Unknown field names raise ValueError.
+    """
+    if not fields:
+        return {"_id": 0}, None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = sorted(set(requested) - set(allowed))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    spec = {"_id": 0, "id": 1, sort_field: 1}
+    spec.update({f: 1 for f in requested})
+    return spec, requested
+
+
+def trim(doc: dict, requested: Optional[list]) -> dict:
+    if requested is None:
+        return doc
+    return {key: doc[key] for key in requested if key in doc}
+
+
+async def ndjson_lines(cursor, transform) -> AsyncIterator[bytes]:
+    """Yield one JSON document per line straight from a Motor cursor"""
+    async for doc in cursor:
+        yield orjson.dumps(transform(doc), option=orjson.OPT_APPEND_NEWLINE)
@@ -0,0 +1,149 @@
+"""Tiered cache for barcode product lookups.
+
+Repeat scans are served from an in-process LRU first, then from the
+``product_cache`` Mongo collection, and only go out to the upstream
+lookup services on a miss in both tiers. Negative results (``found=False``)
+are cached too, with a shorter TTL, so unknown barcodes don't hammer the
+upstream APIs either. A lookup that failed (the service errored, or its
+circuit breaker is open) is not an answer, so "not found" is only cached
+when every service actually answered.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from upstream import UpstreamLookupError
+
+logger = logging.getLogger(__name__)
+
+
+class ProductLookupCache:
+    """In-process LRU with TTL, backed by a Mongo collection"""
+
+    def __init__(self, collection, response_cls, max_size: int = 5000,
+                 ttl_seconds: int = 7 * 24 * 3600, negative_ttl_seconds: int = 6 * 3600):
+        self.collection = collection
+        self.response_cls = response_cls
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        # barcode -> (monotonic expiry, result dict)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _ttl_for(self, result) -> int:
+        return self.ttl_seconds if result.found else self.negative_ttl_seconds
+
+    def _remember(self, barcode: str, data: dict, ttl: float):
+        self._entries[barcode] = (time.monotonic() + ttl, data)
+        self._entries.move_to_end(barcode)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, barcode: str):
+        """Return the cached lookup result for a barcode, or None on a miss"""
+        entry = self._entries.get(barcode)
+        if entry is not None:
+            expires, data = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(barcode)
+                self.memory_hits += 1
+                return self.response_cls(**data)
+            del self._entries[barcode]
+            self.expirations += 1
+
+        try:
+            doc = await self.collection.find_one({"barcode": barcode})
+        except Exception as e:
+            logger.error(f"Product cache read error: {e}")
+            doc = None
+
+        if doc is not None:
+            expires_at = doc.get("expires_at")
+            if expires_at is not None and expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            remaining = (expires_at - datetime.now(timezone.utc)).total_seconds() if expires_at else 0
+            if remaining > 0:
+                self._remember(barcode, doc["result"], remaining)
+                self.store_hits += 1
+                return self.response_cls(**doc["result"])
+            self.expirations += 1
+
+        self.misses += 1
+        return None
+
+    async def set(self, barcode: str, result):
+        """Store a lookup result in both tiers"""
+        ttl = self._ttl_for(result)
+        data = result.dict()
+        self._remember(barcode, data, ttl)
+
+        now = datetime.now(timezone.utc)
+        try:
+            await self.collection.update_one(
+                {"barcode": barcode},
+                {"$set": {
+                    "barcode": barcode,
+                    "result": data,
+                    "found": result.found,
+                    "cached_at": now,
+                    "expires_at": now + timedelta(seconds=ttl),
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Product cache write error: {e}")
+
+    async def lookup(self, barcode: str, *sources: Callable[[str], Awaitable]):
+        """Cached result, or ask ``sources`` in order until one finds the product, and cache the answer"""
+        cached = await self.get(barcode)
+        if cached is not None:
+            return cached
+
+        result = self.response_cls(found=False)
+        answered = True
+        for source in sources:
+            try:
+                result = await source(barcode)
+            except UpstreamLookupError as e:
+                logger.error(str(e))
+                answered = False
+                continue
+            if result.found:
+                break
+
+        if answered or result.found:
+            await self.set(barcode, result)
+        return result
+
+    async def invalidate(self, barcode: Optional[str] = None):
+        """Drop one barcode, or everything when no barcode is given"""
+        if barcode is None:
+            self._entries.clear()
+            await self.collection.delete_many({})
+        else:
+            self._entries.pop(barcode, None)
+            await self.collection.delete_one({"barcode": barcode})
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.store_hits
+        total = hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "memory_hits": self.memory_hits,
+            "store_hits": self.store_hits,
+            "hits": hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,160 @@
+"""Usage log retention: compact, archive, then delete old raw logs.
+
+Logs older than the retention period are handled in three steps:
+
+1. The rollup buckets for that period are rebuilt from the raw logs, so
+   charts keep working once the raw documents are gone.
+2. The logs are appended to a gzip NDJSON archive file, a batch at a time,
+   and the file is fsynced.
+3. Each archived batch is then deleted by ``_id``.
+
+Memory stays bounded by the batch size. A crash between steps 2 and 3 only
+means the next run archives that batch again; nothing is deleted before it
+is on disk. Each household is handled on its own (its rollups are rebuilt
+from its logs only) and gets its own archive files.
+
+The periodic run in the server starts in every worker. Each run first
+takes a lease document in ``leases`` (``acquire_lease``), which stays
+held for the whole interval, so only one worker per interval archives
+and deletes. If the holder dies, the lease expires and another worker
+takes over on its next attempt. Run it by hand with::
+
+    python retention.py [--days N] [--archive-dir DIR] [--household ID] [--dry-run]
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import events
+import rollups
+import tenancy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_DAYS = 365
+DEFAULT_BATCH_SIZE = 1000
+LEASE_ID = "usage_log_retention"
+
+
+def cutoff_for(days: int, now: Optional[datetime] = None) -> datetime:
+    """Start of the day ``days`` ago; logs before it are expired"""
+    now = now or datetime.now(timezone.utc)
+    return rollups.bucket_start(now - timedelta(days=days), "day")
+
+
+async def run_retention(db, days: int = DEFAULT_RETENTION_DAYS, archive_dir: Path = Path("archives"),
+                        batch_size: int = DEFAULT_BATCH_SIZE, dry_run: bool = False) -> dict:
+    """Compact, archive and delete usage logs older than ``days`` days"""
+    cutoff = cutoff_for(days)
+    expired = {"timestamp": {"$lt": cutoff}}
+    count = await db.usage_logs.count_documents(expired)
+    report = {"cutoff": cutoff, "expired": count, "archived": 0, "deleted": 0, "archive": None}
+    if count == 0 or dry_run:
+        return report
+
+    # 1. Make sure the rollups cover everything that is about to disappear
+    await rollups.backfill(db, None, cutoff - timedelta(days=1))
+
+    archive_dir = Path(archive_dir)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    household = tenancy.household_of(db)
+    prefix = f"usage_logs-{household}" if household else "usage_logs"
+    archive_path = archive_dir / f"{prefix}-before-{cutoff.date().isoformat()}-{stamp}.ndjson.gz"
+    report["archive"] = str(archive_path)
+
+    # 2 + 3. Oldest first, one batch at a time: append to the archive, sync, then delete
+    with open(archive_path, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as archive:
+        while True:
+            batch = await db.usage_logs.find(expired).sort([("timestamp", 1), ("_id", 1)]).limit(batch_size).to_list(batch_size)
+            if not batch:
+                break
+            ids = []
+            for log in batch:
+                ids.append(log.pop("_id"))
+                archive.write((json.dumps(log, default=events.json_default) + "\n").encode())
+            archive.flush()
+            raw.flush()
+            os.fsync(raw.fileno())
+            report["archived"] += len(batch)
+
+            result = await db.usage_logs.delete_many({"_id": {"$in": ids}})
+            report["deleted"] += result.deleted_count
+
+    logger.info(f"Archived and deleted {report['deleted']} usage logs before {cutoff.date()} ({archive_path})")
+    return report
+
+
+async def acquire_lease(db, owner: str, seconds: float, now: Optional[datetime] = None) -> bool:
+    """Take the retention lease for ``seconds`` unless another owner holds one that hasn't expired"""
+    now = now or datetime.now(timezone.utc)
+    try:
+        lease = await db.leases.find_one_and_update(
+            {"_id": LEASE_ID, "$or": [{"expires_at": {"$lte": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "acquired_at": now, "expires_at": now + timedelta(seconds=seconds)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # The lease exists and is held by someone else, so the upsert collided with it
+        return False
+    return lease is not None and lease["owner"] == owner
+
+
+async def run_for_households(db, **settings) -> dict:
+    """Run retention for every household, one after the other"""
+    return {
+        household: await run_retention(tenancy.scoped(db, household), **settings)
+        for household in await tenancy.households(db)
+    }
+
+
+def retention_settings() -> dict:
+    return {
+        "days": int(os.environ.get('USAGE_LOG_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)),
+        "archive_dir": Path(os.environ.get('USAGE_LOG_ARCHIVE_DIR', Path(__file__).parent / 'archives')),
+        "batch_size": int(os.environ.get('USAGE_LOG_RETENTION_BATCH', DEFAULT_BATCH_SIZE)),
+    }
+
+
+async def _main(argv) -> int:
+    import argparse
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    settings = retention_settings()
+    parser = argparse.ArgumentParser(description="Archive and delete old usage logs")
+    parser.add_argument("--days", type=int, default=settings["days"])
+    parser.add_argument("--archive-dir", type=Path, default=settings["archive_dir"])
+    parser.add_argument("--batch-size", type=int, default=settings["batch_size"])
+    parser.add_argument("--household", help="only this household (default: all of them)")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    settings = {"days": args.days, "archive_dir": args.archive_dir, "batch_size": args.batch_size, "dry_run": args.dry_run}
+    try:
+        if args.household:
+            print(await run_retention(tenancy.scoped(db, args.household), **settings))
+        else:
+            print(await run_for_households(db, **settings))
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -0,0 +1,176 @@
+"""Hourly and daily usage rollups.
+
+Every usage log is also counted into ``usage_rollups`` buckets, per item
+and per category, at hour and day granularity. Charts read those few
+buckets instead of scanning the raw logs. Buckets are updated
+incrementally when usage is recorded. ``backfill`` rebuilds them from the
+raw logs, either for a time range or for everything that is still in
+``usage_logs``. Buckets belong to a household like the logs they count;
+the CLI rebuilds every household's::
+
+    python rollups.py backfill [FROM] [TO]     # ISO dates, optional
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+import tenancy
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("hour", "day")
+SCOPES = ("item", "category")
+
+_BUCKET_FORMATS = {"hour": "%Y-%m-%dT%H:00:00Z", "day": "%Y-%m-%dT00:00:00Z"}
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    timestamp = timestamp.astimezone(timezone.utc)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _bucket_updates(db, counts: Dict[tuple, list], upsert_op: str) -> List[UpdateOne]:
+    updates = []
+    for (granularity, scope, key, bucket), (quantity, events) in counts.items():
+        updates.append(db.usage_rollups.update_op(
+            {"granularity": granularity, "scope": scope, "key": key, "bucket": bucket},
+            {upsert_op: {"quantity": quantity, "events": events}},
+            upsert=True
+        ))
+    return updates
+
+
+def _count(counts: Dict[tuple, list], granularity: str, scope: str, key: str, bucket: datetime, quantity: int, events: int = 1):
+    entry = counts.setdefault((granularity, scope, key, bucket), [0, 0])
+    entry[0] += quantity
+    entry[1] += events
+
+
+async def record(db, logs: Iterable[dict], categories: Dict[str, str]):
+    """Add freshly inserted usage logs to their buckets with one bulk write
+
+    ``logs`` are usage log dicts with a datetime ``timestamp``;
+    ``categories`` maps item ids to their category.
+    """
+    counts: Dict[tuple, list] = {}
+    for log in logs:
+        category = categories.get(log["item_id"]) or "Other"
+        for granularity in GRANULARITIES:
+            bucket = bucket_start(log["timestamp"], granularity)
+            _count(counts, granularity, "item", log["item_id"], bucket, log["quantity_used"])
+            _count(counts, granularity, "category", category, bucket, log["quantity_used"])
+    if not counts:
+        return
+    try:
+        await db.usage_rollups.bulk_write(_bucket_updates(db, counts, "$inc"), ordered=False)
+    except Exception as e:
+        # The usage itself is recorded; a backfill over this period repairs the buckets
+        logger.error(f"Usage rollup update failed: {e}")
+
+
+async def backfill(db, start: Optional[datetime] = None, end: Optional[datetime] = None) -> dict:
+    """Rebuild the buckets between ``start`` and ``end`` from the raw logs
+
+    The range is widened to whole days. Without a ``start`` the rebuild
+    begins at the oldest raw log still present, so buckets for logs already
+    removed by retention are kept.
+    """
+    if start is None:
+        oldest = await db.usage_logs.find({}, {"timestamp": 1}).sort("timestamp", 1).limit(1).to_list(1)
+        if not oldest:
+            return {"buckets": 0, "logs": 0}
+        start = _as_datetime(oldest[0]["timestamp"])
+    start = bucket_start(start, "day")
+    end = bucket_start(end or datetime.now(timezone.utc), "day") + timedelta(days=1)
+
+    counts: Dict[tuple, list] = {}
+    logs = 0
+    for granularity in GRANULARITIES:
+        pipeline = [
+            {"$match": {"timestamp": {"$gte": start, "$lt": end}}},
+            # Joined within the household, so the (household_id, id) index serves the lookup
+            {"$lookup": {
+                "from": "inventory",
+                "let": {"household_id": "$household_id", "item_id": "$item_id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$and": [
+                        {"$eq": ["$household_id", "$$household_id"]},
+                        {"$eq": ["$id", "$$item_id"]},
+                    ]}}},
+                    {"$project": {"_id": 0, "category": 1}},
+                ],
+                "as": "item",
+            }},
+            {"$group": {
+                "_id": {
+                    "item_id": "$item_id",
+                    "category": {"$ifNull": [{"$arrayElemAt": ["$item.category", 0]}, "Other"]},
+                    "bucket": {"$dateToString": {"format": _BUCKET_FORMATS[granularity], "date": "$timestamp"}},
+                },
+                "quantity": {"$sum": "$quantity_used"},
+                "events": {"$sum": 1},
+            }},
+        ]
+        async for group in db.usage_logs.aggregate(pipeline):
+            bucket = datetime.fromisoformat(group["_id"]["bucket"].replace("Z", "+00:00"))
+            _count(counts, granularity, "item", group["_id"]["item_id"], bucket, group["quantity"], group["events"])
+            _count(counts, granularity, "category", group["_id"]["category"], bucket, group["quantity"], group["events"])
+            if granularity == "day":
+                logs += group["events"]
+
+    await db.usage_rollups.delete_many({"bucket": {"$gte": start, "$lt": end}})
+    updates = _bucket_updates(db, counts, "$set")
+    for offset in range(0, len(updates), 1000):
+        await db.usage_rollups.bulk_write(updates[offset:offset + 1000], ordered=False)
+    logger.info(f"Usage rollups rebuilt from {start.date()} to {end.date()}: {len(updates)} buckets from {logs} logs")
+    return {"from": start, "to": end, "buckets": len(updates), "logs": logs}
+
+
+async def query(db, granularity: str, start: datetime, end: datetime, scope: str = "category",
+                key: Optional[str] = None) -> List[dict]:
+    filters = {"granularity": granularity, "scope": scope, "bucket": {"$gte": start, "$lt": end}}
+    if key is not None:
+        filters["key"] = key
+    projection = {"_id": 0, "bucket": 1, "key": 1, "scope": 1, "quantity": 1, "events": 1}
+    return await db.usage_rollups.find(filters, projection).sort([("bucket", 1), ("key", 1)]).to_list(None)
+
+
+def _as_datetime(value) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+async def _main(argv) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    if argv[:1] != ["backfill"]:
+        print("usage: python rollups.py backfill [FROM] [TO]")
+        return 2
+    bounds = [_as_datetime(value) for value in argv[1:3]]
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        for household in await tenancy.households(db):
+            print(household, await backfill(tenancy.scoped(db, household), *bounds))
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
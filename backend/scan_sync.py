@@ -0,0 +1,144 @@
+"""Idempotent upload of offline scan queues.
+
+Clients that scan without connectivity queue their events locally and
+upload them later, possibly more than once. Each event carries a
+client-generated idempotency key. The keys are claimed by inserting into
+``scan_events``, which has a unique index on the key, so an event is only
+ever applied once however many times it is uploaded. New events are
+applied in timestamp order in one batch (see ``batch_ops``).
+
+An event only keeps its claim once it has a final outcome: applied, or
+rejected for good (unknown item, not enough stock). A ``conflict`` (the
+item changed concurrently) and a batch that raised release their claims
+at once, so the client's retry of the same event is applied instead of
+being answered as a duplicate. An event whose claim was recorded but whose
+batch never finished (e.g. the process died mid-request) stays
+``pending``. After ``STALE_CLAIM_SECONDS`` the next upload of that event
+takes the claim over and applies it.
+"""
+
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List
+
+from pymongo.errors import BulkWriteError
+
+import batch_ops
+
+PENDING = "pending"
+APPLIED = "applied"
+REJECTED = "rejected"
+STALE_CLAIM_SECONDS = 300
+# Outcomes that may turn out differently when the same event is sent again
+RETRYABLE = (batch_ops.CONFLICT,)
+
+
+async def _claim(db, events: List[dict], now: datetime, claim_token: str) -> set:
+    """Insert the idempotency keys and return the ones claimed by this upload"""
+    docs = [{
+        "idempotency_key": event["idempotency_key"],
+        "status": PENDING,
+        "claim_token": claim_token,
+        "claimed_at": now,
+        "received_at": now,
+        "event": event,
+    } for event in events]
+    claimed = {event["idempotency_key"] for event in events}
+    try:
+        await db.scan_events.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        duplicates = set()
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") != 11000:
+                raise
+            duplicates.add(docs[error["index"]]["idempotency_key"])
+        claimed -= duplicates
+
+        # Take over claims that were left pending by an upload that never finished
+        await db.scan_events.update_many(
+            {
+                "idempotency_key": {"$in": sorted(duplicates)},
+                "status": PENDING,
+                "claimed_at": {"$lt": now - timedelta(seconds=STALE_CLAIM_SECONDS)},
+            },
+            {"$set": {"claim_token": claim_token, "claimed_at": now}}
+        )
+        taken_over = db.scan_events.find(
+            {"idempotency_key": {"$in": sorted(duplicates)}, "claim_token": claim_token},
+            {"idempotency_key": 1}
+        )
+        claimed |= {doc["idempotency_key"] async for doc in taken_over}
+    return claimed
+
+
+async def _release(db, keys: List[str], claim_token: str):
+    """Drop this upload's claims so the events can be claimed again"""
+    await db.scan_events.delete_many({"idempotency_key": {"$in": keys}, "claim_token": claim_token})
+
+
+async def sync_events(db, events: List[dict], prepare: Callable[[dict], dict]) -> dict:
+    """Apply not-yet-seen scan events and return per-event results and stock levels"""
+    now = datetime.now(timezone.utc)
+
+    # Keep the first copy of a key repeated inside one upload, then replay in scan order
+    unique = {}
+    for event in events:
+        unique.setdefault(event["idempotency_key"], event)
+    ordered = sorted(unique.values(), key=lambda event: event["timestamp"])
+
+    claim_token = str(uuid.uuid4())
+    claimed = await _claim(db, ordered, now, claim_token) if ordered else set()
+    to_apply = [event for event in ordered if event["idempotency_key"] in claimed]
+
+    results = {}
+    stock_levels = {}
+    if to_apply:
+        try:
+            outcome = await batch_ops.apply_operations(db, to_apply, prepare, now=now)
+        except Exception:
+            # Nothing was applied (batch_ops undoes its stock changes), so a retry may claim them
+            await _release(db, [event["idempotency_key"] for event in to_apply], claim_token)
+            raise
+        stock_levels.update(outcome["stock_levels"])
+        updates = []
+        retryable = []
+        for event, result in zip(to_apply, outcome["results"]):
+            key = event["idempotency_key"]
+            result = {k: v for k, v in result.items() if k != "index"}
+            results[key] = {"idempotency_key": key, "duplicate": False, **result}
+            if result["status"] in RETRYABLE:
+                retryable.append(key)
+                continue
+            updates.append(db.scan_events.update_op(
+                {"idempotency_key": key},
+                {"$set": {
+                    "status": APPLIED if result["status"] == batch_ops.OK else REJECTED,
+                    "result": result,
+                    "applied_at": now,
+                }}
+            ))
+        if updates:
+            await db.scan_events.bulk_write(updates, ordered=False)
+        if retryable:
+            await _release(db, retryable, claim_token)
+
+    # Events uploaded before report what happened the first time
+    duplicate_keys = [event["idempotency_key"] for event in ordered if event["idempotency_key"] not in claimed]
+    if duplicate_keys:
+        async for doc in db.scan_events.find({"idempotency_key": {"$in": duplicate_keys}}):
+            previous = doc.get("result") or {"status": doc["status"]}
+            results[doc["idempotency_key"]] = {"idempotency_key": doc["idempotency_key"], "duplicate": True, **previous}
+
+    # Reconciled levels for every item the upload touched, as stored right now
+    item_ids = sorted({r["item_id"] for r in results.values() if r.get("item_id")})
+    if item_ids:
+        async for item in db.inventory.find({"id": {"$in": item_ids}}, {"_id": 0, "id": 1, "current_stock": 1}):
+            stock_levels[item["id"]] = item["current_stock"]
+
+    return {
+        "results": [results[event["idempotency_key"]] for event in ordered if event["idempotency_key"] in results],
+        "stock_levels": stock_levels,
+        "usage_logs": outcome["usage_logs"] if to_apply else [],
+        "categories": outcome["categories"] if to_apply else {},
+        "items": outcome["items"] if to_apply else {},
+    }
@@ -0,0 +1,52 @@
+"""Fast response path for list endpoints.
+
+Documents are read with a projection of exactly the model's fields (no
+``_id``, no internal bookkeeping fields) and handed to orjson as they come
+out of Motor. That skips building a Pydantic model per document and then
+having FastAPI validate and serialize it a second time for
+``response_model``. Model defaults are filled in for fields that older
+documents don't have, so the output shape is the same as before.
+"""
+
+from typing import Dict, Iterable, List, Type
+
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+_plans: Dict[type, tuple] = {}
+
+
+def _plan(model: Type[BaseModel]) -> tuple:
+    """Projection and static defaults for a model, computed once"""
+    plan = _plans.get(model)
+    if plan is None:
+        fields = model.model_fields
+        projection = {"_id": 0, **{name: 1 for name in fields}}
+        defaults = {
+            name: field.default
+            for name, field in fields.items()
+            if field.default_factory is None and not field.is_required()
+        }
+        plan = _plans[model] = (projection, defaults)
+    return plan
+
+
+def projection_for(model: Type[BaseModel]) -> dict:
+    return _plan(model)[0]
+
+
+def with_defaults(model: Type[BaseModel], doc: dict) -> dict:
+    defaults = _plan(model)[1]
+    return {**defaults, **doc} if defaults else doc
+
+
+def documents(model: Type[BaseModel], docs: Iterable[dict]) -> List[dict]:
+    """Fill model defaults into raw documents without validating them"""
+    defaults = _plan(model)[1]
+    if not defaults:
+        return list(docs)
+    return [{**defaults, **doc} for doc in docs]
+
+
+def fast_response(model: Type[BaseModel], docs: Iterable[dict], headers: dict = None) -> ORJSONResponse:
+    return ORJSONResponse(content=documents(model, docs), headers=headers)
@@ -1,23 +1,51 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import asyncio
 import os
 import logging
+import socket
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional, Union
 import uuid
-from datetime import datetime, timezone
-import aiohttp
+from datetime import datetime, timedelta, timezone
 import json
+import metrics
+import batch_ops
+import bulk_io
+from catalog_mirror import CatalogMirror, DEFAULT_PATH as DEFAULT_CATALOG_MIRROR_PATH
+from classifier import CategoryClassifier, DEFAULT_RULES_FILE
+import classifier
+import dashboard_stats
+import events
+from forecasting import ForecastEngine
+import growth
+from dashboard_stats import LOW_STOCK_EXPR
+from indexes import ensure_indexes, missing_indexes
+from item_cache import ItemCache
+import pagination
+from product_cache import ProductLookupCache
+import retention
+import rollups
+import scan_sync
+import serialization
+import tenancy
+import versions
+import write_buffer
+from upstream import CircuitBreaker, UpstreamClient, UpstreamLookupError
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# tz_aware: stored dates come back as UTC-aware datetimes, like the ones we write
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=[metrics.MongoCommandListener()])
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
@@ -26,22 +54,54 @@ app = FastAPI()
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Households (tenants): every per-household endpoint works on a view of the database
+# scoped to the household in the X-Household-ID header; see tenancy
+DEFAULT_HOUSEHOLD_ID = os.environ.get('DEFAULT_HOUSEHOLD_ID', tenancy.DEFAULT_HOUSEHOLD)
+REQUIRE_HOUSEHOLD_ID = os.environ.get('REQUIRE_HOUSEHOLD_ID', 'false').lower() == 'true'
+
+def _scoped_to(household_id: Optional[str], source: str) -> tenancy.TenantDatabase:
+    household_id = household_id or (None if REQUIRE_HOUSEHOLD_ID else DEFAULT_HOUSEHOLD_ID)
+    if household_id is None:
+        raise HTTPException(status_code=400, detail=f"{source} is required")
+    if not tenancy.valid_household_id(household_id):
+        raise HTTPException(status_code=400, detail=f"Invalid {source}")
+    return tenancy.scoped(db, household_id)
+
+def tenant_db(x_household_id: Optional[str] = Header(None)) -> tenancy.TenantDatabase:
+    """Database view scoped to the requesting household"""
+    return _scoped_to(x_household_id, f"{tenancy.HEADER} header")
+
+def event_stream_tenant_db(
+    household_id: Optional[str] = Query(None),
+    x_household_id: Optional[str] = Header(None)
+) -> tenancy.TenantDatabase:
+    """Like tenant_db, but also takes ?household_id=, since EventSource can't send headers"""
+    if household_id is not None:
+        return _scoped_to(household_id, "household_id parameter")
+    return tenant_db(x_household_id)
+
 # Utility functions for datetime handling
+DATETIME_FIELDS = ('created_at', 'updated_at', 'last_used', 'timestamp')
+
+def _as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
 def prepare_for_mongo(data):
-    """Convert datetime objects to ISO strings for MongoDB storage"""
+    """Normalize datetimes to UTC-aware values; they are stored as native BSON dates"""
     if isinstance(data, dict):
         for key, value in data.items():
             if isinstance(value, datetime):
-                data[key] = value.isoformat()
+                data[key] = _as_utc(value)
     return data
 
 def parse_from_mongo(item):
-    """Parse datetime strings back from MongoDB"""
+    """Parse datetime fields still stored as ISO strings (pre-migration documents)"""
     if isinstance(item, dict):
-        for key, value in item.items():
-            if isinstance(value, str) and key in ['created_at', 'updated_at', 'last_used']:
+        for key in DATETIME_FIELDS:
+            value = item.get(key)
+            if isinstance(value, str):
                 try:
-                    item[key] = datetime.fromisoformat(value)
+                    item[key] = _as_utc(datetime.fromisoformat(value.replace('Z', '+00:00')))
                 except ValueError:
                     pass
     return item
@@ -60,6 +120,7 @@ class InventoryItem(BaseModel):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     last_used: Optional[datetime] = None
+    household_id: Optional[str] = None  # set from the X-Household-ID header, never from the body
 
 class InventoryItemCreate(BaseModel):
     barcode: str
@@ -87,6 +148,7 @@ class UsageLog(BaseModel):
     quantity_used: int = 1
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     notes: Optional[str] = None
+    household_id: Optional[str] = None
 
 class UsageLogCreate(BaseModel):
     item_id: str
@@ -94,6 +156,58 @@ class UsageLogCreate(BaseModel):
     quantity_used: int = 1
     notes: Optional[str] = None
 
+class BatchOperation(BaseModel):
+    item_id: Optional[str] = None
+    barcode: Optional[str] = None
+    op: Literal["use", "restock"]
+    qty: int = Field(1, ge=1)
+    notes: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=1000)
+
+class BatchOperationResult(BaseModel):
+    index: int
+    op: str
+    qty: int
+    status: str  # ok, not_found, insufficient_stock, conflict
+    item_id: Optional[str] = None
+    barcode: Optional[str] = None
+    current_stock: Optional[int] = None
+    usage_log_id: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    batch_id: str
+    applied: int
+    failed: int
+    results: List[BatchOperationResult]
+
+class ScanEvent(BatchOperation):
+    idempotency_key: str = Field(..., min_length=1, max_length=200)
+    timestamp: datetime
+
+class ScanSyncRequest(BaseModel):
+    events: List[ScanEvent] = Field(..., max_length=5000)
+
+class ScanEventResult(BaseModel):
+    idempotency_key: str
+    duplicate: bool = False
+    status: str  # ok, not_found, insufficient_stock, conflict, or pending for an unfinished earlier upload
+    op: Optional[str] = None
+    qty: Optional[int] = None
+    item_id: Optional[str] = None
+    barcode: Optional[str] = None
+    current_stock: Optional[int] = None
+    usage_log_id: Optional[str] = None
+    error: Optional[str] = None
+
+class ScanSyncResponse(BaseModel):
+    applied: int
+    duplicates: int
+    results: List[ScanEventResult]
+    stock_levels: Dict[str, int]
+
 class Child(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
@@ -104,6 +218,7 @@ class Child(BaseModel):
     notes: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    household_id: Optional[str] = None
 
 class ChildCreate(BaseModel):
     name: str
@@ -121,6 +236,20 @@ class ChildUpdate(BaseModel):
     weight: Optional[float] = None
     notes: Optional[str] = None
 
+class GrowthMeasurement(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    child_id: str
+    measured_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    height: Optional[float] = None  # in cm
+    weight: Optional[float] = None  # in kg
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    household_id: Optional[str] = None
+
+class GrowthMeasurementCreate(BaseModel):
+    measured_at: Optional[datetime] = None
+    height: Optional[float] = Field(None, gt=0)
+    weight: Optional[float] = Field(None, gt=0)
+
 class ProductLookupResponse(BaseModel):
     found: bool
     product_name: Optional[str] = None
@@ -128,28 +257,129 @@ class ProductLookupResponse(BaseModel):
     category: Optional[str] = None
     size: Optional[str] = None
 
+class CategoryRule(BaseModel):
+    category: str
+    priority: int = 100  # lower wins when several categories match
+    keywords: Union[Dict[str, List[str]], List[str]]  # {language: [...]} or a flat list
+    enabled: bool = True  # False hides a category defined in the rules file
+
+# Barcode lookup cache (in-process LRU backed by the product_cache collection)
+product_cache = ProductLookupCache(
+    db.product_cache,
+    ProductLookupResponse,
+    max_size=int(os.environ.get('PRODUCT_CACHE_SIZE', 5000)),
+    ttl_seconds=int(os.environ.get('PRODUCT_CACHE_TTL', 7 * 24 * 3600)),
+    negative_ttl_seconds=int(os.environ.get('PRODUCT_CACHE_NEGATIVE_TTL', 6 * 3600)),
+)
+
+# Inventory documents by id and barcode for the scan paths. Other workers' writes only reach
+# it through the change stream, so it is off unless EVENTS_SOURCE=change_stream or ITEM_CACHE_SIZE
+# is set (e.g. for a single worker); ITEM_CACHE_SIZE=0 always turns it off
+EVENTS_SOURCE = os.environ.get('EVENTS_SOURCE', 'local')
+item_cache = ItemCache(
+    max_size=int(os.environ.get('ITEM_CACHE_SIZE', 10000 if EVENTS_SOURCE == 'change_stream' else 0)),
+    ttl_seconds=float(os.environ.get('ITEM_CACHE_TTL', 60)),
+)
+
+# Local product catalog built from a data dump (python catalog_mirror.py import ...); optional
+catalog_mirror = CatalogMirror(Path(os.environ.get('CATALOG_MIRROR_PATH', DEFAULT_CATALOG_MIRROR_PATH)))
+
+# Stock change deltas pushed to SSE clients
+event_broker = events.EventBroker(queue_size=int(os.environ.get('EVENTS_QUEUE_SIZE', 256)))
+
+# Product category rules (rules file + category_rules overrides), reloaded when either changes
+category_classifier = CategoryClassifier(
+    Path(os.environ.get('CATEGORY_RULES_FILE', DEFAULT_RULES_FILE)),
+    check_interval=float(os.environ.get('CATEGORY_RULES_CHECK_INTERVAL', 10.0)),
+)
+
+# Burn-rate forecasts over usage_logs, recomputed only for items with new usage; other
+# workers' usage shows up within FORECAST_CACHE_TTL seconds
+forecast_engine = ForecastEngine(
+    ttl_seconds=float(os.environ.get('FORECAST_CACHE_TTL', 60)),
+    max_households=int(os.environ.get('FORECAST_CACHE_HOUSEHOLDS', 1000)),
+)
+
+# WHO growth reference tables, loaded once (see growth.py for where to get them); optional
+growth_standards = growth.GrowthStandards.load(Path(os.environ.get('GROWTH_TABLES_DIR', growth.DEFAULT_DIR)))
+
+def _by_household(logs: List[dict]) -> Dict[str, List[dict]]:
+    # A batch mixes households; every log carries its own
+    grouped: Dict[str, List[dict]] = {}
+    for log in logs:
+        grouped.setdefault(log["household_id"], []).append(log)
+    return grouped
+
+async def _usage_logs_flushed(logs: List[dict], categories: Dict[str, Optional[str]]):
+    for household_id, household_logs in _by_household(logs).items():
+        await rollups.record(tenancy.scoped(db, household_id), household_logs, categories)
+        forecast_engine.invalidate(household_id, (log["item_id"] for log in household_logs))
+
+async def _usage_logs_lost(logs: List[dict], error: Optional[Exception]):
+    # The requests were answered already; give the stock back as use_item does when its insert fails
+    for household_id, household_logs in _by_household(logs).items():
+        tenant = tenancy.scoped(db, household_id)
+        quantities: Dict[str, int] = {}
+        for log in household_logs:
+            quantities[log["item_id"]] = quantities.get(log["item_id"], 0) + log["quantity_used"]
+        await tenant.inventory.bulk_write(
+            [tenant.inventory.update_op({"id": item_id}, {"$inc": {"current_stock": quantity}}) for item_id, quantity in quantities.items()],
+            ordered=False
+        )
+        item_cache.invalidate(household_id, quantities)
+        await dashboard_stats.reconcile(tenant)
+        await versions.bump(tenant, "inventory")
+        event_broker.publish("resync", {}, household_id=household_id)
+
+# Usage-log writes: sync (one insert per use), group (batched, the request waits for its batch)
+# or async (batched write-behind, queued logs are lost if the process dies); see write_buffer
+USAGE_LOG_DURABILITY = os.environ.get('USAGE_LOG_DURABILITY', write_buffer.SYNC)
+usage_log_buffer = None if USAGE_LOG_DURABILITY == write_buffer.SYNC else write_buffer.UsageLogBuffer(
+    db.usage_logs,
+    mode=USAGE_LOG_DURABILITY,
+    max_batch=int(os.environ.get('USAGE_LOG_BATCH_SIZE', 100)),
+    max_delay=float(os.environ.get('USAGE_LOG_FLUSH_MS', 20)) / 1000,
+    max_pending=int(os.environ.get('USAGE_LOG_MAX_PENDING', 10000)),
+    after_flush=_usage_logs_flushed,
+    on_failure=_usage_logs_lost,
+)
+
+# Shared pooled client for Open Food Facts (opened on startup, closed on shutdown)
+openfoodfacts_client = UpstreamClient(
+    "OpenFoodFacts",
+    timeout=float(os.environ.get('UPSTREAM_TIMEOUT', 3.0)),
+    connect_timeout=float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 1.0)),
+    limit_per_host=int(os.environ.get('UPSTREAM_POOL_SIZE', 10)),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.environ.get('UPSTREAM_BREAKER_THRESHOLD', 5)),
+        reset_timeout=float(os.environ.get('UPSTREAM_BREAKER_RESET', 30.0)),
+    ),
+)
+
 # Product lookup functions
+async def _fetch_openfoodfacts(barcode: str) -> ProductLookupResponse:
+    url = f"https://world.openfoodfacts.org/api/v0/product/{barcode}.json"
+    status, data = await openfoodfacts_client.get_json(url)
+    if status == 404:
+        return ProductLookupResponse(found=False)
+    if status != 200 or not isinstance(data, dict):
+        raise UpstreamLookupError(f"OpenFoodFacts returned HTTP {status}")
+    if data.get('status') == 1 and 'product' in data:
+        product = data['product']
+        await category_classifier.refresh(db)
+        return ProductLookupResponse(
+            found=True,
+            product_name=product.get('product_name', ''),
+            brand=product.get('brands', ''),
+            category=classify_baby_category(product.get('categories', '')),
+            size=product.get('quantity', '')
+        )
+    return ProductLookupResponse(found=False)
+
 async def lookup_product_openfoodfacts(barcode: str) -> ProductLookupResponse:
     """Lookup product information from Open Food Facts API"""
-    try:
-        url = f"https://world.openfoodfacts.org/api/v0/product/{barcode}.json"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get('status') == 1 and 'product' in data:
-                        product = data['product']
-                        return ProductLookupResponse(
-                            found=True,
-                            product_name=product.get('product_name', ''),
-                            brand=product.get('brands', ''),
-                            category=classify_baby_category(product.get('categories', '')),
-                            size=product.get('quantity', '')
-                        )
-    except Exception as e:
-        logging.error(f"OpenFoodFacts lookup error: {e}")
-    
-    return ProductLookupResponse(found=False)
+    # Concurrent scans of the same barcode share one upstream request
+    return await openfoodfacts_client.coalesce(barcode, lambda: _fetch_openfoodfacts(barcode))
 
 async def lookup_product_upc(barcode: str) -> ProductLookupResponse:
     """Fallback lookup using UPC database (you would need an API key for a real service)"""
@@ -161,20 +391,7 @@ async def lookup_product_upc(barcode: str) -> ProductLookupResponse:
 
 def classify_baby_category(categories_str: str) -> str:
     """Classify product into baby-related categories based on category string"""
-    categories_lower = categories_str.lower()
-    
-    if any(word in categories_lower for word in ['diaper', 'nappy', 'pampers']):
-        return 'Diapers'
-    elif any(word in categories_lower for word in ['wipe', 'wet wipe', 'baby wipe']):
-        return 'Wet Wipes'
-    elif any(word in categories_lower for word in ['formula', 'milk', 'baby food', 'infant']):
-        return 'Food & Formula'
-    elif any(word in categories_lower for word in ['lotion', 'cream', 'shampoo', 'soap']):
-        return 'Bath & Care'
-    elif any(word in categories_lower for word in ['medicine', 'vitamin', 'supplement']):
-        return 'Medicine & Health'
-    else:
-        return 'Other'
+    return category_classifier.classify(categories_str)
 
 # API Routes
 @api_router.get("/")
@@ -184,75 +401,198 @@ async def root():
 @api_router.post("/products/lookup/{barcode}", response_model=ProductLookupResponse)
 async def lookup_product(barcode: str):
     """Lookup product information by barcode"""
-    # Try Open Food Facts first
-    result = await lookup_product_openfoodfacts(barcode)
+    # The local mirror answers most scans without a cache or network round-trip
+    mirrored = catalog_mirror.get(barcode)
+    if mirrored is not None:
+        await category_classifier.refresh(db)
+        return ProductLookupResponse(
+            found=True,
+            product_name=mirrored['product_name'],
+            brand=mirrored['brand'],
+            category=classify_baby_category(mirrored['categories']),
+            size=mirrored['size']
+        )
     
-    # If not found, try other services
-    if not result.found:
-        result = await lookup_product_upc(barcode)
-    
-    return result
+    # Open Food Facts first, then the other services; only answers are cached
+    return await product_cache.lookup(barcode, lookup_product_openfoodfacts, lookup_product_upc)
+
+@api_router.get("/products/cache/stats")
+async def get_product_cache_stats():
+    """Get barcode lookup cache counters"""
+    return product_cache.stats()
+
+@api_router.get("/products/catalog/stats")
+async def get_catalog_mirror_stats():
+    """Get local catalog mirror status and hit counters"""
+    return catalog_mirror.stats()
+
+@api_router.get("/products/upstream/stats")
+async def get_upstream_stats():
+    """Get upstream lookup client and circuit breaker state"""
+    return openfoodfacts_client.stats()
 
 @api_router.post("/inventory", response_model=InventoryItem)
-async def create_inventory_item(item: InventoryItemCreate):
+async def create_inventory_item(item: InventoryItemCreate, tenant: tenancy.TenantDatabase = Depends(tenant_db)):
     """Create a new inventory item"""
-    # Check if item with this barcode already exists
-    existing = await db.inventory.find_one({"barcode": item.barcode})
-    if existing:
-        raise HTTPException(status_code=400, detail="Item with this barcode already exists")
-    
     item_dict = item.dict()
-    inventory_item = InventoryItem(**item_dict)
+    inventory_item = InventoryItem(**item_dict, household_id=tenant.household_id)
     
-    # Prepare for MongoDB storage
+    # Prepare for MongoDB storage; the unique barcode index rejects duplicates
     item_to_store = prepare_for_mongo(inventory_item.dict())
-    await db.inventory.insert_one(item_to_store)
+    try:
+        await tenant.inventory.insert_one(item_to_store)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Item with this barcode already exists")
+    item_cache.put(item_to_store)
+    await dashboard_stats.record_change(tenant, None, item_to_store)
+    await versions.bump(tenant, "inventory")
+    event_broker.publish("item_created", events.item_payload(item_to_store), household_id=tenant.household_id)
     
     return inventory_item
 
+async def conditional_get(tenant: tenancy.TenantDatabase, request: Request, response: Response,
+                          name: str) -> Optional[Response]:
+    """Return a 304 response if the client's copy is current, otherwise set the ETag"""
+    etag = await versions.etag_for(tenant, name, request)
+    if versions.matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache", "Vary": versions.VARY})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Vary"] = versions.VARY
+    return None
+
+async def list_documents(collection, model, sort_field: str, response: Response,
+                         limit: Optional[int] = None, cursor: Optional[str] = None,
+                         fields: Optional[str] = None, stream: bool = False):
+    """Shared keyset-paginated / projected / streamed listing for a collection"""
+    try:
+        spec, requested = pagination.projection(fields, model.model_fields, sort_field)
+        query = pagination.keyset_filter(sort_field, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if requested is None:
+        spec = serialization.projection_for(model)
+    
+    paged = limit is not None or cursor is not None
+    docs = collection.find(query, spec)
+    if paged:
+        docs = docs.sort(pagination.sort_spec(sort_field))
+    
+    if stream:
+        # Documents go from the Motor cursor to the client without building a list
+        if limit is not None:
+            docs = docs.limit(limit)
+        return StreamingResponse(
+            pagination.ndjson_lines(
+                docs,
+                lambda doc: pagination.trim(doc, requested) if requested is not None else serialization.with_defaults(model, doc)
+            ),
+            media_type="application/x-ndjson",
+            headers=dict(response.headers)
+        )
+    
+    if paged:
+        # One extra document tells us whether there is a next page
+        page = await docs.limit(limit + 1).to_list(limit + 1) if limit is not None else await docs.to_list(None)
+        if limit is not None and len(page) > limit:
+            page = page[:limit]
+            last = page[-1]
+            response.headers["X-Next-Cursor"] = pagination.encode_cursor(last.get(sort_field), last["id"])
+    else:
+        page = await docs.to_list(None)
+    
+    # Raw documents go straight to orjson; no per-document model validation
+    if requested is not None:
+        return ORJSONResponse(content=[pagination.trim(doc, requested) for doc in page], headers=dict(response.headers))
+    return serialization.fast_response(model, page, dict(response.headers))
+
 @api_router.get("/inventory", response_model=List[InventoryItem])
-async def get_inventory():
-    """Get all inventory items"""
-    items = await db.inventory.find().to_list(1000)
-    return [InventoryItem(**parse_from_mongo(item)) for item in items]
+async def get_inventory(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    stream: bool = False,
+    tenant: tenancy.TenantDatabase = Depends(tenant_db)
+):
+    """Get inventory items, optionally paginated, projected or streamed as NDJSON"""
+    not_modified = await conditional_get(tenant, request, response, "inventory")
+    if not_modified:
+        return not_modified
+    
+    # Without limit/cursor the whole collection is returned, as before (but no longer capped)
+    return await list_documents(tenant.inventory, InventoryItem, "updated_at", response, limit, cursor, fields, stream)
 
 @api_router.get("/inventory/low-stock")
-async def get_low_stock_items():
+async def get_low_stock_items(tenant: tenancy.TenantDatabase = Depends(tenant_db)):
     """Get items that are below their minimum stock alert level"""
-    # Using a simple approach since $expr might not be supported in older MongoDB versions
-    all_items = await db.inventory.find().to_list(1000)
-    low_stock_items = []
-    
-    for item in all_items:
-        if item.get('current_stock', 0) <= item.get('min_stock_alert', 5):
-            low_stock_items.append(item)
-    
-    return [InventoryItem(**parse_from_mongo(item)) for item in low_stock_items]
+    # Filtered in the database so only matching documents come back
+    items = await tenant.inventory.find({"$expr": LOW_STOCK_EXPR}, serialization.projection_for(InventoryItem)).to_list(None)
+    return serialization.fast_response(InventoryItem, items)
+
+@api_router.get("/inventory/forecast")
+async def get_inventory_forecast(
+    window_days: int = Query(14, ge=1, le=90),
+    item_id: Optional[List[str]] = Query(None),
+    tenant: tenancy.TenantDatabase = Depends(tenant_db)
+):
+    """Get daily burn rates and days until empty, soonest to run out first"""
+    return await forecast_engine.forecast(tenant, window_days, item_id)
+
+@api_router.get("/inventory/export")
+async def export_inventory(
+    format: Literal["csv", "ndjson"] = "csv",
+    tenant: tenancy.TenantDatabase = Depends(tenant_db)
+):
+    """Stream the whole inventory as CSV or NDJSON without buffering it"""
+    docs = tenant.inventory.find({}, serialization.projection_for(InventoryItem)).sort("barcode", 1)
+    if format == "csv":
+        lines = bulk_io.csv_lines(docs, list(InventoryItem.model_fields))
+    else:
+        lines = pagination.ndjson_lines(docs, lambda doc: serialization.with_defaults(InventoryItem, doc))
+    return StreamingResponse(
+        lines,
+        media_type=bulk_io.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{bulk_io.export_filename(format)}"'}
+    )
 
 @api_router.get("/inventory/{item_id}", response_model=InventoryItem)
-async def get_inventory_item(item_id: str):
+async def get_inventory_item(item_id: str, tenant: tenancy.TenantDatabase = Depends(tenant_db)):
     """Get a specific inventory item"""
-    item = await db.inventory.find_one({"id": item_id})
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
+    item = item_cache.get_by_id(tenant.household_id, item_id)
+    if item is None:
+        generation = item_cache.generation
+        item = await tenant.inventory.find_one({"id": item_id})
+        if not item:
+            raise HTTPException(status_code=404, detail="Item not found")
+        item_cache.put(item, generation)
     return InventoryItem(**parse_from_mongo(item))
 
+@api_router.get("/inventory/cache/stats")
+async def get_item_cache_stats():
+    """Get inventory item cache counters"""
+    return item_cache.stats()
+
 @api_router.get("/inventory/barcode/{barcode}", response_model=InventoryItem)
-async def get_inventory_by_barcode(barcode: str):
+async def get_inventory_by_barcode(barcode: str, tenant: tenancy.TenantDatabase = Depends(tenant_db)):
     """Get inventory item by barcode"""
-    item = await db.inventory.find_one({"barcode": barcode})
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
+    item = item_cache.get_by_barcode(tenant.household_id, barcode)
+    if item is None:
+        generation = item_cache.generation
+        item = await tenant.inventory.find_one({"barcode": barcode})
+        if not item:
+            raise HTTPException(status_code=404, detail="Item not found")
+        item_cache.put(item, generation)
     return InventoryItem(**parse_from_mongo(item))
 
 @api_router.put("/inventory/{item_id}", response_model=InventoryItem)
-async def update_inventory_item(item_id: str, update_data: InventoryItemUpdate):
+async def update_inventory_item(
+    item_id: str,
+    update_data: InventoryItemUpdate,
+    tenant: tenancy.TenantDatabase = Depends(tenant_db)
+):
     """Update an inventory item"""
-    # Get existing item
-    existing_item = await db.inventory.find_one({"id": item_id})
-    if not existing_item:
-        raise HTTPException(status_code=404, detail="Item not found")
-    
     # Update fields
     update_dict = {k: v for k, v in update_data.dict().items() if v is not None}
     update_dict['updated_at'] = datetime.now(timezone.utc)
@@ -260,117 +600,363 @@ async def update_inventory_item(item_id: str, update_data: InventoryItemUpdate):
     # Prepare for MongoDB
     update_dict = prepare_for_mongo(update_dict)
     
-    await db.inventory.update_one(
+    # One round-trip; the previous version is needed to adjust the dashboard counters
+    existing_item = await tenant.inventory.find_one_and_update(
         {"id": item_id},
-        {"$set": update_dict}
+        {"$set": update_dict},
+        return_document=ReturnDocument.BEFORE
     )
+    if not existing_item:
+        raise HTTPException(status_code=404, detail="Item not found")
+    
+    updated_item = {**existing_item, **update_dict}
+    item_cache.put(updated_item)
+    await dashboard_stats.record_change(tenant, existing_item, updated_item)
+    await versions.bump(tenant, "inventory")
+    event_broker.publish("item_updated", events.item_payload(updated_item), household_id=tenant.household_id)
     
     # Return updated item
-    updated_item = await db.inventory.find_one({"id": item_id})
     return InventoryItem(**parse_from_mongo(updated_item))
 
 @api_router.post("/inventory/{item_id}/add-stock")
-async def add_stock(item_id: str, quantity: int):
+async def add_stock(item_id: str, quantity: int, tenant: tenancy.TenantDatabase = Depends(tenant_db)):
     """Add stock to an inventory item"""
-    item = await db.inventory.find_one({"id": item_id})
+    # Single atomic round-trip; concurrent restocks can't overwrite each other
+    item = await tenant.inventory.find_one_and_update(
+        {"id": item_id},
+        {
+            "$inc": {"current_stock": quantity},
+            "$set": prepare_for_mongo({'updated_at': datetime.now(timezone.utc)})
+        },
+        return_document=ReturnDocument.AFTER
+    )
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
-    new_stock = item['current_stock'] + quantity
-    update_data = {
-        'current_stock': new_stock,
-        'updated_at': datetime.now(timezone.utc)
-    }
-    
-    await db.inventory.update_one(
-        {"id": item_id},
-        {"$set": prepare_for_mongo(update_data)}
-    )
+    item_cache.put(item)
+    previous = {**item, 'current_stock': item['current_stock'] - quantity}
+    await dashboard_stats.record_change(tenant, previous, item)
+    await versions.bump(tenant, "inventory")
+    event_broker.publish("stock", events.stock_delta(item), household_id=tenant.household_id)
     
-    return {"message": f"Added {quantity} units. New stock: {new_stock}"}
+    return {"message": f"Added {quantity} units. New stock: {item['current_stock']}"}
 
 @api_router.post("/inventory/{item_id}/use", response_model=UsageLog)
-async def use_item(item_id: str, usage_data: UsageLogCreate):
+async def use_item(item_id: str, usage_data: UsageLogCreate, tenant: tenancy.TenantDatabase = Depends(tenant_db)):
     """Record usage of an inventory item"""
-    item = await db.inventory.find_one({"id": item_id})
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
+    now = datetime.now(timezone.utc)
     
-    if item['current_stock'] < usage_data.quantity_used:
+    # Decrement only if enough stock is left, in the same operation as the check
+    item = await tenant.inventory.find_one_and_update(
+        {"id": item_id, "current_stock": {"$gte": usage_data.quantity_used}},
+        {
+            "$inc": {"current_stock": -usage_data.quantity_used},
+            "$set": prepare_for_mongo({'updated_at': now, 'last_used': now})
+        },
+        return_document=ReturnDocument.AFTER
+    )
+    if not item:
+        # Only the failure path pays for the extra lookup to pick the right error
+        cached = item_cache.get_by_id(tenant.household_id, item_id)
+        if cached is None and await tenant.inventory.count_documents({"id": item_id}, limit=1) == 0:
+            raise HTTPException(status_code=404, detail="Item not found")
         raise HTTPException(status_code=400, detail="Insufficient stock")
     
-    # Create usage log
-    usage_log = UsageLog(**usage_data.dict())
-    await db.usage_logs.insert_one(prepare_for_mongo(usage_log.dict()))
+    item_cache.put(item)
+    previous = {**item, 'current_stock': item['current_stock'] + usage_data.quantity_used}
     
-    # Update inventory stock
-    new_stock = item['current_stock'] - usage_data.quantity_used
-    update_data = {
-        'current_stock': new_stock,
-        'updated_at': datetime.now(timezone.utc),
-        'last_used': datetime.now(timezone.utc)
-    }
+    # Create usage log; the counter update doesn't depend on it and goes out alongside
+    usage_log = UsageLog(**usage_data.dict(), timestamp=now, household_id=tenant.household_id)
+    if usage_log_buffer is None:
+        log_write = tenant.usage_logs.insert_one(prepare_for_mongo(usage_log.dict()))
+    else:
+        # Rollups and forecasts are updated per batch once it is written
+        log_write = usage_log_buffer.add(prepare_for_mongo(usage_log.dict()), item.get('category'))
+    try:
+        # record_change logs its own failures, so an exception here is the log write's
+        await asyncio.gather(dashboard_stats.record_change(tenant, previous, item), log_write)
+    except Exception:
+        # Give the stock back so the decrement and the log stay together
+        await tenant.inventory.update_one(
+            {"id": item_id},
+            {"$inc": {"current_stock": usage_data.quantity_used}}
+        )
+        item_cache.invalidate(tenant.household_id, [item_id])
+        await dashboard_stats.record_change(tenant, item, previous)
+        raise
+    # The version goes last, after the writes its ETags cover; rollups aren't among them
+    if usage_log_buffer is None:
+        await asyncio.gather(
+            rollups.record(tenant, [usage_log.dict()], {item_id: item.get('category')}),
+            versions.bump(tenant, "inventory")
+        )
+        forecast_engine.invalidate(tenant.household_id, [item_id])
+    else:
+        await versions.bump(tenant, "inventory")
+    event_broker.publish("stock", events.stock_delta(item), household_id=tenant.household_id)
     
-    await db.inventory.update_one(
-        {"id": item_id},
-        {"$set": prepare_for_mongo(update_data)}
+    return usage_log
+
+@api_router.post("/inventory/batch", response_model=BatchResponse)
+async def batch_inventory_operations(batch: BatchRequest, tenant: tenancy.TenantDatabase = Depends(tenant_db)):
+    """Apply many use/restock scans in one request"""
+    for index, op in enumerate(batch.operations):
+        if not op.item_id and not op.barcode:
+            raise HTTPException(status_code=400, detail=f"Operation {index} needs an item_id or a barcode")
+    
+    outcome = await batch_ops.apply_operations(tenant, [op.dict() for op in batch.operations], prepare_for_mongo)
+    # Stock and counters are written by now; the rollups and the version bump are independent
+    post_write = [rollups.record(tenant, outcome["usage_logs"], outcome["categories"])]
+    if outcome["items"]:
+        post_write.append(versions.bump(tenant, "inventory"))
+    await asyncio.gather(*post_write)
+    forecast_engine.invalidate(tenant.household_id, (log["item_id"] for log in outcome["usage_logs"]))
+    item_cache.invalidate(tenant.household_id, outcome["items"])
+    for item in outcome["items"].values():
+        event_broker.publish("stock", events.stock_delta(item), household_id=tenant.household_id)
+    results = outcome["results"]
+    applied = sum(1 for result in results if result["status"] == batch_ops.OK)
+    
+    return BatchResponse(
+        batch_id=outcome["batch_id"],
+        applied=applied,
+        failed=len(results) - applied,
+        results=results
+    )
+
+def classify_new_item(text: str) -> Optional[str]:
+    category = category_classifier.classify(text)
+    return None if category == category_classifier.default_category else category
+
+@api_router.post("/inventory/reclassify")
+async def reclassify_inventory(
+    overwrite: bool = False,
+    dry_run: bool = False,
+    tenant: tenancy.TenantDatabase = Depends(tenant_db)
+):
+    """Re-run the category rules over every item's name and brand"""
+    await category_classifier.refresh(db)
+    report = await classifier.reclassify_inventory(tenant, category_classifier, overwrite=overwrite, dry_run=dry_run)
+    if report["changed"] and not dry_run:
+        await dashboard_stats.reconcile(tenant)
+        item_cache.clear()
+        await versions.bump(tenant, "inventory")
+        event_broker.publish("resync", {}, household_id=tenant.household_id)
+    return report
+
+@api_router.post("/inventory/import")
+async def import_inventory(
+    request: Request,
+    format: Optional[Literal["csv", "ndjson"]] = None,
+    dry_run: bool = False,
+    tenant: tenancy.TenantDatabase = Depends(tenant_db)
+):
+    """Upsert inventory items by barcode from a streamed CSV or NDJSON body"""
+    fmt = format or bulk_io.format_for(request.headers.get("content-type"))
+    await category_classifier.refresh(db)
+    # Parsed and written in chunks as the body arrives; see bulk_io
+    report = await bulk_io.import_items(
+        tenant, bulk_io.records(request.stream(), fmt), InventoryItemCreate, prepare_for_mongo, dry_run=dry_run,
+        classify=classify_new_item
     )
+    if report["aborted"] and not report["rows"]:
+        raise HTTPException(status_code=400, detail=report["aborted"])
     
-    return usage_log
+    if report["inserted"] or report["updated"]:
+        # Too many changes to diff; rebuild the counters and tell clients to refetch
+        await dashboard_stats.reconcile(tenant)
+        item_cache.clear()
+        await versions.bump(tenant, "inventory")
+        event_broker.publish("resync", {}, household_id=tenant.household_id)
+    return {"format": fmt, **report}
+
+@api_router.post("/sync/scans", response_model=ScanSyncResponse)
+async def sync_scan_events(sync: ScanSyncRequest, tenant: tenancy.TenantDatabase = Depends(tenant_db)):
+    """Apply a queue of offline scan events exactly once per idempotency key"""
+    queued = []
+    for index, event in enumerate(sync.events):
+        if not event.item_id and not event.barcode:
+            raise HTTPException(status_code=400, detail=f"Event {index} needs an item_id or a barcode")
+        event_dict = event.dict()
+        if event_dict['timestamp'].tzinfo is None:
+            event_dict['timestamp'] = event_dict['timestamp'].replace(tzinfo=timezone.utc)
+        queued.append(event_dict)
+    
+    outcome = await scan_sync.sync_events(tenant, queued, prepare_for_mongo)
+    # Stock and counters are written by now; the rollups and the version bump are independent
+    post_write = [rollups.record(tenant, outcome["usage_logs"], outcome["categories"])]
+    if outcome["items"]:
+        post_write.append(versions.bump(tenant, "inventory"))
+    await asyncio.gather(*post_write)
+    forecast_engine.invalidate(tenant.household_id, (log["item_id"] for log in outcome["usage_logs"]))
+    item_cache.invalidate(tenant.household_id, outcome["items"])
+    for item in outcome["items"].values():
+        event_broker.publish("stock", events.stock_delta(item), household_id=tenant.household_id)
+    results = outcome["results"]
+    
+    return ScanSyncResponse(
+        applied=sum(1 for r in results if not r["duplicate"] and r["status"] == batch_ops.OK),
+        duplicates=sum(1 for r in results if r["duplicate"]),
+        results=results,
+        stock_levels=outcome["stock_levels"]
+    )
 
 @api_router.get("/usage-logs", response_model=List[UsageLog])
-async def get_usage_logs(limit: int = 100):
-    """Get usage logs"""
-    logs = await db.usage_logs.find().sort("timestamp", -1).limit(limit).to_list(limit)
-    return [UsageLog(**parse_from_mongo(log)) for log in logs]
+async def get_usage_logs(
+    response: Response,
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    stream: bool = False,
+    tenant: tenancy.TenantDatabase = Depends(tenant_db)
+):
+    """Get usage logs, newest first; follow X-Next-Cursor to page further back"""
+    return await list_documents(tenant.usage_logs, UsageLog, "timestamp", response, limit, cursor, fields, stream)
+
+@api_router.get("/usage/rollups")
+async def get_usage_rollups(
+    granularity: Literal["hour", "day"] = "day",
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    scope: Literal["item", "category"] = "category",
+    key: Optional[str] = None,
+    tenant: tenancy.TenantDatabase = Depends(tenant_db)
+):
+    """Get usage totals per hour/day bucket, per item or per category"""
+    to = to or datetime.now(timezone.utc)
+    from_ = from_ or to - (timedelta(days=2) if granularity == "hour" else timedelta(days=30))
+    if to.tzinfo is None:
+        to = to.replace(tzinfo=timezone.utc)
+    if from_.tzinfo is None:
+        from_ = from_.replace(tzinfo=timezone.utc)
+    if from_ >= to:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    
+    buckets = await rollups.query(tenant, granularity, rollups.bucket_start(from_, granularity), to, scope, key)
+    return {"granularity": granularity, "scope": scope, "from": from_, "to": to, "buckets": buckets}
+
+@api_router.get("/usage/buffer/stats")
+async def get_usage_log_buffer_stats():
+    """Get usage-log write buffer counters"""
+    if usage_log_buffer is None:
+        return {"mode": write_buffer.SYNC}
+    return usage_log_buffer.stats()
+
+@api_router.post("/usage/rollups/backfill")
+async def backfill_usage_rollups(
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    tenant: tenancy.TenantDatabase = Depends(tenant_db)
+):
+    """Rebuild usage rollup buckets from the raw usage logs"""
+    return await rollups.backfill(tenant, from_, to)
+
+@api_router.get("/events/stream")
+async def stream_inventory_events(request: Request, tenant: tenancy.TenantDatabase = Depends(event_stream_tenant_db)):
+    """Server-Sent Events stream of inventory changes (stock, item_created, item_updated, resync)"""
+    return StreamingResponse(
+        event_broker.sse(request, tenant.household_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @api_router.get("/dashboard/stats")
-async def get_dashboard_stats():
+async def get_dashboard_stats(
+    request: Request,
+    response: Response,
+    tenant: tenancy.TenantDatabase = Depends(tenant_db)
+):
     """Get dashboard statistics"""
-    total_items = await db.inventory.count_documents({})
-    # Use simple count instead of $expr for compatibility
-    all_items = await db.inventory.find().to_list(1000)
-    low_stock_count = len([item for item in all_items if item.get('current_stock', 0) <= item.get('min_stock_alert', 5)])
-    out_of_stock_count = await db.inventory.count_documents({"current_stock": 0})
+    not_modified = await conditional_get(tenant, request, response, "inventory")
+    if not_modified:
+        return not_modified
     
-    return {
-        "total_items": total_items,
-        "low_stock_items": low_stock_count,
-        "out_of_stock_items": out_of_stock_count
-    }
+    # Counters are maintained incrementally by the inventory write paths
+    return await dashboard_stats.get_stats(tenant)
+
+@api_router.post("/dashboard/stats/reconcile")
+async def reconcile_dashboard_stats(tenant: tenancy.TenantDatabase = Depends(tenant_db)):
+    """Rebuild the dashboard counters from the inventory collection"""
+    await dashboard_stats.reconcile(tenant)
+    # Counters may have changed, so cached dashboard ETags must not match any more
+    await versions.bump(tenant, "inventory")
+    return await dashboard_stats.get_stats(tenant)
+
+async def record_measurement(tenant: tenancy.TenantDatabase, child_id: str, height: Optional[float],
+                             weight: Optional[float], measured_at: Optional[datetime] = None) -> GrowthMeasurement:
+    """Add a point to a child's growth history"""
+    measurement = GrowthMeasurement(child_id=child_id, height=height, weight=weight, household_id=tenant.household_id)
+    if measured_at is not None:
+        measurement.measured_at = _as_utc(measured_at)
+    await tenant.growth_measurements.insert_one(prepare_for_mongo(measurement.dict()))
+    return measurement
+
+def growth_report(rows: List[dict]) -> List[dict]:
+    if not growth_standards.available:
+        raise HTTPException(status_code=503, detail="WHO growth tables are not installed (see GROWTH_TABLES_DIR)")
+    # Every row is scored in one vectorized pass
+    return [{**row, **scores} for row, scores in zip(rows, growth.assess(growth_standards, rows))]
 
 # Child management endpoints
 @api_router.post("/children", response_model=Child)
-async def create_child(child: ChildCreate):
+async def create_child(child: ChildCreate, tenant: tenancy.TenantDatabase = Depends(tenant_db)):
     """Create a new child record"""
     child_dict = child.dict()
-    child_obj = Child(**child_dict)
+    child_obj = Child(**child_dict, household_id=tenant.household_id)
     
     # Prepare for MongoDB storage
     child_to_store = prepare_for_mongo(child_obj.dict())
-    await db.children.insert_one(child_to_store)
+    await tenant.children.insert_one(child_to_store)
+    # Growth history isn't covered by the children ETag
+    post_write = [versions.bump(tenant, "children")]
+    if child_obj.height is not None or child_obj.weight is not None:
+        post_write.append(record_measurement(tenant, child_obj.id, child_obj.height, child_obj.weight, child_obj.created_at))
+    await asyncio.gather(*post_write)
     
     return child_obj
 
 @api_router.get("/children", response_model=List[Child])
-async def get_children():
+async def get_children(request: Request, response: Response, tenant: tenancy.TenantDatabase = Depends(tenant_db)):
     """Get all children records"""
-    children = await db.children.find().to_list(100)
-    return [Child(**parse_from_mongo(child)) for child in children]
+    not_modified = await conditional_get(tenant, request, response, "children")
+    if not_modified:
+        return not_modified
+    
+    children = await tenant.children.find({}, serialization.projection_for(Child)).to_list(100)
+    return serialization.fast_response(Child, children, dict(response.headers))
+
+@api_router.get("/children/growth")
+async def get_children_growth(tenant: tenancy.TenantDatabase = Depends(tenant_db)):
+    """Get the latest WHO z-scores and percentiles of every measured child, computed in one pass"""
+    children = await tenant.children.find({}, {"_id": 0}).to_list(None)
+    latest: Dict[str, List[dict]] = {}
+    # Served by the (household_id, child_id, measured_at) index
+    async for measurement in tenant.growth_measurements.aggregate([
+        {"$sort": {"child_id": 1, "measured_at": -1}},
+        {"$group": {"_id": "$child_id", "id": {"$first": "$id"}, "measured_at": {"$first": "$measured_at"},
+                    "height": {"$first": "$height"}, "weight": {"$first": "$weight"}}},
+    ]):
+        latest[measurement["_id"]] = [measurement]
+    
+    rows = []
+    for child in children:
+        rows.extend(growth.measurement_rows(parse_from_mongo(child), latest.get(child["id"], [])))
+    names = {child["id"]: child.get("name") for child in children}
+    return [{"name": names[row["child_id"]], **row} for row in growth_report(rows)]
 
 @api_router.get("/children/{child_id}", response_model=Child)
-async def get_child(child_id: str):
+async def get_child(child_id: str, tenant: tenancy.TenantDatabase = Depends(tenant_db)):
     """Get a specific child record"""
-    child = await db.children.find_one({"id": child_id})
+    child = await tenant.children.find_one({"id": child_id})
     if not child:
         raise HTTPException(status_code=404, detail="Child not found")
     return Child(**parse_from_mongo(child))
 
 @api_router.put("/children/{child_id}", response_model=Child)
-async def update_child(child_id: str, update_data: ChildUpdate):
+async def update_child(child_id: str, update_data: ChildUpdate, tenant: tenancy.TenantDatabase = Depends(tenant_db)):
     """Update a child record"""
     # Get existing child
-    existing_child = await db.children.find_one({"id": child_id})
+    existing_child = await tenant.children.find_one({"id": child_id})
     if not existing_child:
         raise HTTPException(status_code=404, detail="Child not found")
     
@@ -381,32 +967,137 @@ async def update_child(child_id: str, update_data: ChildUpdate):
     # Prepare for MongoDB
     update_dict = prepare_for_mongo(update_dict)
     
-    await db.children.update_one(
+    await tenant.children.update_one(
         {"id": child_id},
         {"$set": update_dict}
     )
     
     # Return updated child
-    updated_child = await db.children.find_one({"id": child_id})
+    updated_child, _ = await asyncio.gather(tenant.children.find_one({"id": child_id}), versions.bump(tenant, "children"))
+    # Clients PUT the whole child on every edit; only a new height or weight is a new growth point
+    if growth.measurement_changed(existing_child, update_dict):
+        await record_measurement(tenant, child_id, updated_child.get('height'), updated_child.get('weight'),
+                                 update_dict['updated_at'])
     return Child(**parse_from_mongo(updated_child))
 
 @api_router.delete("/children/{child_id}")
-async def delete_child(child_id: str):
+async def delete_child(child_id: str, tenant: tenancy.TenantDatabase = Depends(tenant_db)):
     """Delete a child record"""
-    result = await db.children.delete_one({"id": child_id})
+    result = await tenant.children.delete_one({"id": child_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Child not found")
+    await asyncio.gather(tenant.growth_measurements.delete_many({"child_id": child_id}), versions.bump(tenant, "children"))
     return {"message": "Child deleted successfully"}
 
+@api_router.post("/children/{child_id}/measurements", response_model=GrowthMeasurement)
+async def add_growth_measurement(child_id: str, measurement: GrowthMeasurementCreate,
+                                 tenant: tenancy.TenantDatabase = Depends(tenant_db)):
+    """Record a height and/or weight measurement; the newest one becomes the child's current height and weight"""
+    if measurement.height is None and measurement.weight is None:
+        raise HTTPException(status_code=400, detail="A measurement needs a height or a weight")
+    child = await tenant.children.find_one({"id": child_id}, {"_id": 0, "id": 1})
+    if not child:
+        raise HTTPException(status_code=404, detail="Child not found")
+    
+    recorded = await record_measurement(tenant, child_id, measurement.height, measurement.weight, measurement.measured_at)
+    newer = await tenant.growth_measurements.count_documents(
+        {"child_id": child_id, "measured_at": {"$gt": recorded.measured_at}}
+    )
+    if not newer:
+        current = {k: v for k, v in (("height", recorded.height), ("weight", recorded.weight)) if v is not None}
+        current['updated_at'] = datetime.now(timezone.utc)
+        await tenant.children.update_one({"id": child_id}, {"$set": current})
+        await versions.bump(tenant, "children")
+    return recorded
+
+@api_router.delete("/children/{child_id}/measurements/{measurement_id}")
+async def delete_growth_measurement(child_id: str, measurement_id: str, tenant: tenancy.TenantDatabase = Depends(tenant_db)):
+    """Remove a mistaken measurement from a child's growth history"""
+    result = await tenant.growth_measurements.delete_one({"id": measurement_id, "child_id": child_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Measurement not found")
+    return {"message": "Measurement deleted successfully"}
+
+@api_router.get("/children/{child_id}/growth")
+async def get_child_growth(child_id: str, tenant: tenancy.TenantDatabase = Depends(tenant_db)):
+    """Get a child's growth history with WHO z-scores and percentiles, oldest first"""
+    child = await tenant.children.find_one({"id": child_id}, {"_id": 0})
+    if not child:
+        raise HTTPException(status_code=404, detail="Child not found")
+    measurements = await tenant.growth_measurements.find({"child_id": child_id}, {"_id": 0}).sort("measured_at", 1).to_list(None)
+    history = growth_report(growth.measurement_rows(parse_from_mongo(child), measurements))
+    return {
+        "child_id": child_id,
+        "name": child.get("name"),
+        "gender": child.get("gender"),
+        "date_of_birth": child.get("date_of_birth"),
+        "latest": history[-1] if history else None,
+        "history": history,
+    }
+
+# Admin endpoints
+@api_router.get("/admin/indexes")
+async def check_indexes():
+    """Report which of the expected indexes are missing"""
+    missing = await missing_indexes(db)
+    return {"ok": not missing, "missing": missing}
+
+@api_router.get("/admin/category-rules")
+async def get_category_rules():
+    """Current category rule table (file rules merged with overrides)"""
+    await category_classifier.refresh(db)
+    return {"rules": category_classifier.rules, "default_category": category_classifier.default_category,
+            **category_classifier.stats()}
+
+@api_router.put("/admin/category-rules/{category}")
+async def put_category_rule(category: str, rule: CategoryRule):
+    """Add or override a category rule; every worker picks it up on its next refresh"""
+    if rule.category != category:
+        raise HTTPException(status_code=400, detail="Category in path and body differ")
+    await classifier.save_override(db, rule.dict())
+    await category_classifier.refresh(db, force=True)
+    return rule
+
+@api_router.delete("/admin/category-rules/{category}")
+async def delete_category_rule(category: str):
+    """Remove an override, falling back to the rules file for that category"""
+    if not await classifier.delete_override(db, category):
+        raise HTTPException(status_code=404, detail="No override for this category")
+    await category_classifier.refresh(db, force=True)
+    return {"message": "Category rule override deleted"}
+
+@api_router.post("/admin/category-rules/reload")
+async def reload_category_rules():
+    await category_classifier.refresh(db, force=True)
+    return category_classifier.stats()
+
+@api_router.post("/admin/retention/run")
+async def run_usage_log_retention(dry_run: bool = False, tenant: tenancy.TenantDatabase = Depends(tenant_db)):
+    """Compact, archive and delete usage logs past the retention period"""
+    return await retention.run_retention(tenant, dry_run=dry_run, **retention.retention_settings())
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# Per-route latency histograms; requests slower than the threshold are logged with a Mongo/upstream breakdown
+app.add_middleware(
+    metrics.MetricsMiddleware,
+    slow_request_seconds=float(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', 1000)) / 1000,
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cross-origin clients need these to page through lists and revalidate
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Configure logging
@@ -416,6 +1107,80 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_tenancy():
+    # Documents written before households existed belong to the default household. The first
+    # worker to boot assigns them once; after that every boot only reads the migration marker
+    try:
+        if os.environ.get('MIGRATE_HOUSEHOLDS_ON_STARTUP', 'true').lower() != 'false':
+            owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4()}"
+            if await tenancy.migrate_once(db, DEFAULT_HOUSEHOLD_ID, owner) is None:
+                logging.info("Household migration is running in another process")
+            return
+        unscoped = await tenancy.unscoped_collections(db)
+        if unscoped:
+            logging.error(
+                f"Documents without a household in {', '.join(unscoped)} are invisible to every household; "
+                f"run `python tenancy.py migrate` or drop MIGRATE_HOUSEHOLDS_ON_STARTUP=false"
+            )
+    except Exception as e:
+        logging.error(f"Household migration failed: {e}")
+
+@app.on_event("startup")
+async def startup_db_indexes():
+    if os.environ.get('ENSURE_INDEXES_ON_STARTUP', 'true').lower() != 'false':
+        try:
+            await ensure_indexes(db)
+        except Exception as e:
+            logging.error(f"Index bootstrap failed: {e}")
+
+async def usage_log_retention_loop(interval_hours: float):
+    # Every worker runs this loop; the lease lets one of them do the work per interval
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4()}"
+    while True:
+        try:
+            if await retention.acquire_lease(db, owner, interval_hours * 3600):
+                await retention.run_for_households(db, **retention.retention_settings())
+        except Exception as e:
+            logging.error(f"Usage log retention failed: {e}")
+        await asyncio.sleep(interval_hours * 3600)
+
+@app.on_event("startup")
+async def startup_retention():
+    interval_hours = float(os.environ.get('USAGE_LOG_RETENTION_INTERVAL_HOURS', 0))
+    if interval_hours > 0:
+        app.state.retention_task = asyncio.create_task(usage_log_retention_loop(interval_hours))
+
+@app.on_event("startup")
+async def startup_event_source():
+    if EVENTS_SOURCE == 'change_stream':
+        app.state.change_stream_task = asyncio.create_task(events.follow_change_stream(db, event_broker, item_cache.apply_change))
+
+@app.on_event("startup")
+async def startup_category_rules():
+    try:
+        await category_classifier.refresh(db, force=True)
+    except Exception as e:
+        logging.error(f"Loading category rule overrides failed: {e}")
+
+@app.on_event("startup")
+async def startup_upstream_clients():
+    await openfoodfacts_client.start()
+
+@app.on_event("startup")
+async def startup_usage_log_buffer():
+    if usage_log_buffer is not None:
+        usage_log_buffer.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    for task_name in ('retention_task', 'change_stream_task'):
+        task = getattr(app.state, task_name, None)
+        if task is not None:
+            task.cancel()
+    if usage_log_buffer is not None:
+        # Write what is still queued before the client goes away
+        await usage_log_buffer.close()
+    await openfoodfacts_client.close()
+    catalog_mirror.close()
+    client.close()
@@ -0,0 +1,310 @@
+"""Household (tenant) scoping of the per-household collections.
+
+One backend serves many households (families, daycare rooms). Every
+document in the per-household collections carries a ``household_id``.
+Endpoints never query those collections directly. Instead they get a
+``TenantDatabase`` for the household named in the ``X-Household-ID``
+header, whose collections add ``household_id`` to every filter,
+pipeline and inserted document. Bulk writes take only requests built
+by the collection's own ``update_op``, which scopes the filter through
+pymongo's public ``UpdateOne`` constructor. The helper modules
+(``batch_ops``, ``rollups``, ``dashboard_stats``, ...) take that object
+wherever they take ``db`` and are scoped without knowing it. Operations
+the wrapper doesn't know raise ``AttributeError`` rather than running
+unscoped.
+
+``dashboard_stats`` and ``collection_versions`` hold one document per name
+(``_id: "inventory"``). Scoped, the ``_id`` becomes
+``"<household>:<name>"``, so every household has its own counters and
+ETag versions.
+
+Every per-household index starts with ``household_id`` (see ``indexes``),
+so a household's queries only read its own index range. The same prefix
+makes ``household_id`` a valid shard key::
+
+    python tenancy.py migrate    # give unscoped documents the default household
+    python tenancy.py shard      # shard the per-household collections (run against mongos)
+
+The server runs the same migration once on startup (``migrate_once``).
+Progress is checkpointed per collection in the ``households`` document of
+``migrations``, which also carries an expiring lock so only one worker
+runs it, and is marked done at the end. Later boots only read that
+document.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+HEADER = "X-Household-ID"
+DEFAULT_HOUSEHOLD = "default"
+HOUSEHOLD_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Collections whose documents belong to one household
+TENANT_COLLECTIONS = ("inventory", "usage_logs", "children", "scan_events", "usage_rollups", "growth_measurements")
+# Collections of per-name singleton documents, addressed by _id. Shared
+# documents (the category_rules version) live there too, read unscoped;
+# these are the names that predate tenancy and belong to a household.
+KEYED_COLLECTIONS = {"dashboard_stats": ("inventory",), "collection_versions": ("inventory", "children")}
+# Small singleton collections stay unsharded, on the primary shard
+SHARDED_COLLECTIONS = TENANT_COLLECTIONS
+# The migrations document tracking the pre-tenancy migration
+MIGRATION = "households"
+MIGRATION_LOCK_SECONDS = 3600
+
+
+def valid_household_id(value: str) -> bool:
+    # ':' separates the household from the name in keyed _ids
+    return bool(HOUSEHOLD_ID_PATTERN.match(value))
+
+
+class _ScopedUpdateOne(UpdateOne):
+    """An ``UpdateOne`` built for one household's collection"""
+
+    __slots__ = ("household_id",)
+
+
+class TenantCollection:
+    """A collection seen through one household"""
+
+    def __init__(self, collection, household_id: str, keyed: bool = False):
+        self.collection = collection
+        self.household_id = household_id
+        self.keyed = keyed
+        self.name = collection.name
+
+    def _key(self, value):
+        return f"{self.household_id}:{value}" if isinstance(value, str) else value
+
+    def _filter(self, query: Optional[dict]) -> dict:
+        scoped = dict(query or {})
+        if self.keyed and "_id" in scoped:
+            scoped["_id"] = self._key(scoped["_id"])
+        scoped["household_id"] = self.household_id
+        return scoped
+
+    def _document(self, doc: dict) -> dict:
+        # Stamped in place, like insert_one adds the _id
+        doc["household_id"] = self.household_id
+        if self.keyed and "_id" in doc:
+            doc["_id"] = self._key(doc["_id"])
+        return doc
+
+    def update_op(self, filter: dict, update, **kwargs) -> UpdateOne:
+        """An ``UpdateOne`` for ``bulk_write``, limited to this household"""
+        request = _ScopedUpdateOne(self._filter(filter), update, **kwargs)
+        request.household_id = self.household_id
+        return request
+
+    def _request(self, request):
+        # A plain pymongo request would run unscoped
+        if not isinstance(request, _ScopedUpdateOne) or request.household_id != self.household_id:
+            raise TypeError(f"bulk_write on {self.name} takes requests built by its update_op")
+        return request
+
+    def find(self, filter: Optional[dict] = None, *args, **kwargs):
+        return self.collection.find(self._filter(filter), *args, **kwargs)
+
+    async def find_one(self, filter: Optional[dict] = None, *args, **kwargs):
+        return await self.collection.find_one(self._filter(filter), *args, **kwargs)
+
+    async def find_one_and_update(self, filter: dict, update, *args, **kwargs):
+        return await self.collection.find_one_and_update(self._filter(filter), update, *args, **kwargs)
+
+    async def count_documents(self, filter: dict, **kwargs) -> int:
+        return await self.collection.count_documents(self._filter(filter), **kwargs)
+
+    def aggregate(self, pipeline: List[dict], **kwargs):
+        return self.collection.aggregate([{"$match": {"household_id": self.household_id}}] + list(pipeline), **kwargs)
+
+    async def insert_one(self, doc: dict, **kwargs):
+        return await self.collection.insert_one(self._document(doc), **kwargs)
+
+    async def insert_many(self, docs, **kwargs):
+        return await self.collection.insert_many([self._document(doc) for doc in docs], **kwargs)
+
+    async def update_one(self, filter: dict, update, **kwargs):
+        return await self.collection.update_one(self._filter(filter), update, **kwargs)
+
+    async def update_many(self, filter: dict, update, **kwargs):
+        return await self.collection.update_many(self._filter(filter), update, **kwargs)
+
+    async def replace_one(self, filter: dict, replacement: dict, **kwargs):
+        return await self.collection.replace_one(self._filter(filter), self._document(dict(replacement)), **kwargs)
+
+    async def delete_one(self, filter: dict, **kwargs):
+        return await self.collection.delete_one(self._filter(filter), **kwargs)
+
+    async def delete_many(self, filter: dict, **kwargs):
+        return await self.collection.delete_many(self._filter(filter), **kwargs)
+
+    async def bulk_write(self, requests, **kwargs):
+        return await self.collection.bulk_write([self._request(request) for request in requests], **kwargs)
+
+
+class TenantDatabase:
+    """Database view scoping the per-household collections to one household"""
+
+    def __init__(self, db, household_id: str):
+        self.db = db
+        self.household_id = household_id
+
+    def __getitem__(self, name: str):
+        collection = self.db[name]
+        if name in TENANT_COLLECTIONS:
+            return TenantCollection(collection, self.household_id)
+        if name in KEYED_COLLECTIONS:
+            return TenantCollection(collection, self.household_id, keyed=True)
+        # Shared collections (product_cache, category_rules, migrations, ...)
+        return collection
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+def scoped(db, household_id: str) -> TenantDatabase:
+    return TenantDatabase(db, household_id)
+
+
+def household_of(db) -> Optional[str]:
+    """The household a database view is scoped to; None for the raw database"""
+    return db.household_id if isinstance(db, TenantDatabase) else None
+
+
+async def households(db) -> List[str]:
+    """Every household with inventory or usage logs"""
+    found = set()
+    for name in ("inventory", "usage_logs", "children"):
+        found.update(value for value in await db[name].distinct("household_id") if value is not None)
+    return sorted(found)
+
+
+_UNSCOPED = {"household_id": {"$exists": False}}
+
+
+async def _migrate_collection(db, name: str, household_id: str) -> int:
+    if name in TENANT_COLLECTIONS:
+        result = await db[name].update_many(_UNSCOPED, {"$set": {"household_id": household_id}})
+        return result.modified_count
+    # _id can't change in place; copy to the household's key, then drop the old document
+    moved = 0
+    async for doc in db[name].find({"_id": {"$in": list(KEYED_COLLECTIONS[name])}, **_UNSCOPED}):
+        old_id = doc["_id"]
+        doc.update(_id=f"{household_id}:{old_id}", household_id=household_id)
+        await db[name].replace_one({"_id": doc["_id"]}, doc, upsert=True)
+        await db[name].delete_one({"_id": old_id})
+        moved += 1
+    return moved
+
+
+async def migrate(db, household_id: str = DEFAULT_HOUSEHOLD, skip: Iterable[str] = ()) -> dict:
+    """Assign ``household_id`` to every document that predates tenancy
+
+    Each finished collection is checkpointed, and the migration is marked
+    done at the end. Re-running it is harmless: only documents without a
+    household are touched.
+    """
+    report = {}
+    skip = set(skip)
+    for name in TENANT_COLLECTIONS + tuple(KEYED_COLLECTIONS):
+        if name in skip:
+            continue
+        report[name] = await _migrate_collection(db, name, household_id)
+        await db.migrations.update_one({"_id": MIGRATION}, {"$addToSet": {"collections": name}}, upsert=True)
+    await db.migrations.update_one(
+        {"_id": MIGRATION},
+        {"$set": {"done": True, "household_id": household_id, "finished_at": datetime.now(timezone.utc)},
+         "$unset": {"owner": "", "locked_until": ""}},
+        upsert=True
+    )
+    if any(report.values()):
+        logger.info(f"Assigned pre-tenancy documents to household {household_id}: {report}")
+    return report
+
+
+async def migrate_once(db, household_id: str, owner: str, lock_seconds: float = MIGRATION_LOCK_SECONDS,
+                       now: Optional[datetime] = None) -> Optional[dict]:
+    """Run ``migrate`` unless it has finished before; None if another process is running it
+
+    A run that died part-way is resumed after its last finished collection
+    once its lock has expired. A migration that finished before returns an
+    empty report after a single read.
+    """
+    state = await db.migrations.find_one({"_id": MIGRATION})
+    if state is not None and state.get("done"):
+        return {}
+    now = now or datetime.now(timezone.utc)
+    try:
+        state = await db.migrations.find_one_and_update(
+            {"_id": MIGRATION, "done": {"$ne": True}, "$or": [
+                {"locked_until": {"$exists": False}}, {"locked_until": {"$lte": now}}, {"owner": owner},
+            ]},
+            {"$set": {"owner": owner, "locked_until": now + timedelta(seconds=lock_seconds)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Another process holds the lock (or finished in the meantime), so the upsert collided with it
+        return None
+    return await migrate(db, household_id, skip=state.get("collections", []))
+
+
+async def unscoped_collections(db) -> List[str]:
+    """The per-household collections that still hold documents without a household"""
+    return [name for name in TENANT_COLLECTIONS if await db[name].find_one(_UNSCOPED, {"_id": 1}) is not None]
+
+
+async def shard_collections(client, db_name: str) -> List[str]:
+    """Shard every per-household collection on ``household_id`` (needs a mongos)"""
+    await client.admin.command("enableSharding", db_name)
+    sharded = []
+    for name in SHARDED_COLLECTIONS:
+        await client.admin.command("shardCollection", f"{db_name}.{name}", key={"household_id": 1})
+        sharded.append(name)
+        logger.info(f"Sharded {db_name}.{name} on household_id")
+    return sharded
+
+
+async def _main(argv) -> int:
+    import argparse
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    parser = argparse.ArgumentParser(description="Household tenancy maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migration = commands.add_parser("migrate", help="assign unscoped documents to a household")
+    migration.add_argument("--household", default=os.environ.get('DEFAULT_HOUSEHOLD_ID', DEFAULT_HOUSEHOLD))
+    commands.add_parser("shard", help="shard the per-household collections on household_id")
+    commands.add_parser("list", help="list the households that have data")
+    args = parser.parse_args(argv)
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        if args.command == "migrate":
+            print(await migrate(db, args.household))
+        elif args.command == "shard":
+            print(await shard_collections(client, os.environ['DB_NAME']))
+        else:
+            print("\n".join(await households(db)))
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
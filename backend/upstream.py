@@ -0,0 +1,196 @@
+"""Shared HTTP client for upstream product lookup services.
+
+One pooled ``aiohttp.ClientSession`` lives for the lifetime of the app, so
+scans reuse warm keep-alive connections instead of paying a TCP/TLS
+handshake each time. Every request is bounded by a timeout, concurrent
+requests for the same key share a single in-flight call, and a circuit
+breaker makes lookups fail fast while the upstream keeps erroring. Only
+200 and 404 count as answers. A 429 opens the breaker straight away, for
+as long as its ``Retry-After`` asks (or the usual reset timeout).
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+import aiohttp
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamLookupError(Exception):
+    """Raised when an upstream lookup service could not give an answer"""
+
+
+class CircuitOpenError(UpstreamLookupError):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+
+# Statuses that are real answers from the upstream; anything else is a failure
+ANSWER_STATUSES = (200, 404)
+TOO_MANY_REQUESTS = 429
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a ``Retry-After`` header (delay-seconds or HTTP-date)"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.open_for = reset_timeout
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.open_for:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def end_probe(self):
+        """Let another probe through if this one ended without a success or failure (e.g. cancelled)"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self, retry_after: Optional[float] = None):
+        """Count a failure; a ``retry_after`` (from a 429) opens the breaker for that long at once"""
+        self._probe_in_flight = False
+        self.failures += 1
+        if retry_after is not None or self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuit breaker opened after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.open_for = self.reset_timeout if retry_after is None else retry_after
+
+    def snapshot(self) -> dict:
+        snapshot = {"state": self.state, "failures": self.failures}
+        if self.state == self.OPEN:
+            snapshot["retry_in"] = round(max(0.0, self.opened_at + self.open_for - time.monotonic()), 1)
+        return snapshot
+
+
+class UpstreamClient:
+    """Pooled, time-bounded JSON client with request coalescing"""
+
+    def __init__(self, name: str, timeout: float = 3.0, connect_timeout: float = 1.0,
+                 limit_per_host: int = 10, breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.limit_per_host = limit_per_host
+        self.breaker = breaker or CircuitBreaker()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit_per_host * 4,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def get_json(self, url: str):
+        """GET a URL and return ``(status, json_or_none)``
+
+        Transport errors, timeouts and any status other than 200 or 404
+        (5xx, 429 rate limits, unexpected 4xx) count against the circuit
+        breaker and are raised as ``UpstreamLookupError``.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} circuit open, skipping upstream call")
+        probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+        try:
+            return await self._get_json(url)
+        finally:
+            if probe:
+                # A probe that was cancelled or raised something unexpected mustn't block later ones
+                self.breaker.end_probe()
+
+    async def _get_json(self, url: str):
+        await self.start()
+        started = time.perf_counter()
+        try:
+            async with self._session.get(url) as response:
+                if response.status == TOO_MANY_REQUESTS:
+                    retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+                    if retry_after is None:
+                        retry_after = self.breaker.reset_timeout
+                    self.breaker.record_failure(retry_after)
+                    metrics.observe_upstream(self.name, "rate_limited", time.perf_counter() - started)
+                    raise UpstreamLookupError(f"{self.name} rate limited (HTTP 429, retry after {retry_after}s)")
+                if response.status not in ANSWER_STATUSES:
+                    self.breaker.record_failure()
+                    metrics.observe_upstream(self.name, "error", time.perf_counter() - started)
+                    raise UpstreamLookupError(f"{self.name} returned HTTP {response.status}")
+                data = await response.json(content_type=None) if response.status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            self.breaker.record_failure()
+            metrics.observe_upstream(self.name, "timeout" if isinstance(e, asyncio.TimeoutError) else "error",
+                                     time.perf_counter() - started)
+            raise UpstreamLookupError(f"{self.name} lookup error: {e!r}") from e
+        self.breaker.record_success()
+        metrics.observe_upstream(self.name, str(response.status), time.perf_counter() - started)
+        return response.status, data
+
+    async def coalesce(self, key: str, factory: Callable[[], Awaitable]):
+        """Run ``factory()`` once for all concurrent callers sharing ``key``"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shield so one caller going away doesn't cancel the call for the others
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "in_flight": len(self._inflight),
+            "coalesced": self.coalesced,
+            "breaker": self.breaker.snapshot(),
+        }
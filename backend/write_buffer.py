@@ -0,0 +1,203 @@
+"""Write-behind buffer batching usage-log inserts into ``insert_many``.
+
+With ``USAGE_LOG_DURABILITY`` left at ``sync``, every ``use`` request
+inserts its own log, as before. The other two modes queue the log here. A
+background task writes the queue with one ``insert_many`` as soon as
+``max_batch`` logs are waiting, or ``max_delay`` seconds after the first one
+arrived:
+
+``group``
+    The request waits until its batch is written (group commit). A
+    response still means the log is stored, but a burst of scans shares
+    one round-trip.
+``async``
+    The request returns as soon as the log is queued. Logs still queued
+    when the process dies are lost. The shutdown hook flushes the queue.
+
+The queue is bounded by ``max_pending``. When it is full, new requests
+wait for the next flush instead of growing memory. Failed batches are
+retried; every document gets its ``_id`` before the first attempt, so
+a retry after a partly applied insert only hits duplicate-key errors for
+the logs already stored, and those count as written. Logs that still
+can't be written fail their waiting requests (``group``), or are handed
+to ``on_failure`` (``async``, or a ``group`` request that was cancelled
+before its batch was written) so the caller can undo the stock change.
+Once ``close`` has run, ``add`` raises instead of queueing logs nobody
+would write.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+SYNC = "sync"
+GROUP = "group"
+ASYNC = "async"
+MODES = (SYNC, GROUP, ASYNC)
+
+_DUPLICATE_KEY = 11000
+
+
+class UsageLogBuffer:
+    """Bounded queue of usage-log documents flushed with ``insert_many``"""
+
+    def __init__(self, collection, mode: str = GROUP, max_batch: int = 100, max_delay: float = 0.05,
+                 max_pending: int = 10000, retries: int = 3,
+                 after_flush: Optional[Callable[[List[dict], dict], Awaitable]] = None,
+                 on_failure: Optional[Callable[[List[dict], Exception], Awaitable]] = None):
+        if mode not in (GROUP, ASYNC):
+            raise ValueError(f"Unsupported buffer mode: {mode}")
+        self.collection = collection
+        self.mode = mode
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.retries = retries
+        self.after_flush = after_flush
+        self.on_failure = on_failure
+        # (document, category, future or None)
+        self._pending: List[tuple] = []
+        self._has_items = asyncio.Event()
+        self._full = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._closed = False
+        self.flushes = 0
+        self.written = 0
+        self.failed = 0
+
+    async def add(self, doc: dict, category: Optional[str] = None):
+        """Queue a log; in ``group`` mode, return only once it is written"""
+        while len(self._pending) >= self.max_pending and not self._closed:
+            self._full.set()
+            self._space.clear()
+            await self._space.wait()
+        if self._closed:
+            raise RuntimeError("Usage log buffer is closed")
+        doc.setdefault("_id", ObjectId())
+        future = asyncio.get_running_loop().create_future() if self.mode == GROUP else None
+        self._pending.append((doc, category, future))
+        self._has_items.set()
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        if future is not None:
+            await future
+
+    async def _run(self):
+        while not self._closing:
+            await self._has_items.wait()
+            if len(self._pending) < self.max_batch:
+                # Give the batch a little time to fill up
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Usage log flush failed: {e}")
+
+    async def _insert(self, docs: List[dict]) -> Tuple[List[int], Optional[Exception]]:
+        """Insert ``docs``, retrying; returns the indexes that could not be written and the last error"""
+        remaining = list(range(len(docs)))
+        error: Optional[Exception] = None
+        for attempt in range(self.retries + 1):
+            try:
+                await self.collection.insert_many([docs[i] for i in remaining], ordered=False)
+                return [], None
+            except BulkWriteError as e:
+                error = e
+                failed = [err for err in e.details.get("writeErrors", []) if err.get("code") != _DUPLICATE_KEY]
+                remaining = [remaining[err["index"]] for err in failed]
+                if not remaining:
+                    return [], None
+            except PyMongoError as e:
+                error = e
+            if attempt < self.retries:
+                await asyncio.sleep(0.1 * 2 ** attempt)
+        logger.error(f"Could not write {len(remaining)} usage logs: {error}")
+        return remaining, error
+
+    async def flush(self):
+        """Write everything queued so far, one ``insert_many`` per ``max_batch`` logs"""
+        async with self._lock:
+            while self._pending:
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                if len(self._pending) < self.max_batch:
+                    self._full.clear()
+                if not self._pending:
+                    self._has_items.clear()
+                self._space.set()
+                await self._write(batch)
+
+    async def _write(self, batch: List[tuple]):
+        docs = [doc for doc, _, _ in batch]
+        failed, error = await self._insert(docs)
+        failed = set(failed)
+        self.flushes += 1
+        self.written += len(docs) - len(failed)
+        self.failed += len(failed)
+
+        for i, (_, _, future) in enumerate(batch):
+            if future is None or future.done():
+                continue
+            if i in failed:
+                future.set_exception(RuntimeError("Usage log could not be written"))
+            else:
+                future.set_result(None)
+
+        written = [(doc, category) for i, (doc, category, _) in enumerate(batch) if i not in failed]
+        if written and self.after_flush is not None:
+            try:
+                await self.after_flush([doc for doc, _ in written], {doc["item_id"]: category for doc, category in written})
+            except Exception as e:
+                logger.error(f"Usage log post-flush hook failed: {e}")
+        # Nobody is waiting on a cancelled request either; its stock change has to be undone here
+        lost = [doc for i, (doc, _, future) in enumerate(batch)
+                if i in failed and (future is None or future.cancelled())]
+        if lost and self.on_failure is not None:
+            try:
+                await self.on_failure(lost, error)
+            except Exception as e:
+                logger.error(f"Usage log failure hook failed for {len(lost)} logs: {e}")
+
+    def start(self):
+        self._closed = False
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the background task and write whatever is still queued"""
+        # Woken rather than cancelled, so a batch is never abandoned half-way
+        self._closing = True
+        self._has_items.set()
+        self._full.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+        self._closing = False
+        self._closed = True
+        # Wake anyone still waiting for space so they see the buffer is closed
+        self._space.set()
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "pending": len(self._pending),
+            "max_batch": self.max_batch,
+            "max_delay_ms": round(self.max_delay * 1000, 1),
+            "max_pending": self.max_pending,
+            "flushes": self.flushes,
+            "written": self.written,
+            "failed": self.failed,
+        }
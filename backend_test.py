@@ -85,6 +85,27 @@ class BabyERPAPITester:
         test_barcode = "123456789"
         return self.run_test("Product Lookup", "POST", f"products/lookup/{test_barcode}", 200)
 
+    def test_product_cache_stats(self):
+        """Test product lookup cache counters after a lookup"""
+        success, response_data = self.run_test("Product Cache Stats", "GET", "products/cache/stats", 200)
+        if success and response_data.get('hits', 0) + response_data.get('misses', 0) < 1:
+            return self.log_test("Product Cache Counters", False, "Lookup was not counted"), response_data
+        return success, response_data
+
+    def test_category_rules(self):
+        """Test that the category rule table is loaded"""
+        success, response_data = self.run_test("Category Rules", "GET", "admin/category-rules", 200)
+        if success and not response_data.get('rules'):
+            return self.log_test("Category Rules Loaded", False, "Rule table is empty"), response_data
+        return success, response_data
+
+    def test_indexes_present(self):
+        """Test that the startup index bootstrap created every expected index"""
+        success, response_data = self.run_test("Index Check", "GET", "admin/indexes", 200)
+        if success and not response_data.get('ok'):
+            return self.log_test("Indexes Present", False, f"Missing: {response_data.get('missing')}"), response_data
+        return success, response_data
+
     def test_get_inventory_empty(self):
         """Test getting inventory when empty"""
         return self.run_test("Get Inventory (Empty)", "GET", "inventory", 200)
@@ -126,6 +147,13 @@ class BabyERPAPITester:
         """Test getting inventory after creating items"""
         return self.run_test("Get Inventory (With Items)", "GET", "inventory", 200)
 
+    def test_get_inventory_paginated(self):
+        """Test keyset pagination and field projection on inventory"""
+        success, response_data = self.run_test("Get Inventory (Paginated)", "GET", "inventory", 200, params={"limit": 1, "fields": "id,name"})
+        if success and any(set(item) - {"id", "name"} for item in response_data):
+            return self.log_test("Inventory Field Projection", False, "Unrequested fields returned"), response_data
+        return success, response_data
+
     def test_get_inventory_by_id(self):
         """Test getting specific inventory item by ID"""
         if not self.created_items:
@@ -162,6 +190,39 @@ class BabyERPAPITester:
         
         return self.run_test("Use Item", "POST", f"inventory/{item_id}/use", 200, usage_data)
 
+    def test_batch_operations(self):
+        """Test applying several restock/use scans in one request"""
+        batch = {
+            "operations": [
+                {"barcode": "1234567890123", "op": "restock", "qty": 3},
+                {"barcode": "1234567890123", "op": "use", "qty": 1},
+                {"barcode": "999999999", "op": "use", "qty": 1}
+            ]
+        }
+        success, response_data = self.run_test("Batch Operations", "POST", "inventory/batch", 200, batch)
+        if success:
+            statuses = [result.get('status') for result in response_data.get('results', [])]
+            if statuses != ["ok", "ok", "not_found"]:
+                return self.log_test("Batch Operation Results", False, f"Unexpected statuses: {statuses}"), response_data
+        return success, response_data
+
+    def test_sync_scan_events(self):
+        """Test that re-uploading an offline scan queue does not double-count usage"""
+        key = f"test-scan-{int(time.time() * 1000)}"
+        queue = {
+            "events": [
+                {"idempotency_key": key, "barcode": "1234567890123", "op": "use", "qty": 1,
+                 "timestamp": datetime.utcnow().isoformat() + "Z"}
+            ]
+        }
+        success, first = self.run_test("Sync Scan Queue", "POST", "sync/scans", 200, queue)
+        if not success:
+            return success, first
+        success, second = self.run_test("Sync Scan Queue (Retry)", "POST", "sync/scans", 200, queue)
+        if success and (second.get('duplicates') != 1 or second.get('stock_levels') != first.get('stock_levels')):
+            return self.log_test("Sync Idempotency", False, "Retried event was applied again"), second
+        return success, second
+
     def test_update_inventory_item(self):
         """Test updating an inventory item"""
         if not self.created_items:
@@ -180,10 +241,69 @@ class BabyERPAPITester:
         """Test getting usage logs"""
         return self.run_test("Get Usage Logs", "GET", "usage-logs", 200, params={"limit": 10})
 
+    def test_inventory_forecast(self):
+        """Test burn-rate forecast after recording usage"""
+        return self.run_test("Inventory Forecast", "GET", "inventory/forecast", 200, params={"window_days": 7})
+
+    def test_usage_rollups(self):
+        """Test hourly usage rollups after recording usage"""
+        success, response_data = self.run_test("Usage Rollups", "GET", "usage/rollups", 200, params={"granularity": "hour"})
+        if success and not response_data.get('buckets'):
+            return self.log_test("Usage Rollup Buckets", False, "No buckets after recorded usage"), response_data
+        return success, response_data
+
     def test_get_low_stock_with_items(self):
         """Test getting low stock items after creating and using items"""
         return self.run_test("Get Low Stock (With Items)", "GET", "inventory/low-stock", 200)
 
+    def test_conditional_get(self):
+        """Test that an unchanged inventory answers If-None-Match with 304"""
+        url = f"{self.api_url}/inventory"
+        print("\n🔍 Testing Conditional GET...")
+        try:
+            first = requests.get(url, timeout=10)
+            etag = first.headers.get('ETag')
+            if not etag:
+                return self.log_test("Conditional GET", False, "No ETag header"), {}
+            second = requests.get(url, headers={'If-None-Match': etag}, timeout=10)
+            return self.log_test("Conditional GET", second.status_code == 304, f"Status: {second.status_code}"), {}
+        except requests.exceptions.RequestException as e:
+            return self.log_test("Conditional GET", False, f"Request error: {str(e)}"), {}
+
+    def test_import_export_inventory(self):
+        """Test streaming CSV import (upsert by barcode) and export"""
+        print("\n🔍 Testing Inventory Import/Export...")
+        body = "barcode,name,category,current_stock\n9990000000001,Import Test Wipes,Wet Wipes,4\n,Missing Barcode,Other,1\n"
+        try:
+            imported = requests.post(f"{self.api_url}/inventory/import", data=body.encode(),
+                                     headers={'Content-Type': 'text/csv'}, timeout=30)
+            report = imported.json() if imported.status_code == 200 else {}
+            ok = report.get('error_count') == 1 and report.get('inserted', 0) + report.get('updated', 0) == 1
+            self.log_test("Inventory Import", ok, f"Status: {imported.status_code}, report: {report}")
+            exported = requests.get(f"{self.api_url}/inventory/export", timeout=30)
+            found = exported.status_code == 200 and '9990000000001' in exported.text
+            return self.log_test("Inventory Export", found, f"Status: {exported.status_code}"), report
+        except requests.exceptions.RequestException as e:
+            return self.log_test("Inventory Import/Export", False, f"Request error: {str(e)}"), {}
+
+    def test_household_isolation(self):
+        """Test that another household neither sees the test item nor is blocked by its barcode"""
+        print("\n🔍 Testing Household Isolation...")
+        other = {'Content-Type': 'application/json', 'X-Household-ID': f"test-household-{int(time.time())}"}
+        try:
+            lookup = requests.get(f"{self.api_url}/inventory/barcode/1234567890123", headers=other, timeout=10)
+            self.log_test("Household Barcode Lookup", lookup.status_code == 404, f"Status: {lookup.status_code}")
+            created = requests.post(f"{self.api_url}/inventory", headers=other, timeout=10,
+                                    json={"barcode": "1234567890123", "name": "Other Household Diapers", "current_stock": 1})
+            listed = requests.get(f"{self.api_url}/inventory", headers=other, timeout=10)
+            names = [item.get('name') for item in listed.json()] if listed.status_code == 200 else []
+            ok = created.status_code == 200 and names == ["Other Household Diapers"]
+            self.log_test("Household Inventory", ok, f"Status: {created.status_code}, items: {names}")
+            invalid = requests.get(f"{self.api_url}/inventory", headers={'X-Household-ID': 'bad:id'}, timeout=10)
+            return self.log_test("Invalid Household ID", invalid.status_code == 400, f"Status: {invalid.status_code}"), {}
+        except requests.exceptions.RequestException as e:
+            return self.log_test("Household Isolation", False, f"Request error: {str(e)}"), {}
+
     def test_dashboard_stats_with_data(self):
         """Test dashboard stats after creating items"""
         return self.run_test("Dashboard Stats (With Data)", "GET", "dashboard/stats", 200)
@@ -260,6 +380,26 @@ class BabyERPAPITester:
         child_id = self.created_children.pop()
         return self.run_test("Delete Child", "DELETE", f"children/{child_id}", 200)
 
+    def test_child_growth(self):
+        """Test recording a measurement and reading the child's growth percentiles"""
+        if not hasattr(self, 'created_children') or not self.created_children:
+            return self.log_test("Child Growth", False, "No children created to test with"), {}
+        
+        child_id = self.created_children[0]
+        success, _ = self.run_test("Add Growth Measurement", "POST", f"children/{child_id}/measurements", 200,
+                                   {"height": 81.0, "weight": 10.8})
+        if not success:
+            return success, {}
+        try:
+            response = requests.get(f"{self.api_url}/children/{child_id}/growth", timeout=10)
+            if response.status_code == 503:
+                # The WHO tables are installed per deployment
+                return self.log_test("Child Growth", True, "WHO growth tables not installed"), {}
+            history = response.json().get('history', []) if response.status_code == 200 else []
+            return self.log_test("Child Growth", bool(history), f"Status: {response.status_code}, points: {len(history)}"), {}
+        except requests.exceptions.RequestException as e:
+            return self.log_test("Child Growth", False, f"Request error: {str(e)}"), {}
+
     def test_error_cases(self):
         """Test various error cases"""
         print("\n🔍 Testing Error Cases...")
@@ -289,6 +429,8 @@ class BabyERPAPITester:
         # Basic connectivity tests
         print("\n📡 CONNECTIVITY TESTS")
         self.test_root_endpoint()
+        self.test_indexes_present()
+        self.test_category_rules()
         
         # Initial state tests
         print("\n📊 INITIAL STATE TESTS")
@@ -299,6 +441,7 @@ class BabyERPAPITester:
         # Product lookup tests
         print("\n🔍 PRODUCT LOOKUP TESTS")
         self.test_product_lookup()
+        self.test_product_cache_stats()
         
         # CRUD operations
         print("\n📝 CRUD OPERATION TESTS")
@@ -306,6 +449,7 @@ class BabyERPAPITester:
         if success:
             self.test_create_duplicate_item()
             self.test_get_inventory_with_items()
+            self.test_get_inventory_paginated()
             self.test_get_inventory_by_id()
             self.test_get_inventory_by_barcode()
             
@@ -313,13 +457,32 @@ class BabyERPAPITester:
             print("\n📦 STOCK MANAGEMENT TESTS")
             self.test_add_stock()
             self.test_use_item()
+            self.test_batch_operations()
+            self.test_sync_scan_events()
             self.test_update_inventory_item()
             
             # Analytics tests
             print("\n📈 ANALYTICS TESTS")
             self.test_get_usage_logs()
+            self.test_inventory_forecast()
+            self.test_usage_rollups()
             self.test_get_low_stock_with_items()
             self.test_dashboard_stats_with_data()
+            self.test_conditional_get()
+            self.test_import_export_inventory()
+            self.test_household_isolation()
+        
+        # Child records and growth history
+        print("\n👶 CHILD TESTS")
+        self.test_get_children_empty()
+        child_created, _ = self.test_create_child()
+        self.test_create_minimal_child()
+        self.test_get_children_with_data()
+        if child_created:
+            self.test_get_child_by_id()
+            self.test_update_child()
+            self.test_child_growth()
+        self.test_delete_child()
         
         # Error handling tests
         print("\n❌ ERROR HANDLING TESTS")
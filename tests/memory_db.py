@@ -0,0 +1,344 @@
+"""In-memory stand-in for the Motor collections the backend modules use.
+
+Covers the query operators, update operators and collection methods those
+modules send, including unique keys (``DuplicateKeyError`` /
+``BulkWriteError`` with code 11000) and ``bulk_write`` of ``UpdateOne``
+requests. ``aggregate`` does not run pipelines; it returns whatever the
+test put in ``aggregate_results``.
+"""
+
+import copy
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+_MISSING = object()
+
+
+def _get(doc: dict, path: str):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set(doc: dict, path: str, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def _compare(value, operator: str, operand) -> bool:
+    if operator == "$exists":
+        return (value is not _MISSING) == bool(operand)
+    if operator == "$eq":
+        return value == operand
+    if operator == "$ne":
+        return value != operand
+    if operator == "$in":
+        return value in operand
+    if operator == "$nin":
+        return value not in operand
+    if value is _MISSING or value is None:
+        return False
+    if operator == "$lt":
+        return value < operand
+    if operator == "$lte":
+        return value <= operand
+    if operator == "$gt":
+        return value > operand
+    if operator == "$gte":
+        return value >= operand
+    raise NotImplementedError(operator)
+
+
+def _is_operators(condition) -> bool:
+    return isinstance(condition, dict) and bool(condition) and all(key.startswith("$") for key in condition)
+
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    for field, condition in (query or {}).items():
+        if field == "$or":
+            if not any(matches(doc, clause) for clause in condition):
+                return False
+        elif field == "$and":
+            if not all(matches(doc, clause) for clause in condition):
+                return False
+        elif _is_operators(condition):
+            value = _get(doc, field)
+            if not all(_compare(value, operator, operand) for operator, operand in condition.items()):
+                return False
+        elif _get(doc, field) != condition:
+            return False
+    return True
+
+
+def _project(doc: dict, projection: Optional[dict]) -> dict:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    included = [field for field, flag in projection.items() if flag and field != "_id"]
+    if included:
+        kept = {field: doc[field] for field in included if field in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            kept["_id"] = doc["_id"]
+        return kept
+    for field, flag in projection.items():
+        if not flag:
+            doc.pop(field, None)
+    return doc
+
+
+def _apply(doc: dict, update: dict, inserting: bool):
+    for path, value in update.get("$set", {}).items():
+        _set(doc, path, copy.deepcopy(value))
+    for path, value in update.get("$inc", {}).items():
+        current = _get(doc, path)
+        _set(doc, path, (0 if current is _MISSING else current) + value)
+    for path, value in update.get("$addToSet", {}).items():
+        current = _get(doc, path)
+        values = [] if current is _MISSING else current
+        if value not in values:
+            _set(doc, path, values + [copy.deepcopy(value)])
+    for path in update.get("$unset", {}):
+        *parents, last = path.split(".")
+        parent = _get(doc, ".".join(parents)) if parents else doc
+        if isinstance(parent, dict):
+            parent.pop(last, None)
+    if inserting:
+        for path, value in update.get("$setOnInsert", {}).items():
+            _set(doc, path, copy.deepcopy(value))
+
+
+def _seed(query: dict) -> dict:
+    """The document an upsert starts from: the filter's equality fields"""
+    doc = {}
+    for field, condition in query.items():
+        if not field.startswith("$") and not _is_operators(condition):
+            _set(doc, field, copy.deepcopy(condition))
+    return doc
+
+
+def _sort_key(doc: dict, field: str) -> tuple:
+    value = _get(doc, field)
+    # Missing and null fields sort first, as in MongoDB
+    return (0, 0) if value is _MISSING or value is None else (1, value)
+
+
+class Cursor:
+    def __init__(self, docs: List[dict]):
+        self.docs = docs
+
+    def sort(self, key, direction=None):
+        keys = [(key, direction or 1)] if isinstance(key, str) else list(key)
+        for field, order in reversed(keys):
+            self.docs.sort(key=lambda doc: _sort_key(doc, field), reverse=order < 0)
+        return self
+
+    def skip(self, count: int):
+        self.docs = self.docs[count:]
+        return self
+
+    def limit(self, count: int):
+        if count:
+            self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length=None):
+        return self.docs[:length] if length else list(self.docs)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+class MemoryCollection:
+    """One collection; ``unique`` lists the field tuples with a unique index"""
+
+    def __init__(self, name: str, unique: Iterable[Tuple[str, ...]] = ()):
+        self.name = name
+        self.docs: List[dict] = []
+        self.unique = [("_id",)] + [tuple(fields) for fields in unique]
+        self.aggregate_results: List[dict] = []
+        self.pipelines: List[list] = []
+
+    def _conflict(self, doc: dict, ignore: Optional[dict] = None) -> Optional[tuple]:
+        for fields in self.unique:
+            key = tuple(_get(doc, field) for field in fields)
+            if all(value is _MISSING for value in key):
+                continue
+            for other in self.docs:
+                if other is not ignore and tuple(_get(other, field) for field in fields) == key:
+                    return fields
+        return None
+
+    def _store(self, doc: dict, ignore: Optional[dict] = None):
+        fields = self._conflict(doc, ignore)
+        if fields is not None:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {fields}", 11000)
+
+    # Reads
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None) -> Cursor:
+        return Cursor([_project(doc, projection) for doc in self.docs if matches(doc, filter)])
+
+    async def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None) -> Optional[dict]:
+        found = await self.find(filter, projection).to_list(1)
+        return found[0] if found else None
+
+    async def count_documents(self, filter: dict, **kwargs) -> int:
+        return sum(1 for doc in self.docs if matches(doc, filter))
+
+    async def distinct(self, field: str, filter: Optional[dict] = None) -> list:
+        values = []
+        for doc in self.docs:
+            value = _get(doc, field)
+            if matches(doc, filter) and value is not _MISSING and value not in values:
+                values.append(value)
+        return values
+
+    def aggregate(self, pipeline: list, **kwargs) -> Cursor:
+        self.pipelines.append(pipeline)
+        return Cursor(copy.deepcopy(self.aggregate_results))
+
+    # Writes
+
+    async def insert_one(self, doc: dict, **kwargs):
+        doc.setdefault("_id", ObjectId())
+        self._store(doc)
+        self.docs.append(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs, ordered: bool = True, **kwargs):
+        docs = list(docs)
+        errors, inserted = [], []
+        for index, doc in enumerate(docs):
+            doc.setdefault("_id", ObjectId())
+            try:
+                self._store(doc)
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+                continue
+            self.docs.append(copy.deepcopy(doc))
+            inserted.append(doc["_id"])
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return SimpleNamespace(inserted_ids=inserted)
+
+    def _update(self, filter: dict, update: dict, upsert: bool, many: bool) -> Dict[str, object]:
+        outcome = {"matched": 0, "modified": 0, "upserted_id": None, "before": None, "after": None}
+        for doc in self.docs:
+            if not matches(doc, filter):
+                continue
+            changed = copy.deepcopy(doc)
+            _apply(changed, update, inserting=False)
+            self._store(changed, ignore=doc)
+            outcome["before"] = outcome["before"] or copy.deepcopy(doc)
+            outcome["matched"] += 1
+            if changed != doc:
+                outcome["modified"] += 1
+                doc.clear()
+                doc.update(changed)
+            outcome["after"] = copy.deepcopy(doc)
+            if not many:
+                break
+        if not outcome["matched"] and upsert:
+            doc = _seed(filter)
+            _apply(doc, update, inserting=True)
+            doc.setdefault("_id", ObjectId())
+            self._store(doc)
+            self.docs.append(doc)
+            outcome["upserted_id"] = doc["_id"]
+            outcome["after"] = copy.deepcopy(doc)
+        return outcome
+
+    @staticmethod
+    def _result(outcome: dict):
+        return SimpleNamespace(matched_count=outcome["matched"], modified_count=outcome["modified"],
+                               upserted_id=outcome["upserted_id"])
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False, **kwargs):
+        return self._result(self._update(filter, update, upsert, many=False))
+
+    async def update_many(self, filter: dict, update: dict, upsert: bool = False, **kwargs):
+        return self._result(self._update(filter, update, upsert, many=True))
+
+    async def find_one_and_update(self, filter: dict, update: dict, projection: Optional[dict] = None,
+                                  upsert: bool = False, return_document=ReturnDocument.BEFORE, **kwargs):
+        outcome = self._update(filter, update, upsert, many=False)
+        doc = outcome["after"] if return_document == ReturnDocument.AFTER else outcome["before"]
+        return _project(doc, projection) if doc is not None else None
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs):
+        for doc in self.docs:
+            if matches(doc, filter):
+                replaced = {"_id": doc["_id"], **copy.deepcopy(replacement)}
+                self._store(replaced, ignore=doc)
+                doc.clear()
+                doc.update(replaced)
+                return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            return await self.insert_one(copy.deepcopy(replacement))
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def delete_one(self, filter: dict, **kwargs):
+        for doc in self.docs:
+            if matches(doc, filter):
+                self.docs.remove(doc)
+                return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    async def delete_many(self, filter: dict, **kwargs):
+        kept = [doc for doc in self.docs if not matches(doc, filter)]
+        deleted = len(self.docs) - len(kept)
+        self.docs = kept
+        return SimpleNamespace(deleted_count=deleted)
+
+    async def bulk_write(self, requests, ordered: bool = True, **kwargs):
+        details = {"writeErrors": [], "nMatched": 0, "nModified": 0, "nUpserted": 0}
+        for index, request in enumerate(requests):
+            if not isinstance(request, UpdateOne):
+                raise NotImplementedError(type(request).__name__)
+            try:
+                outcome = self._update(request._filter, request._doc, request._upsert, many=False)
+            except DuplicateKeyError as e:
+                details["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+                continue
+            details["nMatched"] += outcome["matched"]
+            details["nModified"] += outcome["modified"]
+            details["nUpserted"] += outcome["upserted_id"] is not None
+        if details["writeErrors"]:
+            raise BulkWriteError(details)
+        return SimpleNamespace(matched_count=details["nMatched"], modified_count=details["nModified"],
+                               upserted_count=details["nUpserted"], bulk_api_result=details)
+
+
+class MemoryDatabase:
+    """Collections are created on first use; ``unique`` maps names to unique keys"""
+
+    def __init__(self, unique: Optional[Dict[str, Iterable[Tuple[str, ...]]]] = None):
+        self.unique = unique or {}
+        self.collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self.collections:
+            self.collections[name] = MemoryCollection(name, self.unique.get(name, ()))
+        return self.collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+import batch_ops
+import tenancy
+from tests.memory_db import MemoryDatabase
+
+
+def make_db():
+    raw = MemoryDatabase({"inventory": [("household_id", "id")]})
+    for item_id, barcode, stock in (("a", "111", 10), ("b", "222", 1)):
+        raw.inventory.docs.append({"_id": item_id, "id": item_id, "barcode": barcode, "household_id": "alpha",
+                                   "current_stock": stock, "min_stock_alert": 2, "category": "Diapers"})
+    return raw, tenancy.scoped(raw, "alpha")
+
+
+def apply(db, operations):
+    return asyncio.run(batch_ops.apply_operations(db, operations, lambda doc: doc))
+
+
+def stock(raw, item_id: str) -> int:
+    return next(doc["current_stock"] for doc in raw.inventory.docs if doc["id"] == item_id)
+
+
+def use(qty: int = 1, **ref) -> dict:
+    return {"op": "use", "qty": qty, **ref}
+
+
+def restock(qty: int, **ref) -> dict:
+    return {"op": "restock", "qty": qty, **ref}
+
+
+def test_operations_on_one_item_become_a_single_guarded_inc():
+    raw, db = make_db()
+    requests = []
+    original = raw.inventory.bulk_write
+
+    async def recording_bulk_write(batch, **kwargs):
+        requests.extend(batch)
+        return await original(batch, **kwargs)
+
+    raw.inventory.bulk_write = recording_bulk_write
+    outcome = apply(db, [use(2, item_id="a"), restock(5, barcode="111"), use(1, item_id="a")])
+
+    assert [r["current_stock"] for r in outcome["results"]] == [8, 13, 12]
+    assert stock(raw, "a") == 12
+    [request] = requests
+    assert request._filter == {"id": "a", "current_stock": 10, "household_id": "alpha"}
+    assert request._doc["$inc"] == {"current_stock": 2}
+    assert outcome["stock_levels"] == {"a": 12}
+
+
+def test_usage_logs_are_written_for_applied_uses_only():
+    raw, db = make_db()
+    outcome = apply(db, [use(2, item_id="a"), restock(1, item_id="b"), use(5, item_id="b")])
+
+    assert [r["status"] for r in outcome["results"]] == [batch_ops.OK, batch_ops.OK, batch_ops.INSUFFICIENT_STOCK]
+    assert outcome["results"][2]["current_stock"] == 2
+    [log] = raw.usage_logs.docs
+    assert (log["item_id"], log["quantity_used"], log["household_id"]) == ("a", 2, "alpha")
+    assert outcome["results"][0]["usage_log_id"] == log["id"]
+    assert "usage_log_id" not in outcome["results"][1]
+    assert stock(raw, "b") == 2
+
+
+def test_unknown_items_are_reported_and_skipped():
+    raw, db = make_db()
+    outcome = apply(db, [use(1, item_id="missing"), use(1, barcode="999"), use(1, barcode="222")])
+
+    assert [r["status"] for r in outcome["results"]] == [batch_ops.NOT_FOUND, batch_ops.NOT_FOUND, batch_ops.OK]
+    assert outcome["results"][2]["item_id"] == "b"
+    assert stock(raw, "b") == 0
+
+
+def test_items_of_other_households_are_not_found():
+    raw, _ = make_db()
+    outcome = apply(tenancy.scoped(raw, "beta"), [use(1, item_id="a")])
+    assert outcome["results"][0]["status"] == batch_ops.NOT_FOUND
+    assert stock(raw, "a") == 10
+
+
+def test_a_concurrent_write_turns_that_items_operations_into_conflicts():
+    raw, db = make_db()
+    original = raw.inventory.bulk_write
+
+    async def bulk_write_after_a_concurrent_use(requests, **kwargs):
+        await raw.inventory.update_one({"id": "a"}, {"$inc": {"current_stock": -1}})
+        return await original(requests, **kwargs)
+
+    raw.inventory.bulk_write = bulk_write_after_a_concurrent_use
+    outcome = apply(db, [use(2, item_id="a"), use(1, item_id="b")])
+
+    conflict, applied = outcome["results"]
+    assert conflict["status"] == batch_ops.CONFLICT and "current_stock" not in conflict
+    assert applied["status"] == batch_ops.OK
+    # Only the concurrent use landed on a; the batch's last_batch_id marks b alone
+    assert stock(raw, "a") == 9 and stock(raw, "b") == 0
+    assert outcome["stock_levels"] == {"b": 0}
+    assert [log["item_id"] for log in raw.usage_logs.docs] == ["b"]
+
+
+def test_dashboard_counters_follow_the_applied_levels():
+    raw, db = make_db()
+    apply(db, [use(1, item_id="b"), use(8, item_id="a")])
+    [stats] = raw.dashboard_stats.docs
+    assert stats["_id"] == "alpha:inventory"
+    assert stats["out_of_stock_items"] == 1
+    assert stats["low_stock_items"] == 1
+    assert stats["categories"]["Diapers"]["stock"] == -9
+
+
+def test_a_failed_log_insert_undoes_the_whole_batch():
+    raw, db = make_db()
+
+    async def fail(docs, **kwargs):
+        raise RuntimeError("write concern timeout")
+
+    raw.usage_logs.insert_many = fail
+    with pytest.raises(RuntimeError):
+        apply(db, [use(2, item_id="a"), restock(3, item_id="a"), use(1, item_id="b")])
+    assert stock(raw, "a") == 10 and stock(raw, "b") == 1
+    assert raw.dashboard_stats.docs == []
@@ -0,0 +1,135 @@
+import asyncio
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+import bulk_io
+import tenancy
+from tests.memory_db import MemoryDatabase
+
+
+class Item(BaseModel):
+    barcode: str
+    name: str
+    category: str = "Other"
+    current_stock: int = 0
+    brand: Optional[str] = None
+
+
+async def _chunks(parts: List[bytes]):
+    for part in parts:
+        yield part
+
+
+def parse(parts: List[bytes], fmt: str = "csv") -> list:
+    async def run():
+        return [(row, record) async for row, record in bulk_io.records(_chunks(parts), fmt)]
+    return asyncio.run(run())
+
+
+def split_every(data: bytes, size: int) -> List[bytes]:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def make_db():
+    raw = MemoryDatabase({"inventory": [("household_id", "barcode")]})
+    return raw, tenancy.scoped(raw, "alpha")
+
+
+def run_import(db, body: bytes, fmt: str = "csv", **kwargs) -> dict:
+    rows = bulk_io.records(_chunks(split_every(body, 7)), fmt)
+    return asyncio.run(bulk_io.import_items(db, rows, Item, lambda doc: doc, **kwargs))
+
+
+CSV = 'barcode,name,current_stock\n111,"Wipes, sensitive",3\n222,"Diapers\nsize 4",5\n'.encode()
+
+
+def test_records_survive_any_chunk_boundary():
+    expected = parse([CSV])
+    assert expected == [
+        (2, {"barcode": "111", "name": "Wipes, sensitive", "current_stock": "3"}),
+        (3, {"barcode": "222", "name": "Diapers\nsize 4", "current_stock": "5"}),
+    ]
+    for size in (1, 2, 5, 13):
+        assert parse(split_every(CSV, size)) == expected
+
+
+def test_multibyte_characters_split_across_chunks_and_a_bom():
+    body = "﻿barcode,name\n333,Crème bébé\n".encode()
+    assert parse(split_every(body, 1)) == [(2, {"barcode": "333", "name": "Crème bébé"})]
+
+
+def test_unreadable_rows_are_reported_in_place():
+    csv_rows = parse([b'barcode,name\n111,ok\n222,"never closed\n'])
+    assert csv_rows[0] == (2, {"barcode": "111", "name": "ok"})
+    assert isinstance(csv_rows[1][1], bulk_io.ImportFormatError)
+
+    ndjson_rows = parse([b'{"barcode": "1", "name": "a"}\nnot json\n\n[1]\n'], "ndjson")
+    assert ndjson_rows[0] == (1, {"barcode": "1", "name": "a"})
+    assert [row for row, record in ndjson_rows if isinstance(record, bulk_io.ImportFormatError)] == [2, 4]
+
+
+def test_new_and_existing_items_are_counted_apart():
+    raw, db = make_db()
+    raw.inventory.docs.append({"_id": 1, "id": "x", "household_id": "alpha", "barcode": "111",
+                               "name": "Wipes, sensitive", "current_stock": 1, "category": "Bath & Care"})
+    report = run_import(db, CSV, chunk_size=1)
+    assert (report["rows"], report["inserted"], report["updated"], report["error_count"]) == (2, 1, 1, 0)
+
+    existing, created = raw.inventory.docs
+    # Only the columns in the file are written over an existing item
+    assert existing["current_stock"] == 3 and existing["category"] == "Bath & Care"
+    assert created["household_id"] == "alpha" and created["category"] == "Other" and created["id"]
+
+    again = run_import(db, CSV, chunk_size=1)
+    assert (again["inserted"], again["updated"]) == (0, 2)
+
+
+def test_bad_rows_are_skipped_with_their_row_numbers():
+    raw, db = make_db()
+    body = b'barcode,name,current_stock\n,No barcode,1\n444,Bad stock,lots\n555,Fine,\n'
+    report = run_import(db, body, chunk_size=2)
+
+    assert report["inserted"] == 1
+    assert [(e["row"], e["barcode"]) for e in report["errors"]] == [(2, None), (3, "444")]
+    assert "barcode" in report["errors"][0]["error"]
+    # An empty cell means "not given", so the default applies
+    assert raw.inventory.docs[0]["current_stock"] == 0
+
+
+def test_flushes_happen_at_the_chunk_size_and_once_more_at_the_end():
+    raw, db = make_db()
+    calls = []
+    original = raw.inventory.bulk_write
+
+    async def counting_bulk_write(requests, **kwargs):
+        calls.append(len(requests))
+        return await original(requests, **kwargs)
+
+    raw.inventory.bulk_write = counting_bulk_write
+    body = b"barcode,name\n" + b"".join(b"%d,Item %d\n" % (i, i) for i in range(5))
+    report = run_import(db, body, chunk_size=2)
+    assert calls == [2, 2, 1]
+    assert report["inserted"] == 5
+
+
+def test_classifier_fills_in_categories_for_new_items_only():
+    raw, db = make_db()
+    run_import(db, b"barcode,name,brand\n1,Baby wipes,Acme\n2,Thing,\n", classify=lambda text: "Wet Wipes" if "wipes" in text.lower() else None)
+    assert [doc["category"] for doc in raw.inventory.docs] == ["Wet Wipes", "Other"]
+
+
+def test_dry_run_validates_without_writing():
+    raw, db = make_db()
+    report = run_import(db, b"barcode,name\n1,One\n,Missing\n", dry_run=True)
+    assert (report["rows"], report["error_count"], report["inserted"]) == (2, 1, 0)
+    assert raw.inventory.docs == []
+
+
+def test_an_unreadable_body_keeps_the_rows_before_it():
+    raw, db = make_db()
+    report = run_import(db, b"barcode,name\n1,One\n2,\xff\n", chunk_size=10)
+    assert report["aborted"] and "UTF-8" in report["aborted"]
+    assert [doc["barcode"] for doc in raw.inventory.docs] == ["1"]
+
+    assert run_import(db, b"", chunk_size=10)["aborted"] == "CSV body has no header row"
@@ -0,0 +1,98 @@
+import json
+import os
+from pathlib import Path
+
+from catalog_mirror import CatalogMirror, import_dump, mirror_filter, read_dump
+from classifier import CategoryClassifier
+
+FIXTURES = Path(__file__).parent / "fixtures"
+JSONL_DUMP = FIXTURES / "catalog_dump.jsonl"
+TSV_DUMP = FIXTURES / "catalog_dump.tsv"
+
+
+def is_baby(categories: str) -> bool:
+    return any(word in categories.lower() for word in ("baby", "diaper", "infant"))
+
+
+def test_read_dump_normalizes_both_formats():
+    products = {p["barcode"]: p for p in read_dump(JSONL_DUMP)}
+    # The record without a code is skipped; empty category text falls back to the tags
+    assert set(products) == {"4015400541770", "7322541092853", "3017620422003"}
+    assert products["7322541092853"]["categories"] == "en:baby-wipes"
+    assert products["4015400541770"] == {
+        "barcode": "4015400541770", "product_name": "Pampers Baby-Dry Size 4", "brand": "Pampers",
+        "categories": "Baby care, Diapers", "size": "46 pieces",
+    }
+
+    tsv = {p["barcode"]: p for p in read_dump(TSV_DUMP)}
+    assert tsv["8000300396486"]["brand"] == "Mellin"
+    assert tsv["8000300396486"]["size"] == "800 g"
+
+
+def test_import_and_lookup(tmp_path):
+    output = tmp_path / "products.sqlite"
+    report = import_dump(JSONL_DUMP, output, keep=is_baby)
+    assert (report["read"], report["kept"]) == (3, 2)
+
+    mirror = CatalogMirror(output, check_interval=0)
+    try:
+        assert mirror.get("4015400541770")["product_name"] == "Pampers Baby-Dry Size 4"
+        # Filtered out by keep, and never in the dump
+        assert mirror.get("3017620422003") is None
+        assert mirror.get("0000000000000") is None
+        stats = mirror.stats()
+        assert (stats["available"], stats["hits"], stats["misses"], stats["products"]) == (True, 1, 2, "2")
+    finally:
+        mirror.close()
+
+
+def test_mirror_filter_needs_a_baby_marker_for_generic_keywords():
+    keep = mirror_filter(CategoryClassifier())
+    assert keep("Baby care, Diapers") and keep("en:baby-wipes") and keep("Wet wipes")
+    assert keep("Baby milks, Infant formula") and keep("Lait de croissance pour bébé")
+    assert keep("Baby care, Creams")
+    # Dairy and cosmetics only match the generic keywords
+    assert not keep("Dairies, Milks, Whole milks")
+    assert not keep("Dairies, Creams, Sour creams")
+    assert not keep("Beauty, Hand creams") and not keep("Spreads, Sweet spreads") and not keep("")
+
+
+def test_rules_choose_what_is_mirrored(tmp_path):
+    rules = tmp_path / "rules.json"
+    rules.write_text(json.dumps({"baby_markers": {"en": ["baby"]}, "rules": [
+        {"category": "Formula", "keywords": ["milk"]},
+        {"category": "Wipes", "mirror": "always", "keywords": ["wipe"]},
+        {"category": "Toys", "mirror": "never", "keywords": ["toy"]},
+    ]}))
+    keep = mirror_filter(CategoryClassifier(rules))
+    assert keep("Baby milk") and not keep("Milk")
+    assert keep("Kitchen wipes")
+    assert not keep("Baby toys")
+
+    report = import_dump(TSV_DUMP, tmp_path / "products.sqlite", keep=mirror_filter(CategoryClassifier()))
+    assert (report["read"], report["kept"]) == (3, 2)
+
+
+def test_missing_mirror_is_a_miss_without_error(tmp_path):
+    mirror = CatalogMirror(tmp_path / "absent.sqlite", check_interval=0)
+    assert mirror.get("4015400541770") is None
+    assert mirror.stats()["available"] is False
+
+
+def test_reopens_when_the_file_is_replaced(tmp_path):
+    output = tmp_path / "products.sqlite"
+    import_dump(JSONL_DUMP, output, keep=is_baby)
+    mirror = CatalogMirror(output, check_interval=0)
+    try:
+        assert mirror.get("8000300396486") is None
+
+        import_dump(TSV_DUMP, output, keep=is_baby)
+        # Make sure the new file's mtime differs even on coarse-grained filesystems
+        stat = output.stat()
+        os.utime(output, (stat.st_atime, stat.st_mtime + 10))
+
+        assert mirror.get("8000300396486")["brand"] == "Mellin"
+        assert mirror.get("4015400541770")["product_name"] == "Pampers Baby-Dry Size 5"
+        assert mirror.get("5000159484695") is None
+    finally:
+        mirror.close()
@@ -0,0 +1,96 @@
+import asyncio
+from types import SimpleNamespace
+
+from pymongo.errors import DuplicateKeyError
+
+import dashboard_stats
+
+
+def test_null_stock_counts_as_out_of_stock_like_the_pipeline():
+    counters = dashboard_stats._counters({"current_stock": None, "min_stock_alert": None, "category": None})
+    assert counters["out_of_stock_items"] == 1
+    assert counters["low_stock_items"] == 1
+    assert counters["categories.Other.stock"] == 0
+
+
+def test_stats_delta_only_keeps_changes():
+    before = {"current_stock": 6, "min_stock_alert": 5, "category": "Diapers"}
+    after = {**before, "current_stock": 5}
+    assert dashboard_stats.stats_delta(before, after) == {"low_stock_items": 1, "categories.Diapers.stock": -1}
+    assert dashboard_stats.stats_delta(None, after)["total_items"] == 1
+    assert dashboard_stats.stats_delta(after, None)["total_items"] == -1
+
+
+def test_merge_deltas_drops_zeroes():
+    assert dashboard_stats.merge_deltas({"a": 1, "b": 2}, {"a": -1, "c": 3}) == {"b": 2, "c": 3}
+
+
+def test_category_names_are_safe_field_names():
+    encoded = dashboard_stats._encode_category("$Food.Formula")
+    assert "." not in encoded and not encoded.startswith("$")
+    assert dashboard_stats._decode_category(encoded) == "$Food.Formula"
+
+
+class Inventory:
+    def __init__(self, groups, during_aggregate=None):
+        self.groups = groups
+        self.during_aggregate = during_aggregate
+
+    async def _iterate(self):
+        if self.during_aggregate is not None:
+            await self.during_aggregate()
+            self.during_aggregate = None
+        for group in self.groups:
+            yield group
+
+    def aggregate(self, pipeline):
+        return self._iterate()
+
+
+class Stats:
+    """Just enough of a collection for apply_delta and reconcile on one document"""
+
+    def __init__(self, doc=None):
+        self.doc = doc
+
+    async def find_one(self, query, projection=None):
+        return dict(self.doc) if self.doc else None
+
+    async def update_one(self, query, update, upsert=False):
+        matches = self.doc is not None and all(self.doc.get(k) == v for k, v in query.items() if k != "_id")
+        if not matches:
+            if self.doc is not None:
+                raise DuplicateKeyError("E11000 duplicate key")
+            self.doc = {"_id": query["_id"]}
+        for key, value in update.get("$inc", {}).items():
+            self.doc[key] = self.doc.get(key, 0) + value
+        self.doc.update(update.get("$set", {}))
+
+
+GROUPS = [{"_id": "Diapers", "items": 2, "stock": 30, "low_stock_items": 1, "out_of_stock_items": 0}]
+
+
+def test_reconcile_writes_the_aggregate():
+    db = SimpleNamespace(inventory=Inventory(GROUPS), dashboard_stats=Stats())
+    asyncio.run(dashboard_stats.reconcile(db))
+    assert db.dashboard_stats.doc["total_items"] == 2
+    assert db.dashboard_stats.doc["writes"] == 0
+    assert dashboard_stats._present(db.dashboard_stats.doc)["categories"] == {"Diapers": {"items": 2, "stock": 30}}
+
+
+def test_reconcile_retries_when_an_increment_lands_meanwhile():
+    stats = Stats({"_id": "inventory", "total_items": 1, "writes": 4})
+    aggregates = []
+
+    async def concurrent_write():
+        await dashboard_stats.apply_delta(db, {"total_items": 1})
+
+    db = SimpleNamespace(inventory=Inventory(GROUPS, concurrent_write), dashboard_stats=stats)
+    original = db.inventory.aggregate
+    db.inventory.aggregate = lambda pipeline: aggregates.append(1) or original(pipeline)
+
+    asyncio.run(dashboard_stats.reconcile(db))
+    # The first result was computed before the $inc and is discarded
+    assert len(aggregates) == 2
+    assert stats.doc["writes"] == 5
+    assert stats.doc["total_items"] == 2
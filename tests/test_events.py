@@ -0,0 +1,86 @@
+import asyncio
+from datetime import datetime, timezone
+
+import events
+
+
+def test_stock_delta_is_compact_and_flags_low_stock():
+    item = {"_id": "x", "id": "a", "barcode": "123", "name": "Diapers", "current_stock": 4,
+            "min_stock_alert": 5, "updated_at": datetime(2026, 1, 1, tzinfo=timezone.utc)}
+    delta = events.stock_delta(item)
+    assert set(delta) == {"id", "barcode", "current_stock", "min_stock_alert", "updated_at", "low_stock"}
+    assert delta["low_stock"] is True
+    assert events.stock_delta({"id": "a", "current_stock": 6})["low_stock"] is False
+    assert "_id" not in events.item_payload(item)
+
+
+def test_events_only_reach_their_household():
+    async def run():
+        broker = events.EventBroker()
+        alpha, beta = broker.subscribe("alpha"), broker.subscribe("beta")
+        broker.publish("stock", {"id": "a"}, household_id="alpha")
+        broker.publish("resync", {})
+        return [alpha.get_nowait()[1] for _ in range(alpha.qsize())], [beta.get_nowait()[1] for _ in range(beta.qsize())]
+
+    assert asyncio.run(run()) == (["stock", "resync"], ["resync"])
+
+
+def test_slow_subscriber_gets_a_single_resync():
+    async def run():
+        broker = events.EventBroker(queue_size=2)
+        queue = broker.subscribe("alpha")
+        for i in range(3):
+            broker.publish("stock", {"id": str(i)}, household_id="alpha")
+        return [queue.get_nowait() for _ in range(queue.qsize())], broker.stats()
+
+    queued, stats = asyncio.run(run())
+    assert queued == [(3, "resync", {})]
+    assert stats["dropped"] == 1
+
+
+def test_local_publishing_can_be_switched_off():
+    async def run():
+        broker = events.EventBroker()
+        queue = broker.subscribe()
+        broker.local_publish = False
+        broker.publish("stock", {"id": "a"})
+        broker.publish("stock", {"id": "b"}, local=False)
+        return [queue.get_nowait()[2] for _ in range(queue.qsize())]
+
+    assert asyncio.run(run()) == [{"id": "b"}]
+
+
+class Request:
+    """Disconnects after a fixed number of checks"""
+
+    def __init__(self, checks: int):
+        self.checks = checks
+
+    async def is_disconnected(self) -> bool:
+        self.checks -= 1
+        return self.checks < 0
+
+
+def test_sse_frames_and_unsubscribes():
+    async def run():
+        broker = events.EventBroker()
+        stream = broker.sse(Request(checks=1), "alpha", heartbeat=0.01)
+        frames = [await stream.__anext__()]
+        broker.publish("stock", {"id": "a", "updated_at": datetime(2026, 1, 1, tzinfo=timezone.utc)}, household_id="alpha")
+        frames += [frame async for frame in stream]
+        return frames, broker.stats()["subscribers"]
+
+    frames, subscribers = asyncio.run(run())
+    assert frames == [
+        "retry: 3000\n\n",
+        'id: 1\nevent: stock\ndata: {"id":"a","updated_at":"2026-01-01T00:00:00+00:00"}\n\n',
+    ]
+    assert subscribers == 0
+
+
+def test_sse_sends_keepalives_when_idle():
+    async def run():
+        stream = events.EventBroker().sse(Request(checks=1), heartbeat=0.01)
+        return [frame async for frame in stream]
+
+    assert asyncio.run(run()) == ["retry: 3000\n\n", ": keepalive\n\n"]
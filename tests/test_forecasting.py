@@ -0,0 +1,127 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import tenancy
+from forecasting import ForecastEngine
+
+
+def _matches(doc: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$gte" in condition and not value >= condition["$gte"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return list(self.docs)
+
+
+class Collection:
+    def __init__(self, name, docs):
+        self.name = name
+        self.docs = docs
+        self.queries = 0
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        return Cursor(doc for doc in self.docs if _matches(doc, query))
+
+
+def make_db():
+    now = datetime.now(timezone.utc)
+    inventory = [
+        {"id": "a1", "household_id": "alpha", "name": "Diapers", "current_stock": 20},
+        {"id": "b1", "household_id": "beta", "name": "Wipes", "current_stock": 10},
+    ]
+    usage = [
+        {"item_id": "a1", "household_id": "alpha", "quantity_used": 14, "timestamp": now - timedelta(days=1)},
+        {"item_id": "b1", "household_id": "beta", "quantity_used": 7, "timestamp": now - timedelta(days=1)},
+    ]
+    return {"inventory": Collection("inventory", inventory), "usage_logs": Collection("usage_logs", usage)}
+
+
+def test_households_have_separate_rate_caches():
+    raw = make_db()
+    engine = ForecastEngine()
+    alpha, beta = tenancy.scoped(raw, "alpha"), tenancy.scoped(raw, "beta")
+
+    [alpha_forecast] = asyncio.run(engine.forecast(alpha, 7))
+    [beta_forecast] = asyncio.run(engine.forecast(beta, 7))
+    assert alpha_forecast["daily_burn_rate"] == 2.0
+    assert beta_forecast["daily_burn_rate"] == 1.0
+
+    # Usage in one household doesn't make the other recompute
+    engine.invalidate("alpha", ["a1"])
+    loads = raw["usage_logs"].queries
+    asyncio.run(engine.forecast(beta, 7))
+    assert raw["usage_logs"].queries == loads
+    asyncio.run(engine.forecast(alpha, 7))
+    assert raw["usage_logs"].queries == loads + 1
+
+
+def test_days_until_empty_uses_current_stock():
+    raw = make_db()
+    engine = ForecastEngine()
+    alpha = tenancy.scoped(raw, "alpha")
+    asyncio.run(engine.forecast(alpha, 7))
+
+    raw["inventory"].docs[0]["current_stock"] = 4
+    [forecast] = asyncio.run(engine.forecast(alpha, 7))
+    assert forecast["days_until_empty"] == 2.0
+
+
+def test_rates_expire_so_other_workers_usage_shows_up():
+    raw = make_db()
+    engine = ForecastEngine(ttl_seconds=0)
+    alpha = tenancy.scoped(raw, "alpha")
+    asyncio.run(engine.forecast(alpha, 7))
+
+    # Recorded by another worker: this engine never hears about it
+    raw["usage_logs"].docs.append({"item_id": "a1", "household_id": "alpha", "quantity_used": 7,
+                                   "timestamp": datetime.now(timezone.utc)})
+    [forecast] = asyncio.run(engine.forecast(alpha, 7))
+    assert forecast["daily_burn_rate"] == 3.0
+
+
+def test_cached_households_are_bounded():
+    raw = make_db()
+    engine = ForecastEngine(max_households=1)
+    asyncio.run(engine.forecast(tenancy.scoped(raw, "alpha"), 7))
+    asyncio.run(engine.forecast(tenancy.scoped(raw, "beta"), 7))
+    assert list(engine._households) == ["beta"]
+
+
+def test_usage_recorded_while_rates_load_is_not_lost():
+    raw = make_db()
+    engine = ForecastEngine()
+    alpha = tenancy.scoped(raw, "alpha")
+    asyncio.run(engine.forecast(alpha, 7))
+    engine.invalidate("alpha", ["a1"])
+
+    usage = raw["usage_logs"]
+    original = usage.find
+
+    def find_then_record(query, projection=None):
+        # The usage query has been sent; a /use lands before its result is used
+        cursor = original(query, projection)
+        cursor.docs = list(cursor.docs)
+        usage.docs.append({"item_id": "a1", "household_id": "alpha", "quantity_used": 7,
+                           "timestamp": datetime.now(timezone.utc)})
+        engine.invalidate("alpha", ["a1"])
+        return cursor
+
+    usage.find = find_then_record
+    asyncio.run(engine.forecast(alpha, 7))
+    usage.find = original
+    [forecast] = asyncio.run(engine.forecast(alpha, 7))
+    assert forecast["daily_burn_rate"] == 3.0
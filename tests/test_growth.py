@@ -0,0 +1,76 @@
+import math
+
+import numpy as np
+import pytest
+
+import growth
+
+
+def synthetic_standards(l: float = 0.5, m: float = 10.0, s: float = 0.1) -> growth.GrowthStandards:
+    ages = np.array([0.0, 100.0])
+    table = (ages, np.full(2, l), np.full(2, m), np.full(2, s))
+    return growth.GrowthStandards({
+        (growth.WEIGHT_FOR_AGE, growth.GIRLS): table,
+        (growth.LENGTH_FOR_AGE, growth.GIRLS): table,
+    })
+
+
+def z_score(standards, indicator, value, age=50.0, sex=growth.GIRLS):
+    return standards.z_scores(indicator, np.array([sex]), np.array([age]), np.array([value]))[0]
+
+
+def test_median_is_zero():
+    assert z_score(synthetic_standards(), growth.WEIGHT_FOR_AGE, 10.0) == pytest.approx(0.0)
+    assert growth.percentiles(np.array([0.0]))[0] == pytest.approx(50.0)
+
+
+def test_box_cox_and_log_forms():
+    # L=0.5: ((11/10) ** 0.5 - 1) / (0.5 * 0.1)
+    assert z_score(synthetic_standards(), growth.LENGTH_FOR_AGE, 11.0) == pytest.approx((1.1 ** 0.5 - 1) / 0.05)
+    assert z_score(synthetic_standards(l=0.0), growth.LENGTH_FOR_AGE, 11.0) == pytest.approx(math.log(1.1) / 0.1)
+
+
+def test_restricted_tails_use_the_sd23_gap():
+    standards = synthetic_standards()
+    # SD(k) = M * (1 + L*S*k) ** (1/L): SD3 = 13.225, SD2 = 12.1, SD-2 = 8.1, SD-3 = 7.225
+    assert z_score(standards, growth.WEIGHT_FOR_AGE, 14.35) == pytest.approx(4.0)
+    assert z_score(standards, growth.WEIGHT_FOR_AGE, 6.35) == pytest.approx(-4.0)
+    # Length-for-age is not adjusted
+    assert z_score(standards, growth.LENGTH_FOR_AGE, 14.35) == pytest.approx((1.435 ** 0.5 - 1) / 0.05)
+
+
+def test_outside_table_or_unknown_sex_is_nan():
+    standards = synthetic_standards()
+    assert math.isnan(z_score(standards, growth.WEIGHT_FOR_AGE, 10.0, age=200.0))
+    assert math.isnan(z_score(standards, growth.WEIGHT_FOR_AGE, 10.0, sex=growth.BOYS))
+    assert math.isnan(z_score(standards, growth.WEIGHT_FOR_AGE, 0.0))
+
+
+def test_percentiles_follow_the_normal_cdf():
+    assert growth.percentiles(np.array([1.96, -1.0])) == pytest.approx([97.5, 15.87], abs=0.01)
+
+
+def test_assess_from_loaded_table(tmp_path):
+    (tmp_path / "wfa_girls_z_exp.txt").write_text("Day\tL\tM\tS\n0\t0.5\t10\t0.1\n100\t0.5\t12\t0.1\n")
+    standards = growth.GrowthStandards.load(tmp_path)
+    assert standards.available
+
+    [result] = growth.assess(standards, [{"gender": "Girl", "age_days": 50, "weight": 11.0, "height": None}])
+    # M is interpolated to 11 halfway between the rows
+    assert result[growth.WEIGHT_FOR_AGE] == {"z_score": 0.0, "percentile": 50.0}
+    assert result[growth.LENGTH_FOR_AGE] == {"z_score": None, "percentile": None}
+    assert result["bmi"] is None
+
+
+def test_age_in_days():
+    assert growth.age_in_days("2024-01-01", growth.date(2024, 3, 1)) == 60
+    assert growth.age_in_days("not a date", growth.date(2024, 3, 1)) is None
+
+
+def test_only_a_new_height_or_weight_is_a_measurement():
+    child = {"id": "c1", "name": "Emma", "height": 80.0, "weight": 10.5}
+    # The frontend sends every field back when only the name or notes changed
+    assert not growth.measurement_changed(child, {"name": "Emma J", "height": 80.0, "weight": 10.5, "notes": "hi"})
+    assert not growth.measurement_changed(child, {"name": "Emma J"})
+    assert growth.measurement_changed(child, {"height": 81.0, "weight": 10.5})
+    assert growth.measurement_changed({"id": "c1"}, {"weight": 3.4})
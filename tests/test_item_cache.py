@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+
+from item_cache import ItemCache
+
+NOW = datetime(2026, 5, 1, tzinfo=timezone.utc)
+
+
+def item(item_id: str, household: str = "alpha", barcode: str = None, stock: int = 1, updated_at=NOW) -> dict:
+    return {"_id": object(), "id": item_id, "household_id": household, "barcode": barcode or f"bc-{item_id}",
+            "current_stock": stock, "updated_at": updated_at}
+
+
+def test_hits_by_id_and_barcode_are_copies_without_the_mongo_id():
+    cache = ItemCache()
+    cache.put(item("a"))
+    found = cache.get_by_id("alpha", "a")
+    assert found["current_stock"] == 1 and "_id" not in found
+    found["current_stock"] = 99
+    assert cache.get_by_barcode("alpha", "bc-a")["current_stock"] == 1
+    assert cache.stats()["hits"] == 2
+
+
+def test_households_never_see_each_others_items():
+    cache = ItemCache()
+    cache.put(item("a", household="alpha", barcode="123"))
+    assert cache.get_by_barcode("beta", "123") is None
+    assert cache.get_by_id("beta", "a") is None
+
+
+def test_lru_evicts_the_least_recently_used():
+    cache = ItemCache(max_size=2)
+    cache.put(item("a"))
+    cache.put(item("b"))
+    cache.get_by_id("alpha", "a")
+    cache.put(item("c"))
+    assert cache.get_by_id("alpha", "b") is None
+    assert cache.get_by_barcode("alpha", "bc-b") is None
+    assert cache.get_by_id("alpha", "a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire():
+    cache = ItemCache(ttl_seconds=-1)
+    cache.put(item("a"))
+    assert cache.get_by_id("alpha", "a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_older_documents_never_replace_newer_ones():
+    cache = ItemCache()
+    cache.put(item("a", stock=5, updated_at=NOW))
+    cache.put(item("a", stock=9, updated_at=NOW - timedelta(seconds=1)))
+    assert cache.get_by_id("alpha", "a")["current_stock"] == 5
+
+
+def test_fill_started_before_an_invalidation_is_ignored():
+    cache = ItemCache()
+    generation = cache.generation
+    cache.invalidate("alpha", ["a"])
+    cache.put(item("a"), generation)
+    assert cache.get_by_id("alpha", "a") is None
+
+    cache.put(item("a"), cache.generation)
+    assert cache.get_by_id("alpha", "a") is not None
+
+
+def test_invalidate_drops_the_barcode_index_too():
+    cache = ItemCache()
+    cache.put(item("a", barcode="123"))
+    cache.invalidate("alpha", ["a"])
+    assert cache.get_by_barcode("alpha", "123") is None
+
+
+def test_barcode_moved_to_a_new_item_follows_it():
+    cache = ItemCache()
+    cache.put(item("a", barcode="123"))
+    cache.put(item("b", barcode="123"))
+    assert cache.get_by_barcode("alpha", "123")["id"] == "b"
+    cache.invalidate("alpha", ["a"])
+    assert cache.get_by_barcode("alpha", "123")["id"] == "b"
+
+
+def test_change_stream_updates_and_deletes():
+    cache = ItemCache()
+    cache.apply_change({"fullDocument": item("a", stock=3)})
+    assert cache.get_by_id("alpha", "a")["current_stock"] == 3
+    cache.apply_change({"operationType": "delete", "documentKey": {"_id": 1}})
+    assert cache.get_by_id("alpha", "a") is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ItemCache(max_size=0)
+    cache.put(item("a"))
+    assert not cache.enabled
+    assert cache.get_by_id("alpha", "a") is None
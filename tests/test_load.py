@@ -0,0 +1,50 @@
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend" / "bench"))
+
+import load  # noqa: E402
+
+
+def test_percentile_is_nearest_rank():
+    values = [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]
+    assert load.percentile(values, 0.50) == 5.0
+    assert load.percentile(values, 0.90) == 9.0
+    assert load.percentile(values, 0.99) == 10.0
+    assert load.percentile(values, 0.0) == 1.0
+    assert load.percentile([], 0.5) == 0.0
+
+
+class Response:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+
+
+def test_run_scenario_counts_requests_and_errors():
+    calls = []
+
+    async def make_request(client):
+        calls.append(client)
+        status = 500 if len(calls) % 4 == 0 else 200
+        await asyncio.sleep(0)
+        return Response(status)
+
+    result = asyncio.run(load.run_scenario("client", make_request, requests=20, concurrency=3, warmup=2))
+    assert len(calls) == 22
+    assert result["requests"] == 20
+    assert result["errors"] == 5
+    assert result["p50_ms"] <= result["p90_ms"] <= result["p99_ms"] <= result["max_ms"]
+
+
+def test_compare_reports_relative_change(capsys):
+    previous = {"commit": "abc123", "started_at": "then", "results": {
+        "scan": {"p50_ms": 2.0, "p99_ms": 10.0, "throughput_rps": 100.0}}}
+    current = {"results": {
+        "scan": {"p50_ms": 1.0, "p99_ms": 12.0, "throughput_rps": 150.0},
+        "use": {"p50_ms": 1.0, "p99_ms": 1.0, "throughput_rps": 1.0}}}
+    load.compare(current, previous)
+    out = capsys.readouterr().out
+    assert "abc123" in out
+    assert "p50_ms -50.0%" in out and "p99_ms +20.0%" in out and "throughput_rps +50.0%" in out
+    assert "use" not in out
@@ -0,0 +1,60 @@
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+
+import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics.Histogram("test_seconds", "Test latency", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5.0, "/a")
+    assert list(histogram.render()) == [
+        "# HELP test_seconds Test latency",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{route="/a",le="0.1"} 1',
+        'test_seconds_bucket{route="/a",le="1"} 2',
+        'test_seconds_bucket{route="/a",le="+Inf"} 3',
+        'test_seconds_sum{route="/a"} 5.55',
+        'test_seconds_count{route="/a"} 3',
+    ]
+
+
+def test_label_values_are_escaped():
+    assert metrics._format_labels(("route",), ('a"b\\c',)) == '{route="a\\"b\\\\c"}'
+
+
+def test_route_label_is_the_template():
+    assert metrics._route_template({}) == "unmatched"
+    assert metrics._route_template({"route": APIRoute("/items/{item_id}", lambda item_id: None)}) == "/items/{item_id}"
+
+
+def test_breakdown_lists_slowest_first_and_the_rest_as_app():
+    breakdown = {"inventory.find": [0.010, 2], "upstream:openfoodfacts": [0.050, 1]}
+    assert metrics.format_breakdown(breakdown, 0.1) == \
+        "upstream:openfoodfacts 50.0ms/1, inventory.find 10.0ms/2, app 40.0ms"
+
+
+def _series(route: str) -> list:
+    return [labels for labels in metrics.http_request_duration._series if labels[1] == route]
+
+
+def test_middleware_labels_requests_by_route_template():
+    app = FastAPI()
+
+    @app.post("/items/{item_id}", status_code=201)
+    async def item(item_id: str):
+        return {"id": item_id}
+
+    app.add_middleware(metrics.MetricsMiddleware)
+    with TestClient(app) as client:
+        client.post("/items/abc")
+        client.post("/items/def")
+        client.get("/nowhere")
+        client.get("/metrics")
+
+    assert _series("/items/{item_id}") == [("POST", "/items/{item_id}", "201")]
+    assert ("GET", "unmatched", "404") in _series("unmatched")
+    assert not [labels for labels in metrics.http_request_duration._series if "/items/abc" in labels]
+    assert not _series("/metrics")
@@ -0,0 +1,54 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+import pagination
+
+
+def test_cursor_round_trips_datetimes_and_plain_values():
+    when = datetime(2026, 3, 1, 12, 30, tzinfo=timezone.utc)
+    cursor = pagination.encode_cursor(when, "item-1")
+    assert "=" not in cursor
+    assert pagination.decode_cursor(cursor) == (when, "item-1")
+    assert pagination.decode_cursor(pagination.encode_cursor("Diapers", "item-2")) == ("Diapers", "item-2")
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", pagination.encode_cursor("a", "b")[:-3], "W10"])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        pagination.decode_cursor(cursor)
+
+
+def test_keyset_filter_continues_after_the_cursor():
+    assert pagination.keyset_filter("updated_at", None) == {}
+    cursor = pagination.encode_cursor(5, "item-9")
+    assert pagination.keyset_filter("current_stock", cursor) == {"$or": [
+        {"current_stock": {"$lt": 5}},
+        {"current_stock": 5, "id": {"$lt": "item-9"}},
+    ]}
+    assert pagination.sort_spec("current_stock") == [("current_stock", -1), ("id", -1)]
+
+
+def test_projection_always_fetches_the_cursor_fields():
+    allowed = ("id", "name", "current_stock", "updated_at")
+    assert pagination.projection(None, allowed, "updated_at") == ({"_id": 0}, None)
+
+    spec, requested = pagination.projection("name, current_stock", allowed, "updated_at")
+    assert spec == {"_id": 0, "id": 1, "updated_at": 1, "name": 1, "current_stock": 1}
+    assert requested == ["name", "current_stock"]
+    assert pagination.trim({"id": "x", "updated_at": 1, "name": "Wipes"}, requested) == {"name": "Wipes"}
+
+    with pytest.raises(ValueError, match="secret"):
+        pagination.projection("name,secret", allowed, "updated_at")
+
+
+def test_ndjson_lines_streams_one_document_per_line():
+    async def cursor():
+        for i in range(3):
+            yield {"id": i}
+
+    async def collect():
+        return [line async for line in pagination.ndjson_lines(cursor(), lambda doc: {**doc, "x": True})]
+
+    assert asyncio.run(collect()) == [b'{"id":0,"x":true}\n', b'{"id":1,"x":true}\n', b'{"id":2,"x":true}\n']
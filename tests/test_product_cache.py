@@ -0,0 +1,111 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pydantic import BaseModel
+
+import product_cache
+from product_cache import ProductLookupCache
+from tests.memory_db import MemoryCollection
+from upstream import CircuitBreaker, UpstreamClient
+
+
+class Product(BaseModel):
+    found: bool
+    product_name: Optional[str] = None
+
+
+class Source:
+    """A lookup service answering with ``result`` and counting its calls"""
+
+    def __init__(self, result: Product):
+        self.result = result
+        self.calls = 0
+
+    async def __call__(self, barcode: str) -> Product:
+        self.calls += 1
+        return self.result
+
+
+def make_cache(**kwargs) -> ProductLookupCache:
+    return ProductLookupCache(MemoryCollection("product_cache"), Product, **kwargs)
+
+
+def test_answers_are_served_from_memory_after_the_first_lookup():
+    cache = make_cache()
+    source = Source(Product(found=True, product_name="Wipes"))
+    first = asyncio.run(cache.lookup("123", source))
+    second = asyncio.run(cache.lookup("123", source))
+    assert first == second == Product(found=True, product_name="Wipes")
+    assert source.calls == 1
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_not_found_is_cached_with_the_shorter_ttl():
+    cache = make_cache(ttl_seconds=3600, negative_ttl_seconds=60)
+    first, fallback = Source(Product(found=False)), Source(Product(found=False))
+    assert not asyncio.run(cache.lookup("404", first, fallback)).found
+    assert not asyncio.run(cache.lookup("404", first, fallback)).found
+    assert (first.calls, fallback.calls) == (1, 1)
+
+    [doc] = cache.collection.docs
+    assert doc["found"] is False
+    assert timedelta(seconds=55) < doc["expires_at"] - doc["cached_at"] <= timedelta(seconds=60)
+
+
+def test_the_first_source_that_finds_the_product_wins():
+    cache = make_cache()
+    first, fallback = Source(Product(found=True, product_name="Formula")), Source(Product(found=False))
+    assert asyncio.run(cache.lookup("123", first, fallback)).product_name == "Formula"
+    assert fallback.calls == 0
+
+
+def test_nothing_is_cached_while_the_breaker_is_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    client = UpstreamClient("Test", breaker=breaker)
+
+    async def upstream(barcode: str) -> Product:
+        await client.get_json(f"http://upstream.invalid/{barcode}")
+        raise AssertionError("the open breaker should have refused the call")
+
+    cache = make_cache()
+    fallback = Source(Product(found=False))
+    assert not asyncio.run(cache.lookup("123", upstream, fallback)).found
+    assert fallback.calls == 1
+    assert cache.collection.docs == [] and cache.stats()["size"] == 0
+
+    # Nothing was cached, so the next lookup asks again and can still find it
+    found = Source(Product(found=True, product_name="Diapers"))
+    assert asyncio.run(cache.lookup("123", found)).found
+
+
+def test_memory_entries_expire(monkeypatch):
+    cache = make_cache(ttl_seconds=10)
+    asyncio.run(cache.set("123", Product(found=True)))
+    clock = product_cache.time.monotonic() + 11
+    monkeypatch.setattr(product_cache.time, "monotonic", lambda: clock)
+    # The store tier still has it until its own expiry
+    assert asyncio.run(cache.get("123")) is not None
+    assert cache.stats()["expirations"] == 1 and cache.stats()["store_hits"] == 1
+
+
+def test_store_entries_expire():
+    cache = make_cache()
+    cache.collection.docs.append({"_id": 1, "barcode": "123", "found": True, "result": {"found": True},
+                                  "expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)})
+    assert asyncio.run(cache.get("123")) is None
+    assert cache.stats()["expirations"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_a_store_hit_refills_memory_and_the_lru_is_bounded():
+    collection = MemoryCollection("product_cache")
+    asyncio.run(ProductLookupCache(collection, Product).set("123", Product(found=True)))
+
+    cache = ProductLookupCache(collection, Product, max_size=1)
+    assert asyncio.run(cache.get("123")).found
+    assert asyncio.run(cache.get("123")).found
+    assert (cache.stats()["store_hits"], cache.stats()["memory_hits"]) == (1, 1)
+
+    asyncio.run(cache.set("456", Product(found=False)))
+    assert cache.stats()["evictions"] == 1 and cache.stats()["size"] == 1
@@ -0,0 +1,97 @@
+import asyncio
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+import retention
+import rollups
+import tenancy
+from tests.memory_db import MemoryDatabase
+
+NOW = datetime.now(timezone.utc)
+
+
+@pytest.fixture
+def backfills(monkeypatch):
+    calls = []
+
+    async def backfill(db, start=None, end=None):
+        calls.append((tenancy.household_of(db), start, end))
+        return {}
+
+    monkeypatch.setattr(rollups, "backfill", backfill)
+    return calls
+
+
+def make_db() -> MemoryDatabase:
+    raw = MemoryDatabase()
+    for i, days_ago in enumerate((400, 380, 370, 366, 400, 10)):
+        raw.usage_logs.docs.append({"_id": i, "id": f"log-{i}", "item_id": "a", "quantity_used": 1,
+                                    "household_id": "alpha", "timestamp": NOW - timedelta(days=days_ago)})
+    raw.usage_logs.docs.append({"_id": 99, "id": "log-beta", "item_id": "b", "quantity_used": 1,
+                                "household_id": "beta", "timestamp": NOW - timedelta(days=400)})
+    return raw
+
+
+def read_archive(path: str) -> list:
+    with gzip.open(path, "rt") as archive:
+        return [json.loads(line) for line in archive]
+
+
+def test_cutoff_is_the_start_of_the_day():
+    now = datetime(2026, 3, 10, 15, 30, tzinfo=timezone.utc)
+    assert retention.cutoff_for(7, now) == datetime(2026, 3, 3, tzinfo=timezone.utc)
+
+
+def test_expired_logs_are_compacted_archived_oldest_first_then_deleted(tmp_path, backfills):
+    raw = make_db()
+    report = asyncio.run(retention.run_retention(tenancy.scoped(raw, "alpha"), days=365,
+                                                 archive_dir=tmp_path, batch_size=2))
+
+    assert (report["expired"], report["archived"], report["deleted"]) == (5, 5, 5)
+    assert backfills == [("alpha", None, report["cutoff"] - timedelta(days=1))]
+    assert Path(report["archive"]).name.startswith("usage_logs-alpha-before-")
+
+    archived = read_archive(report["archive"])
+    assert [log["id"] for log in archived] == ["log-0", "log-4", "log-1", "log-2", "log-3"]
+    assert datetime.fromisoformat(archived[0]["timestamp"]) == NOW - timedelta(days=400)
+    assert "_id" not in archived[0]
+    # The recent log and the other household's logs are left alone
+    assert sorted(doc["id"] for doc in raw.usage_logs.docs) == ["log-5", "log-beta"]
+
+
+def test_dry_run_and_nothing_expired_touch_nothing(tmp_path, backfills):
+    raw = make_db()
+    alpha = tenancy.scoped(raw, "alpha")
+    report = asyncio.run(retention.run_retention(alpha, days=365, archive_dir=tmp_path, dry_run=True))
+    assert (report["expired"], report["archived"], report["archive"]) == (5, 0, None)
+
+    report = asyncio.run(retention.run_retention(alpha, days=1000, archive_dir=tmp_path))
+    assert report["expired"] == 0
+    assert backfills == [] and list(tmp_path.iterdir()) == []
+    assert len(raw.usage_logs.docs) == 7
+
+
+def test_every_household_is_handled_separately(tmp_path, backfills):
+    raw = make_db()
+    reports = asyncio.run(retention.run_for_households(raw, days=365, archive_dir=tmp_path))
+    assert {household: report["deleted"] for household, report in reports.items()} == {"alpha": 5, "beta": 1}
+    assert [doc["id"] for doc in raw.usage_logs.docs] == ["log-5"]
+
+
+def test_one_owner_holds_the_lease_until_it_expires():
+    db = MemoryDatabase()
+
+    def acquire(owner, now):
+        return asyncio.run(retention.acquire_lease(db, owner, 3600, now))
+
+    assert acquire("worker-1", NOW)
+    assert not acquire("worker-2", NOW + timedelta(minutes=30))
+    # The holder renews its own lease
+    assert acquire("worker-1", NOW + timedelta(minutes=59))
+    assert not acquire("worker-2", NOW + timedelta(minutes=61))
+    assert acquire("worker-2", NOW + timedelta(minutes=120))
+    assert db.leases.docs[0]["owner"] == "worker-2"
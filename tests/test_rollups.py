@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import rollups
+import tenancy
+from tests.memory_db import MemoryDatabase
+
+UNIQUE = {"usage_rollups": [("household_id", "granularity", "scope", "key", "bucket")]}
+
+
+def at(day: int, hour: int, minute: int = 0) -> datetime:
+    return datetime(2026, 3, day, hour, minute, tzinfo=timezone.utc)
+
+
+def log(item_id: str, quantity: int, timestamp: datetime) -> dict:
+    return {"item_id": item_id, "quantity_used": quantity, "timestamp": timestamp}
+
+
+def buckets(raw, granularity: str, scope: str) -> dict:
+    return {
+        (doc["key"], doc["bucket"]): (doc["quantity"], doc["events"])
+        for doc in raw.usage_rollups.docs if doc["granularity"] == granularity and doc["scope"] == scope
+    }
+
+
+def test_bucket_start_truncates_in_utc():
+    local = datetime(2026, 3, 2, 1, 30, tzinfo=timezone(timedelta(hours=3)))
+    assert rollups.bucket_start(local, "hour") == at(1, 22)
+    assert rollups.bucket_start(local, "day") == at(1, 0)
+    assert rollups.bucket_start(datetime(2026, 3, 2, 5, 59), "hour") == at(2, 5)
+
+
+def test_record_counts_each_log_per_item_and_category_and_granularity():
+    raw = MemoryDatabase(UNIQUE)
+    db = tenancy.scoped(raw, "alpha")
+    logs = [log("a", 2, at(1, 9, 5)), log("a", 1, at(1, 9, 50)), log("b", 3, at(1, 14)), log("c", 1, at(1, 15))]
+    asyncio.run(rollups.record(db, logs, {"a": "Diapers", "b": "Diapers"}))
+
+    assert buckets(raw, "hour", "item") == {("a", at(1, 9)): (3, 2), ("b", at(1, 14)): (3, 1), ("c", at(1, 15)): (1, 1)}
+    assert buckets(raw, "day", "category") == {("Diapers", at(1, 0)): (6, 3), ("Other", at(1, 0)): (1, 1)}
+    assert {doc["household_id"] for doc in raw.usage_rollups.docs} == {"alpha"}
+
+    # Later usage adds to the same buckets
+    asyncio.run(rollups.record(db, [log("a", 4, at(1, 9, 59))], {"a": "Diapers"}))
+    assert buckets(raw, "hour", "item")[("a", at(1, 9))] == (7, 3)
+    assert buckets(raw, "day", "category")[("Diapers", at(1, 0))] == (10, 4)
+
+
+def test_a_failed_rollup_write_does_not_fail_the_usage():
+    raw = MemoryDatabase(UNIQUE)
+
+    async def fail(requests, **kwargs):
+        raise RuntimeError("not primary")
+
+    raw.usage_rollups.bulk_write = fail
+    asyncio.run(rollups.record(tenancy.scoped(raw, "alpha"), [log("a", 1, at(1, 9))], {}))
+
+
+def test_backfill_replaces_the_buckets_of_the_range_with_the_aggregate():
+    raw = MemoryDatabase(UNIQUE)
+    db = tenancy.scoped(raw, "alpha")
+    asyncio.run(rollups.record(db, [log("a", 9, at(2, 9)), log("a", 1, at(5, 9))], {"a": "Diapers"}))
+    raw.usage_logs.aggregate_results = [
+        {"_id": {"item_id": "a", "category": "Diapers", "bucket": "2026-03-02T00:00:00Z"}, "quantity": 4, "events": 2},
+        {"_id": {"item_id": "b", "category": "Other", "bucket": "2026-03-02T00:00:00Z"}, "quantity": 1, "events": 1},
+    ]
+
+    report = asyncio.run(rollups.backfill(db, at(2, 12), at(3, 0)))
+    assert (report["from"], report["to"], report["logs"]) == (at(2, 0), at(4, 0), 3)
+    # The pipeline runs on this household's logs only
+    assert raw.usage_logs.pipelines[0][0] == {"$match": {"household_id": "alpha"}}
+
+    day = buckets(raw, "day", "category")
+    assert day[("Diapers", at(2, 0))] == (4, 2) and day[("Other", at(2, 0))] == (1, 1)
+    # Outside the rebuilt range nothing changed
+    assert day[("Diapers", at(5, 0))] == (1, 1)
+
+
+def test_query_returns_buckets_in_order():
+    raw = MemoryDatabase(UNIQUE)
+    db = tenancy.scoped(raw, "alpha")
+    asyncio.run(rollups.record(db, [log("a", 1, at(3, 9)), log("b", 2, at(1, 9)), log("a", 3, at(1, 9))],
+                               {"a": "Diapers", "b": "Bath & Care"}))
+    rows = asyncio.run(rollups.query(db, "day", at(1, 0), at(3, 0)))
+    assert [(row["bucket"], row["key"], row["quantity"]) for row in rows] == [
+        (at(1, 0), "Bath & Care", 2), (at(1, 0), "Diapers", 3)]
+    rows = asyncio.run(rollups.query(db, "hour", at(1, 0), at(4, 0), scope="item", key="a"))
+    assert [row["quantity"] for row in rows] == [3, 1]
@@ -0,0 +1,132 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import batch_ops
+import scan_sync
+import tenancy
+from tests.memory_db import MemoryDatabase
+
+UNIQUE = {
+    "inventory": [("household_id", "id")],
+    "scan_events": [("household_id", "idempotency_key")],
+}
+
+
+def make_db(stock: int = 10):
+    raw = MemoryDatabase(UNIQUE)
+    raw.inventory.docs.append({"_id": "a", "id": "a", "barcode": "123", "household_id": "alpha",
+                               "current_stock": stock, "min_stock_alert": 2, "category": "Diapers"})
+    return raw, tenancy.scoped(raw, "alpha")
+
+
+def event(key: str, qty: int = 1, op: str = "use") -> dict:
+    return {"idempotency_key": key, "item_id": "a", "barcode": None, "op": op, "qty": qty, "notes": None,
+            "timestamp": datetime(2026, 1, 1, tzinfo=timezone.utc)}
+
+
+def sync(db, events):
+    return asyncio.run(scan_sync.sync_events(db, events, lambda doc: doc))
+
+
+def stock(raw) -> int:
+    return raw.inventory.docs[0]["current_stock"]
+
+
+def write_concurrently_before_next_bulk_write(collection):
+    """Let another request use one unit between the batch's read and its guarded $inc"""
+    original = collection.bulk_write
+
+    async def bulk_write(requests, **kwargs):
+        collection.bulk_write = original
+        await collection.update_one({"id": "a"}, {"$inc": {"current_stock": -1}})
+        return await original(requests, **kwargs)
+
+    collection.bulk_write = bulk_write
+
+
+def test_events_are_applied_once_and_replays_report_the_first_result():
+    raw, db = make_db()
+    first = sync(db, [event("k1", 2), event("k2", 3)])
+    assert [(r["status"], r["duplicate"]) for r in first["results"]] == [("ok", False), ("ok", False)]
+    assert first["stock_levels"] == {"a": 5}
+    assert {doc["status"] for doc in raw.scan_events.docs} == {scan_sync.APPLIED}
+
+    again = sync(db, [event("k1", 2), event("k2", 3), event("k3", 1)])
+    assert [(r["idempotency_key"], r["status"], r["duplicate"]) for r in again["results"]] == [
+        ("k1", "ok", True), ("k2", "ok", True), ("k3", "ok", False)]
+    assert stock(raw) == 4
+    assert len(raw.usage_logs.docs) == 3
+
+
+def test_a_key_repeated_inside_one_upload_counts_once():
+    raw, db = make_db()
+    result = sync(db, [event("k1", 2), event("k1", 2)])
+    assert len(result["results"]) == 1
+    assert stock(raw) == 8
+
+
+def test_rejections_are_final():
+    raw, db = make_db(stock=1)
+    [result] = sync(db, [event("k1", 5)])["results"]
+    assert result["status"] == batch_ops.INSUFFICIENT_STOCK
+    assert raw.scan_events.docs[0]["status"] == scan_sync.REJECTED
+
+    raw.inventory.docs[0]["current_stock"] = 10
+    [replay] = sync(db, [event("k1", 5)])["results"]
+    assert replay["duplicate"] and replay["status"] == batch_ops.INSUFFICIENT_STOCK
+    assert stock(raw) == 10
+
+
+def test_a_conflict_releases_the_claim_so_the_retry_applies():
+    raw, db = make_db()
+    write_concurrently_before_next_bulk_write(raw.inventory)
+    [result] = sync(db, [event("k1", 2)])["results"]
+    assert result["status"] == batch_ops.CONFLICT and not result["duplicate"]
+    assert raw.scan_events.docs == []
+    assert stock(raw) == 9
+
+    [retry] = sync(db, [event("k1", 2)])["results"]
+    assert retry["status"] == batch_ops.OK and not retry["duplicate"]
+    assert stock(raw) == 7
+    assert raw.scan_events.docs[0]["status"] == scan_sync.APPLIED
+
+
+def test_a_failed_batch_releases_its_claims(monkeypatch):
+    raw, db = make_db()
+
+    async def fail(*args, **kwargs):
+        raise RuntimeError("primary stepped down")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(batch_ops, "apply_operations", fail)
+        with pytest.raises(RuntimeError):
+            sync(db, [event("k1", 2)])
+    assert raw.scan_events.docs == []
+
+    [retry] = sync(db, [event("k1", 2)])["results"]
+    assert retry["status"] == batch_ops.OK and not retry["duplicate"]
+    assert stock(raw) == 8
+
+
+def test_a_stale_pending_claim_is_taken_over():
+    raw, db = make_db()
+    long_ago = datetime.now(timezone.utc) - timedelta(seconds=scan_sync.STALE_CLAIM_SECONDS + 1)
+    raw.scan_events.docs.append({"_id": "old", "household_id": "alpha", "idempotency_key": "k1",
+                                 "status": scan_sync.PENDING, "claim_token": "crashed", "claimed_at": long_ago})
+
+    [result] = sync(db, [event("k1", 2)])["results"]
+    assert result["status"] == batch_ops.OK and not result["duplicate"]
+    assert stock(raw) == 8
+
+
+def test_a_recent_pending_claim_is_left_alone():
+    raw, db = make_db()
+    raw.scan_events.docs.append({"_id": "other", "household_id": "alpha", "idempotency_key": "k1",
+                                 "status": scan_sync.PENDING, "claim_token": "in-flight",
+                                 "claimed_at": datetime.now(timezone.utc)})
+
+    [result] = sync(db, [event("k1", 2)])["results"]
+    assert result["duplicate"] and result["status"] == scan_sync.PENDING
+    assert stock(raw) == 10
@@ -0,0 +1,50 @@
+import json
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+import serialization
+
+
+class Item(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    barcode: str
+    category: str = "Other"
+    min_stock_alert: int = 5
+    brand: Optional[str] = None
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+def test_projection_is_exactly_the_model_fields():
+    assert serialization.projection_for(Item) == {
+        "_id": 0, "id": 1, "barcode": 1, "category": 1, "min_stock_alert": 1, "brand": 1, "updated_at": 1,
+    }
+
+
+def test_static_defaults_fill_missing_fields_only():
+    doc = {"id": "a", "barcode": "123", "category": "Diapers"}
+    assert serialization.with_defaults(Item, doc) == {
+        "id": "a", "barcode": "123", "category": "Diapers", "min_stock_alert": 5, "brand": None,
+    }
+    # default_factory fields are left alone rather than invented per read
+    assert "updated_at" not in serialization.with_defaults(Item, {})
+
+
+def test_documents_match_the_validated_model_output():
+    updated = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    docs = [{"id": "a", "barcode": "123", "updated_at": updated},
+            {"id": "b", "barcode": "456", "brand": "Acme", "min_stock_alert": 2, "updated_at": updated}]
+    assert serialization.documents(Item, docs) == [Item(**doc).model_dump() for doc in docs]
+
+
+def test_fast_response_renders_json_with_headers():
+    updated = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    response = serialization.fast_response(Item, iter([{"id": "a", "barcode": "123", "updated_at": updated}]),
+                                           headers={"X-Next-Cursor": "abc"})
+    assert response.headers["x-next-cursor"] == "abc"
+    assert json.loads(response.body) == [{
+        "id": "a", "barcode": "123", "category": "Other", "min_stock_alert": 5, "brand": None,
+        "updated_at": "2026-01-01T00:00:00+00:00",
+    }]
@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo import UpdateOne
+
+import tenancy
+from tests.memory_db import MemoryDatabase
+
+
+class RecordingCollection:
+    """Stands in for a Motor collection; keeps what bulk_write was given"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.requests = None
+
+    async def bulk_write(self, requests, **kwargs):
+        self.requests = requests
+        return len(requests)
+
+
+def test_update_op_scopes_filter_through_public_constructor():
+    inventory = tenancy.TenantCollection(RecordingCollection("inventory"), "alpha")
+    request = inventory.update_op({"id": "x"}, {"$inc": {"current_stock": 1}}, upsert=True)
+
+    assert isinstance(request, UpdateOne)
+    assert request == UpdateOne({"id": "x", "household_id": "alpha"}, {"$inc": {"current_stock": 1}}, upsert=True)
+
+
+def test_bulk_write_passes_scoped_requests():
+    raw = RecordingCollection("inventory")
+    inventory = tenancy.TenantCollection(raw, "alpha")
+    requests = [inventory.update_op({"id": "x"}, {"$set": {"name": "Wipes"}})]
+
+    assert asyncio.run(inventory.bulk_write(requests)) == 1
+    assert raw.requests == requests
+
+
+def test_bulk_write_rejects_unscoped_and_foreign_requests():
+    inventory = tenancy.TenantCollection(RecordingCollection("inventory"), "alpha")
+    other = tenancy.TenantCollection(RecordingCollection("inventory"), "beta")
+
+    with pytest.raises(TypeError):
+        asyncio.run(inventory.bulk_write([UpdateOne({"id": "x"}, {"$set": {"name": "Wipes"}})]))
+    with pytest.raises(TypeError):
+        asyncio.run(inventory.bulk_write([other.update_op({"id": "x"}, {"$set": {"name": "Wipes"}})]))
+
+
+def test_keyed_collections_prefix_ids():
+    stats = tenancy.scoped({"dashboard_stats": RecordingCollection("dashboard_stats")}, "alpha").dashboard_stats
+    assert stats._filter({"_id": "inventory"}) == {"_id": "alpha:inventory", "household_id": "alpha"}
+
+
+def test_valid_household_id():
+    assert tenancy.valid_household_id("daycare-room_2")
+    assert not tenancy.valid_household_id("alpha:inventory")
+    assert not tenancy.valid_household_id("")
+
+
+def legacy_db() -> MemoryDatabase:
+    db = MemoryDatabase()
+    db.inventory.docs.append({"_id": 1, "id": "a", "barcode": "123"})
+    db.usage_logs.docs.append({"_id": 2, "item_id": "a", "household_id": "beta"})
+    db.dashboard_stats.docs.append({"_id": "inventory", "total_items": 1})
+    return db
+
+
+def test_migrate_once_assigns_legacy_documents_and_marks_itself_done():
+    db = legacy_db()
+    report = asyncio.run(tenancy.migrate_once(db, "default", "worker-1"))
+    assert report["inventory"] == 1 and report["usage_logs"] == 0 and report["dashboard_stats"] == 1
+    assert db.inventory.docs[0]["household_id"] == "default"
+    assert db.usage_logs.docs[0]["household_id"] == "beta"
+    assert [doc["_id"] for doc in db.dashboard_stats.docs] == ["default:inventory"]
+    assert asyncio.run(tenancy.unscoped_collections(db)) == []
+
+    marker = db.migrations.docs[0]
+    assert marker["done"] and "locked_until" not in marker
+    # Later boots don't touch the collections again
+    db.inventory.docs.append({"_id": 3, "id": "b", "barcode": "456"})
+    assert asyncio.run(tenancy.migrate_once(db, "default", "worker-2")) == {}
+    assert asyncio.run(tenancy.unscoped_collections(db)) == ["inventory"]
+
+
+def test_migrate_once_leaves_a_running_migration_alone_until_its_lock_expires():
+    db = legacy_db()
+    now = datetime.now(timezone.utc)
+    db.migrations.docs.append({"_id": tenancy.MIGRATION, "owner": "worker-1", "collections": ["inventory"],
+                               "locked_until": now + timedelta(minutes=5)})
+
+    assert asyncio.run(tenancy.migrate_once(db, "default", "worker-2", now=now)) is None
+    assert "household_id" not in db.inventory.docs[0]
+
+    # worker-1 died after finishing inventory: the next worker resumes after it
+    report = asyncio.run(tenancy.migrate_once(db, "default", "worker-2", now=now + timedelta(minutes=6)))
+    assert "inventory" not in report and report["dashboard_stats"] == 1
+    assert db.migrations.docs[0]["done"]
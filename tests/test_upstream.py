@@ -0,0 +1,134 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from upstream import CircuitBreaker, CircuitOpenError, UpstreamClient, UpstreamLookupError, retry_after_seconds
+
+
+def test_breaker_opens_after_threshold_and_probes_once():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # reset_timeout=0: the next call is the half-open probe, and only one is let through
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+
+
+def test_retry_after_opens_the_breaker_at_once_for_that_long():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=1)
+    breaker.record_failure(retry_after=120)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert 119 <= breaker.snapshot()["retry_in"] <= 120
+
+
+def test_retry_after_header_forms():
+    assert retry_after_seconds("30") == 30.0
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=90), usegmt=True)
+    assert 85 <= retry_after_seconds(later) <= 90
+    assert retry_after_seconds("soon") is None
+    assert retry_after_seconds(None) is None
+
+
+def serve(status: int, headers=None):
+    async def handler(request):
+        return web.json_response({"status": 1}, status=status, headers=headers)
+
+    app = web.Application()
+    app.router.add_get("/product", handler)
+    return TestServer(app)
+
+
+def get_status(status: int, headers=None, breaker=None, calls: int = 1):
+    async def run():
+        client = UpstreamClient("Test", breaker=breaker)
+        async with serve(status, headers) as server:
+            try:
+                results = []
+                for _ in range(calls):
+                    try:
+                        results.append(await client.get_json(str(server.make_url("/product"))))
+                    except UpstreamLookupError as e:
+                        results.append(e)
+                return results
+            finally:
+                await client.close()
+    return asyncio.run(run())
+
+
+def test_answers_close_the_breaker():
+    [(status, data)] = get_status(200)
+    assert (status, data) == (200, {"status": 1})
+    [(status, data)] = get_status(404)
+    assert (status, data) == (404, None)
+
+
+def test_rate_limit_trips_the_breaker_and_later_calls_fail_fast():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=1)
+    first, second = get_status(429, {"Retry-After": "60"}, breaker, calls=2)
+    assert type(first) is UpstreamLookupError
+    assert isinstance(second, CircuitOpenError)
+    assert breaker.open_for == 60
+
+
+@pytest.mark.parametrize("status", [400, 403, 503])
+def test_unexpected_statuses_count_as_failures(status):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    results = get_status(status, breaker=breaker, calls=3)
+    assert [type(r) for r in results] == [UpstreamLookupError, UpstreamLookupError, CircuitOpenError]
+
+
+def test_a_cancelled_probe_lets_the_next_call_probe():
+    async def slow(request):
+        await asyncio.sleep(10)
+        return web.json_response({"status": 1})
+
+    async def fast(request):
+        return web.json_response({"status": 1})
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/product", slow)
+        app.router.add_get("/fast", fast)
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        client = UpstreamClient("Test", breaker=breaker)
+        async with TestServer(app) as server:
+            try:
+                probe = asyncio.ensure_future(client.get_json(str(server.make_url("/product"))))
+                await asyncio.sleep(0.1)
+                assert not breaker.allow()
+                probe.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await probe
+                return await client.get_json(str(server.make_url("/fast"))), breaker.state
+            finally:
+                await client.close()
+
+    assert asyncio.run(run()) == ((200, {"status": 1}), CircuitBreaker.CLOSED)
+
+
+def test_a_probe_failing_unexpectedly_does_not_wedge_the_breaker(monkeypatch):
+    async def run():
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        client = UpstreamClient("Test", breaker=breaker)
+
+        async def broken(url):
+            raise RuntimeError("bug in the response handling")
+
+        monkeypatch.setattr(client, "_get_json", broken)
+        with pytest.raises(RuntimeError):
+            await client.get_json("http://upstream.invalid/product")
+        return breaker.allow()
+
+    assert asyncio.run(run())
@@ -0,0 +1,34 @@
+from starlette.requests import Request
+
+import tenancy
+import versions
+
+
+def make_request(query: str = "", if_none_match: str = None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/api/inventory",
+                    "query_string": query.encode(), "headers": headers})
+
+
+def test_households_at_the_same_version_get_different_etags():
+    first = versions.make_etag("inventory", 3, make_request(), tenancy.household_of(tenancy.scoped(None, "alpha")))
+    second = versions.make_etag("inventory", 3, make_request(), tenancy.household_of(tenancy.scoped(None, "beta")))
+    assert first != second
+
+    # A tag cached for one household must not revalidate against the other
+    assert versions.matches(make_request(if_none_match=first), first)
+    assert not versions.matches(make_request(if_none_match=first), second)
+
+
+def test_etag_includes_query_hash():
+    plain = versions.make_etag("inventory", 1, make_request(), "alpha")
+    paged = versions.make_etag("inventory", 1, make_request("limit=10"), "alpha")
+    assert plain != paged
+    assert plain == '"alpha-inventory-1"'
+
+
+def test_weak_and_wildcard_validators_match():
+    etag = versions.make_etag("children", 7, make_request(), "alpha")
+    assert versions.matches(make_request(if_none_match=f"W/{etag}"), etag)
+    assert versions.matches(make_request(if_none_match='"other", *'), etag)
+    assert not versions.matches(make_request(), etag)
@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+import write_buffer
+from write_buffer import UsageLogBuffer
+
+
+class LogCollection:
+    """insert_many that stores documents, failing the item ids in ``reject``"""
+
+    def __init__(self, reject=(), duplicate=()):
+        self.stored = {}
+        self.calls = 0
+        self.reject = set(reject)
+        self.duplicate = set(duplicate)
+
+    async def insert_many(self, docs, ordered=True):
+        self.calls += 1
+        errors = []
+        for index, doc in enumerate(docs):
+            if doc["item_id"] in self.reject:
+                errors.append({"index": index, "code": 2, "errmsg": "rejected"})
+            elif doc["_id"] in self.stored or doc["item_id"] in self.duplicate:
+                errors.append({"index": index, "code": 11000, "errmsg": "duplicate key"})
+            else:
+                self.stored[doc["_id"]] = doc
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+def log(item_id: str) -> dict:
+    return {"item_id": item_id, "quantity_used": 1}
+
+
+def make_buffer(collection, mode=write_buffer.GROUP, **kwargs):
+    flushed, lost = [], []
+
+    async def after_flush(docs, categories):
+        flushed.append((docs, categories))
+
+    async def on_failure(docs, error):
+        lost.extend(docs)
+
+    buffer = UsageLogBuffer(collection, mode=mode, retries=0, after_flush=after_flush, on_failure=on_failure, **kwargs)
+    return buffer, flushed, lost
+
+
+def test_group_mode_waits_for_its_batch_and_shares_one_insert():
+    async def run():
+        collection = LogCollection()
+        buffer, flushed, _ = make_buffer(collection, max_batch=10, max_delay=0.01)
+        buffer.start()
+        await asyncio.gather(*(buffer.add(log(f"item-{i}"), "Diapers") for i in range(5)))
+        await buffer.close()
+        return collection, buffer, flushed
+
+    collection, buffer, flushed = asyncio.run(run())
+    assert len(collection.stored) == 5
+    assert collection.calls == 1
+    assert buffer.stats()["written"] == 5
+    assert flushed[0][1] == {f"item-{i}": "Diapers" for i in range(5)}
+
+
+def test_flush_splits_into_max_batch_chunks():
+    async def run():
+        collection = LogCollection()
+        buffer, _, _ = make_buffer(collection, mode=write_buffer.ASYNC, max_batch=2)
+        for i in range(5):
+            await buffer.add(log(f"item-{i}"))
+        await buffer.flush()
+        return collection
+
+    collection = asyncio.run(run())
+    assert (len(collection.stored), collection.calls) == (5, 3)
+
+
+def test_duplicates_from_a_retried_insert_count_as_written():
+    async def run():
+        buffer, _, lost = make_buffer(LogCollection(duplicate={"item-0"}), mode=write_buffer.ASYNC)
+        await buffer.add(log("item-0"))
+        await buffer.flush()
+        return buffer, lost
+
+    buffer, lost = asyncio.run(run())
+    assert (buffer.written, buffer.failed, lost) == (1, 0, [])
+
+
+def test_group_mode_failure_is_raised_to_the_request():
+    async def run():
+        buffer, _, lost = make_buffer(LogCollection(reject={"bad"}), max_delay=0.01)
+        buffer.start()
+        results = await asyncio.gather(buffer.add(log("good")), buffer.add(log("bad")), return_exceptions=True)
+        await buffer.close()
+        return results, lost
+
+    (good, bad), lost = asyncio.run(run())
+    assert good is None
+    assert isinstance(bad, RuntimeError)
+    # The request saw the error and undoes its own stock change
+    assert lost == []
+
+
+def test_async_mode_failures_go_to_on_failure():
+    async def run():
+        buffer, flushed, lost = make_buffer(LogCollection(reject={"bad"}), mode=write_buffer.ASYNC)
+        await buffer.add(log("good"))
+        await buffer.add(log("bad"))
+        await buffer.flush()
+        return flushed, lost
+
+    flushed, lost = asyncio.run(run())
+    assert [doc["item_id"] for doc in flushed[0][0]] == ["good"]
+    assert [doc["item_id"] for doc in lost] == ["bad"]
+
+
+def test_cancelled_group_request_whose_log_fails_goes_to_on_failure():
+    async def run():
+        buffer, _, lost = make_buffer(LogCollection(reject={"bad"}))
+        request = asyncio.ensure_future(buffer.add(log("bad")))
+        await asyncio.sleep(0)
+        request.cancel()
+        await asyncio.gather(request, return_exceptions=True)
+        await buffer.flush()
+        return lost
+
+    assert [doc["item_id"] for doc in asyncio.run(run())] == ["bad"]
+
+
+def test_add_after_close_raises():
+    async def run():
+        buffer, _, _ = make_buffer(LogCollection(), mode=write_buffer.ASYNC)
+        buffer.start()
+        await buffer.close()
+        with pytest.raises(RuntimeError):
+            await buffer.add(log("late"))
+        return buffer
+
+    assert asyncio.run(run()).stats()["pending"] == 0
+
+
+def test_sync_mode_is_not_a_buffer_mode():
+    with pytest.raises(ValueError):
+        UsageLogBuffer(LogCollection(), mode=write_buffer.SYNC)